@@ -0,0 +1,3 @@
+"""
+Offline benchmarks for the API. See benchmarks/run.py.
+"""
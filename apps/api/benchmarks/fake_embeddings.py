@@ -0,0 +1,52 @@
+"""
+Deterministic hashing embedder used by the offline benchmarks.
+Mimics the parts of the SentenceTransformer interface the API calls, without downloading a model.
+"""
+import re
+import zlib
+from typing import List, Union
+import numpy as np
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+class HashingEmbedder:
+    """
+    Signed feature-hashing bag-of-words embedder.
+
+    It is not a semantic model, but it is stable across runs and machines, cheap enough
+    that the benchmarks measure the pipeline around the model, and it gives lexically
+    similar texts high cosine similarity so recall@k is meaningful.
+    """
+
+    def __init__(self, dim: int = 768, max_seq_length: int = 2048):
+        self.dim = dim
+        self.max_seq_length = max_seq_length
+
+    def _tokens(self, text: str) -> List[str]:
+        return _TOKEN_RE.findall(text.lower())[:self.max_seq_length]
+
+    def _embed(self, texts: List[str]) -> np.ndarray:
+        out = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in self._tokens(text):
+                h = zlib.crc32(token.encode("utf-8"))
+                out[row, h % self.dim] += 1.0 if (h >> 31) & 1 else -1.0
+        norms = np.linalg.norm(out, axis=1, keepdims=True)
+        return out / np.maximum(norms, 1e-12)
+
+    def encode(self, sentences: Union[str, List[str]], **_) -> np.ndarray:
+        if isinstance(sentences, str):
+            return self._embed([sentences])[0]
+        return self._embed(list(sentences))
+
+    encode_query = encode
+    encode_document = encode
+
+    def tokenize(self, texts: List[str]) -> dict:
+        lengths = [len(self._tokens(text)) for text in texts]
+        width = max(lengths, default=0)
+        mask = np.zeros((len(texts), width), dtype=np.int64)
+        for row, length in enumerate(lengths):
+            mask[row, :length] = 1
+        return {"attention_mask": mask}
@@ -0,0 +1,232 @@
+"""
+Local stand-in for the Slack Web API used by the offline benchmarks.
+Serves a deterministic synthetic workspace (channels, users, paginated history) and
+can inject HTTP 429 rate limit responses so retry/wait behaviour is exercised.
+"""
+import json
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+from urllib.parse import parse_qs, urlparse
+
+# Small topic vocabularies so that synthetic messages have retrievable structure
+TOPICS = {
+    "deploy": ["deploy", "release", "rollback", "pipeline", "staging", "production", "canary", "build"],
+    "incident": ["outage", "pager", "latency", "alert", "postmortem", "incident", "timeout", "errors"],
+    "billing": ["invoice", "billing", "refund", "pricing", "subscription", "payment", "plan", "charge"],
+    "hiring": ["interview", "candidate", "offer", "recruiter", "onsite", "hiring", "resume", "referral"],
+    "design": ["mockup", "figma", "layout", "palette", "typography", "prototype", "wireframe", "icons"],
+    "data": ["warehouse", "dashboard", "etl", "schema", "query", "metrics", "backfill", "partition"],
+}
+FILLER = ["the", "we", "should", "today", "after", "before", "team", "please", "check", "update", "with", "on"]
+
+
+class SlackWorkspace:
+    """
+    Deterministic synthetic Slack workspace.
+
+    Every message has a unique marker word so benchmarks can build queries with a known
+    ground-truth document for recall@k.
+    """
+
+    def __init__(self, channels: int = 5, messages_per_channel: int = 1000, users: int = 50, seed: int = 7):
+        rng = random.Random(seed)
+        topic_names = sorted(TOPICS)
+
+        self.users: List[dict] = [
+            {
+                "id": f"U{i:08d}",
+                "name": f"user{i}",
+                "profile": {"display_name": f"User {i}", "real_name": f"Bench User {i}", "email": f"user{i}@example.com"},
+            }
+            for i in range(users)
+        ]
+        self.users_by_id: Dict[str, dict] = {user["id"]: user for user in self.users}
+
+        self.channels: List[dict] = []
+        self.history: Dict[str, List[dict]] = {}
+        for c in range(channels):
+            channel_id = f"C{c:08d}"
+            self.channels.append({
+                "id": channel_id,
+                "name": f"bench-{c}",
+                "is_private": False,
+                "is_archived": False,
+                "updated": 1_700_000_000_000 + rng.randint(0, 10_000_000),
+            })
+
+            messages = []
+            base_ts = 1_700_000_000.0 + c * 1_000_000
+            for m in range(messages_per_channel):
+                topic = TOPICS[topic_names[rng.randrange(len(topic_names))]]
+                words = rng.sample(topic, 4) + rng.sample(FILLER, 4) + [f"ref{c}x{m}"]
+                rng.shuffle(words)
+                message = {
+                    "type": "message",
+                    "user": self.users[rng.randrange(users)]["id"],
+                    "text": " ".join(words),
+                    "ts": f"{base_ts + m:.6f}",
+                }
+                # Sprinkle in bot messages, which ingestion is expected to skip
+                if m % 50 == 49:
+                    message["bot_id"] = "B00000001"
+                messages.append(message)
+
+            # Slack returns history newest first
+            messages.reverse()
+            self.history[channel_id] = messages
+
+    def ingestible_messages(self) -> List[dict]:
+        """All messages that the ingestion pipeline should store (non-bot, with text)."""
+        return [
+            message
+            for messages in self.history.values()
+            for message in messages
+            if not message.get("bot_id") and message.get("text")
+        ]
+
+
+class _SlackHandler(BaseHTTPRequestHandler):
+    server: "FakeSlackServer"
+
+    def log_message(self, format, *args):
+        # Keep benchmark output clean
+        pass
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        self._dispatch(parsed.path, parse_qs(parsed.query))
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        params = parse_qs(parsed.query)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8") if length else ""
+        if body:
+            if self.headers.get("Content-Type", "").startswith("application/json"):
+                params.update({k: [v] for k, v in json.loads(body).items()})
+            else:
+                params.update(parse_qs(body))
+        self._dispatch(parsed.path, params)
+
+    def _send(self, status: int, payload: dict, headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _dispatch(self, path: str, params: Dict[str, List[str]]) -> None:
+        method = path.rstrip("/").rsplit("/", 1)[-1]
+        args = {k: v[0] for k, v in params.items()}
+
+        if self.server.should_rate_limit():
+            self._send(429, {"ok": False, "error": "ratelimited"}, {"Retry-After": str(self.server.retry_after)})
+            return
+
+        handler = getattr(self, "_api_" + method.replace(".", "_"), None)
+        if handler is None:
+            self._send(200, {"ok": False, "error": "unknown_method"})
+            return
+        self._send(200, handler(args))
+
+    def _paginate(self, items: List[dict], args: Dict[str, str], default_limit: int = 100):
+        limit = int(args.get("limit") or default_limit)
+        offset = int(args.get("cursor") or 0)
+        page = items[offset:offset + limit]
+        next_offset = offset + limit
+        next_cursor = str(next_offset) if next_offset < len(items) else ""
+        return page, next_cursor
+
+    def _api_conversations_history(self, args: Dict[str, str]) -> dict:
+        messages = self.server.workspace.history.get(args.get("channel", ""))
+        if messages is None:
+            return {"ok": False, "error": "channel_not_found"}
+
+        oldest = float(args["oldest"]) if args.get("oldest") else None
+        latest = float(args["latest"]) if args.get("latest") else None
+        if oldest is not None or latest is not None:
+            messages = [
+                m for m in messages
+                if (oldest is None or float(m["ts"]) > oldest) and (latest is None or float(m["ts"]) < latest)
+            ]
+
+        page, next_cursor = self._paginate(messages, args)
+        return {
+            "ok": True,
+            "messages": page,
+            "has_more": bool(next_cursor),
+            "pin_count": 0,
+            "response_metadata": {"next_cursor": next_cursor},
+        }
+
+    def _api_users_info(self, args: Dict[str, str]) -> dict:
+        user = self.server.workspace.users_by_id.get(args.get("user", ""))
+        if user is None:
+            return {"ok": False, "error": "user_not_found"}
+        return {"ok": True, "user": user}
+
+    def _api_users_list(self, args: Dict[str, str]) -> dict:
+        page, next_cursor = self._paginate(self.server.workspace.users, args, default_limit=200)
+        return {"ok": True, "members": page, "response_metadata": {"next_cursor": next_cursor}}
+
+    def _api_conversations_list(self, args: Dict[str, str]) -> dict:
+        page, next_cursor = self._paginate(self.server.workspace.channels, args)
+        return {"ok": True, "channels": page, "response_metadata": {"next_cursor": next_cursor}}
+
+    def _api_users_conversations(self, args: Dict[str, str]) -> dict:
+        return self._api_conversations_list(args)
+
+
+class FakeSlackServer(ThreadingHTTPServer):
+    """
+    Threaded HTTP server serving a SlackWorkspace on 127.0.0.1.
+
+    Usage:
+        with FakeSlackServer(SlackWorkspace()) as server:
+            os.environ["SLACK_API_BASE_URL"] = server.base_url
+    """
+
+    daemon_threads = True
+
+    def __init__(self, workspace: SlackWorkspace, rate_limit_every: int = 0, retry_after: int = 0):
+        """
+        Args:
+            workspace: Synthetic workspace to serve
+            rate_limit_every: Respond with HTTP 429 to every Nth request (0 disables)
+            retry_after: Value of the Retry-After header on rate limited responses, in seconds
+        """
+        super().__init__(("127.0.0.1", 0), _SlackHandler)
+        self.workspace = workspace
+        self.rate_limit_every = rate_limit_every
+        self.retry_after = retry_after
+        self.request_count = 0
+        self.rate_limited_count = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def should_rate_limit(self) -> bool:
+        with self._lock:
+            self.request_count += 1
+            if self.rate_limit_every and self.request_count % self.rate_limit_every == 0:
+                self.rate_limited_count += 1
+                return True
+            return False
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
@@ -0,0 +1,171 @@
+"""
+In-memory stand-in for the Supabase client used by the offline benchmarks.
+Implements just the surface the API touches: table(...).insert(...)/upsert(...).execute() and
+rpc("match_documents", ...).execute(), with brute-force cosine similarity in numpy.
+"""
+import json
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+import httpx
+import numpy as np
+from postgrest.types import ReturnMethod
+
+
+class _Result:
+    def __init__(self, data: Any):
+        self.data = data
+
+
+class _Query:
+    def __init__(self, run, returning=ReturnMethod.representation):
+        self._run = run
+        self._returning = returning
+        # Like postgrest-py, callers may add query parameters such as select= before executing
+        self.params = httpx.QueryParams()
+
+    def execute(self) -> _Result:
+        data = self._run()
+        if self._returning == ReturnMethod.minimal:
+            return _Result([])
+        select = self.params.get("select")
+        if select:
+            columns = select.split(",")
+            data = [{column: row.get(column) for column in columns} for row in data]
+        return _Result(data)
+
+
+class _Table:
+    def __init__(self, client: "InMemorySupabase", name: str):
+        self._client = client
+        self._name = name
+
+    def insert(self, rows, *, returning=ReturnMethod.representation) -> _Query:
+        return _Query(lambda: self._client._insert(self._name, rows), returning)
+
+    def upsert(self, rows, *, returning=ReturnMethod.representation, ignore_duplicates=False, on_conflict="") -> _Query:
+        if on_conflict != "source_owner,source_key":
+            raise ValueError(f"Unsupported upsert in benchmark stand-in: on_conflict={on_conflict!r}")
+        return _Query(lambda: self._client._insert(self._name, rows, upsert=True, ignore_duplicates=ignore_duplicates), returning)
+
+
+class InMemorySupabase:
+    """
+    Minimal Supabase lookalike holding documents in memory.
+
+    Embeddings are stored as a growing float32 matrix so match_documents is a single
+    matrix-vector product, roughly what an exact (non-ANN) pgvector scan does.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._rows: List[dict] = []
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._pending: List[List[float]] = []
+        # (source_owner, source_key) -> row index, the unique index keyed documents are upserted on
+        self._source_keys: Dict[tuple, int] = {}
+
+    def table(self, name: str) -> _Table:
+        return _Table(self, name)
+
+    def rpc(self, fn: str, params: Dict[str, Any]) -> _Query:
+        if fn != "match_documents":
+            raise ValueError(f"Unsupported RPC in benchmark stand-in: {fn}")
+        return _Query(lambda: self._match_documents(**params))
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _insert(self, table: str, rows, upsert: bool = False, ignore_duplicates: bool = False) -> List[dict]:
+        if table != "documents":
+            raise ValueError(f"Unsupported table in benchmark stand-in: {table}")
+        if isinstance(rows, dict):
+            rows = [rows]
+
+        inserted = []
+        with self._lock:
+            now = datetime.now(timezone.utc).isoformat()
+            for row in rows:
+                stored = dict(row)
+                embedding = stored.pop("embedding")
+                key = (stored.get("user_id") or "", stored.get("source_key"))
+                index = self._source_keys.get(key) if upsert and key[1] is not None else None
+                if index is not None:
+                    if ignore_duplicates:
+                        continue
+                    self._rows[index].update(stored)
+                    self._replace_embedding(index, embedding)
+                    inserted.append(self._rows[index])
+                    continue
+
+                stored["id"] = len(self._rows) + 1
+                stored["created_at"] = now
+                if key[1] is not None:
+                    self._source_keys[key] = len(self._rows)
+                self._pending.append(embedding)
+                self._rows.append(stored)
+                inserted.append(stored)
+        return inserted
+
+    def _replace_embedding(self, index: int, embedding: List[float]) -> None:
+        # Called with the lock held
+        flushed = self._matrix.shape[0] if self._matrix.size else 0
+        if index >= flushed:
+            self._pending[index - flushed] = embedding
+            return
+        vector = np.asarray(embedding, dtype=np.float32)
+        self._matrix[index] = vector / max(float(np.linalg.norm(vector)), 1e-12)
+
+    def _flush(self) -> None:
+        # Called with the lock held; stack pending embeddings into the matrix lazily
+        if not self._pending:
+            return
+        pending = np.asarray(self._pending, dtype=np.float32)
+        norms = np.linalg.norm(pending, axis=1, keepdims=True)
+        pending /= np.maximum(norms, 1e-12)
+        self._matrix = pending if self._matrix.size == 0 else np.vstack([self._matrix, pending])
+        self._pending = []
+
+    def _match_documents(
+        self,
+        query_embedding: List[float],
+        match_count: int,
+        match_threshold: float,
+        filter_user_id: Optional[str] = None,
+        include_embedding: bool = False,
+        **_: Any,
+    ) -> List[dict]:
+        with self._lock:
+            self._flush()
+            matrix = self._matrix
+            rows = self._rows
+
+        if matrix.size == 0:
+            return []
+
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query /= max(float(np.linalg.norm(query)), 1e-12)
+        similarities = matrix @ query
+
+        if filter_user_id is not None:
+            mask = np.fromiter((row.get("user_id") == filter_user_id for row in rows), dtype=bool, count=len(rows))
+            similarities = np.where(mask, similarities, -np.inf)
+
+        count = min(match_count, len(rows))
+        top = np.argpartition(-similarities, count - 1)[:count]
+        top = top[np.argsort(-similarities[top])]
+
+        return [
+            {
+                "id": rows[i]["id"],
+                "content": rows[i]["content"],
+                "user_name": rows[i].get("user_name"),
+                "slack_ts": rows[i].get("slack_ts"),
+                "created_at": rows[i]["created_at"],
+                "similarity": float(similarities[i]),
+                # PostgREST sends pgvector columns as text
+                **({"embedding": json.dumps(matrix[i].tolist())} if include_embedding else {}),
+            }
+            for i in top
+            if similarities[i] > match_threshold
+        ]
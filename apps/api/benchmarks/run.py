@@ -0,0 +1,377 @@
+"""
+Offline benchmark for Slack ingestion and semantic retrieval.
+
+Runs the real /extract and /retrieve handlers against a local Slack stand-in
+(benchmarks/fake_slack.py) and an in-memory Supabase stand-in (benchmarks/fake_supabase.py),
+so no network access or credentials are needed.
+
+Each result combines several runs, each in a fresh process: the checked metrics take the best run
+(highest throughput, lowest latency), which interference from the rest of the machine can only make
+worse, and everything else takes the median. One noisy run therefore neither moves the baseline nor
+trips the regression check.
+
+Usage (from apps/api):
+    python -m benchmarks.run
+    python -m benchmarks.run --save-baseline default
+    python -m benchmarks.run --compare default
+"""
+import argparse
+import asyncio
+import inspect
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import time
+import types
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import numpy as np
+from benchmarks.fake_embeddings import HashingEmbedder
+from benchmarks.fake_slack import FakeSlackServer, SlackWorkspace
+from benchmarks.fake_supabase import InMemorySupabase
+import constants
+from document_store import SupabaseDocumentStore
+
+BASELINE_DIR = Path(__file__).parent / "baselines"
+BENCH_USER_ID = "bench-user"
+
+API_DIR = Path(__file__).resolve().parent.parent
+
+# (metric path, True if higher is better, allowed relative change in the bad direction)
+# Tolerances are sized to the spread of the best of 5 runs on one machine (about +-10% for the
+# sub-second ingest and the sub-millisecond latencies); recall and memory are near-deterministic
+REGRESSION_CHECKS = [
+    ("ingest.messages_per_sec", True, 0.25),
+    ("retrieve.p50_ms", False, 0.25),
+    ("retrieve.p95_ms", False, 0.25),
+    ("retrieve.p99_ms", False, 0.3),
+    ("retrieve.recall_at_k", True, 0.01),
+    ("peak_rss_mb", False, 0.1),
+]
+
+# Options that describe the workload, forwarded to every run's process
+WORKLOAD_OPTIONS = [
+    "channels", "messages_per_channel", "users", "page_size", "queries", "k", "rate_limit_every", "seed",
+    "workers", "slack_requests_per_minute",
+]
+WORKLOAD_FLAGS = ["diversify", "workspace_sync", "real_model"]
+
+
+def install_stand_ins(real_model: bool) -> InMemorySupabase:
+    """
+    Register in-memory replacements for the `db` (and optionally `embeddings`) modules.
+    Must run before `main` is imported, since those modules connect/download at import time.
+
+    Args:
+        real_model: Keep the real SentenceTransformer model (requires it to be in the local HF cache)
+
+    Returns:
+        The in-memory Supabase stand-in that documents will be written to
+    """
+    store = InMemorySupabase()
+    db_module = types.ModuleType("db")
+    db_module.supabase = store
+    db_module.document_store = SupabaseDocumentStore(store)
+    sys.modules["db"] = db_module
+
+    if not real_model:
+        embedder = HashingEmbedder()
+        embeddings_module = types.ModuleType("embeddings")
+        embeddings_module.model = embedder
+        embeddings_module.EMBEDDING_MODELS = constants.EMBEDDING_MODELS
+        embeddings_module.get_model = lambda version=None: embedder
+        embeddings_module.count_tokens = lambda texts, version=None: int(embedder.tokenize(texts)["attention_mask"].sum())
+        sys.modules["embeddings"] = embeddings_module
+
+    return store
+
+
+def call_endpoint(loop: asyncio.AbstractEventLoop, handler, request):
+    """Call a FastAPI handler directly, whether it is sync or async."""
+    result = handler(request)
+    if inspect.isawaitable(result):
+        result = loop.run_until_complete(result)
+    return result
+
+
+def build_queries(workspace: SlackWorkspace, count: int, seed: int) -> List[Dict[str, str]]:
+    """
+    Build retrieval queries with a known ground-truth message.
+
+    Each query is the target message's unique marker word plus a few of its other words,
+    so the target should rank near the top while sibling messages on the same topic compete.
+    """
+    rng = random.Random(seed)
+    messages = workspace.ingestible_messages()
+    queries = []
+    for message in rng.sample(messages, min(count, len(messages))):
+        words = message["text"].split()
+        marker = next(word for word in words if word.startswith("ref"))
+        others = [word for word in words if word != marker]
+        queries.append({
+            "prompt": " ".join(rng.sample(others, 3) + [marker]),
+            "expected_content": message["text"],
+        })
+    return queries
+
+
+def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    store = install_stand_ins(args.real_model)
+    workspace = SlackWorkspace(
+        channels=args.channels,
+        messages_per_channel=args.messages_per_channel,
+        users=args.users,
+        seed=args.seed,
+    )
+
+    with FakeSlackServer(workspace, rate_limit_every=args.rate_limit_every, retry_after=0) as slack:
+        os.environ["SLACK_API_BASE_URL"] = slack.base_url
+        constants.SLACK_API_BASE_URL = slack.base_url
+
+        import main
+        from models import ExtractRequest, RetrieveRequest, ServiceType, SlackSyncRequest
+
+        loop = asyncio.new_event_loop()
+
+        # Ingestion: either one /slack/sync call, or page through every channel as a client calling /extract would
+        ingested = 0
+        errors = 0
+        start = time.perf_counter()
+        if args.workspace_sync:
+            constants.SLACK_REQUESTS_PER_MINUTE = args.slack_requests_per_minute
+            response = call_endpoint(loop, main.sync_slack_workspace, SlackSyncRequest(
+                slack_bot_token="xoxb-benchmark",
+                user_id=BENCH_USER_ID,
+                page_size=args.page_size,
+                max_workers=args.workers,
+            ))
+            ingested = response.total_ingested
+            errors = sum(1 for channel in response.channels if channel.error)
+        else:
+            for channel in workspace.channels:
+                cursor: Optional[str] = None
+                while True:
+                    response = call_endpoint(loop, main.extract_data, ExtractRequest(
+                        service=ServiceType.SLACK,
+                        user_id=BENCH_USER_ID,
+                        slack_bot_token="xoxb-benchmark",
+                        conversation_name=channel["id"],
+                        conversation_type="channel",
+                        limit=args.page_size,
+                        cursor=cursor,
+                    ))
+                    ingested += response.get("ingested_count", 0)
+                    errors += 1 if response.get("ingestion_error") else 0
+                    cursor = response.get("response_metadata", {}).get("next_cursor")
+                    if not response.get("has_more") or not cursor:
+                        break
+        ingest_seconds = time.perf_counter() - start
+
+        # Retrieval: warm up, then time each query end to end
+        queries = build_queries(workspace, args.queries, args.seed)
+        content_to_id = {row["content"]: row["id"] for row in store._rows}
+
+        for query in queries[:min(10, len(queries))]:
+            call_endpoint(loop, main.retrieve_documents, RetrieveRequest(
+                prompt=query["prompt"], user_id=BENCH_USER_ID, match_count=args.k, match_threshold=0.0,
+                diversify=args.diversify,
+            ))
+
+        latencies = []
+        hits = 0
+        for query in queries:
+            request = RetrieveRequest(
+                prompt=query["prompt"], user_id=BENCH_USER_ID, match_count=args.k, match_threshold=0.0,
+                diversify=args.diversify,
+            )
+            start = time.perf_counter()
+            result = call_endpoint(loop, main.retrieve_documents, request)
+            latencies.append(time.perf_counter() - start)
+
+            expected_id = content_to_id.get(query["expected_content"])
+            if expected_id is not None and any(match.id == expected_id for match in result.matches):
+                hits += 1
+
+        loop.close()
+        slack_requests = slack.request_count
+        slack_rate_limited = slack.rate_limited_count
+
+    latencies_ms = np.asarray(latencies) * 1000
+    # ru_maxrss is reported in kilobytes on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    peak_rss_mb = peak_rss / (1024 * 1024) if sys.platform == "darwin" else peak_rss / 1024
+
+    return {
+        "config": {
+            "channels": args.channels,
+            "messages_per_channel": args.messages_per_channel,
+            "users": args.users,
+            "page_size": args.page_size,
+            "queries": len(queries),
+            "k": args.k,
+            "rate_limit_every": args.rate_limit_every,
+            "seed": args.seed,
+            "model": "real" if args.real_model else "hashing",
+            "workspace_sync": args.workspace_sync,
+            "diversify": args.diversify,
+        },
+        "ingest": {
+            "messages": ingested,
+            "errors": errors,
+            "seconds": round(ingest_seconds, 4),
+            "messages_per_sec": round(ingested / ingest_seconds, 2) if ingest_seconds > 0 else 0.0,
+        },
+        "retrieve": {
+            "p50_ms": round(float(np.percentile(latencies_ms, 50)), 3),
+            "p95_ms": round(float(np.percentile(latencies_ms, 95)), 3),
+            "p99_ms": round(float(np.percentile(latencies_ms, 99)), 3),
+            "recall_at_k": round(hits / len(queries), 4) if queries else 0.0,
+        },
+        "slack": {
+            "requests": slack_requests,
+            "rate_limited": slack_rate_limited,
+        },
+        "peak_rss_mb": round(peak_rss_mb, 1),
+    }
+
+
+def _lookup(results: Dict[str, Any], path: str) -> float:
+    value: Any = results
+    for key in path.split("."):
+        value = value[key]
+    return float(value)
+
+
+def run_repeated(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Run the benchmark args.runs times, each in a fresh process, and combine them with aggregate_runs.
+
+    Fresh processes keep runs independent: the API modules, the stand-ins and peak RSS are per process.
+
+    Returns:
+        Results shaped like run_benchmark's, plus the run count
+    """
+    command = [sys.executable, "-m", "benchmarks.run", "--runs", "1"]
+    for option in WORKLOAD_OPTIONS:
+        command += [f"--{option.replace('_', '-')}", str(getattr(args, option))]
+    command += [f"--{flag.replace('_', '-')}" for flag in WORKLOAD_FLAGS if getattr(args, flag)]
+
+    runs = []
+    for _ in range(args.runs):
+        completed = subprocess.run(command, cwd=API_DIR, capture_output=True, text=True, check=True)
+        runs.append(json.loads(completed.stdout))
+    return aggregate_runs(runs)
+
+
+def aggregate_runs(runs: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Combine several runs' results into one.
+
+    Metrics in REGRESSION_CHECKS take the best run, since noise only makes a run slower; every
+    other numeric value takes the median.
+
+    Args:
+        runs: Results from run_benchmark, all with the same config
+
+    Returns:
+        The first run's config with the combined measurements, plus "runs": the number of runs
+    """
+    def median(values: List[Any]) -> Any:
+        if isinstance(values[0], dict):
+            return {key: median([value[key] for value in values]) for key in values[0]}
+        if all(isinstance(value, int) for value in values):
+            return int(round(float(np.median(values))))
+        return round(float(np.median(values)), 4)
+
+    aggregated = {key: median([run[key] for run in runs]) for key in runs[0] if key != "config"}
+    for path, higher_is_better, _ in REGRESSION_CHECKS:
+        *parents, leaf = path.split(".")
+        target = aggregated
+        for key in parents:
+            target = target[key]
+        values = [_lookup(run, path) for run in runs]
+        target[leaf] = max(values) if higher_is_better else min(values)
+    return {"config": runs[0]["config"], "runs": len(runs), **aggregated}
+
+
+def compare_to_baseline(
+    results: Dict[str, Any],
+    baseline: Dict[str, Any],
+    tolerance: Optional[float] = None
+) -> List[str]:
+    """
+    Compare results against a saved baseline.
+
+    Args:
+        results: Results from this run
+        baseline: Previously saved results
+        tolerance: Allowed relative change in the bad direction for every metric (0.1 = 10%);
+            defaults to each metric's own tolerance in REGRESSION_CHECKS
+
+    Returns:
+        List of human-readable regression descriptions (empty if none)
+    """
+    regressions = []
+    for path, higher_is_better, metric_tolerance in REGRESSION_CHECKS:
+        if tolerance is not None:
+            metric_tolerance = tolerance
+        current = _lookup(results, path)
+        previous = _lookup(baseline, path)
+        if previous == 0:
+            continue
+        change = (current - previous) / abs(previous)
+        if (higher_is_better and change < -metric_tolerance) or (not higher_is_better and change > metric_tolerance):
+            regressions.append(f"{path}: {previous} -> {current} ({change:+.1%})")
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Offline ingestion and retrieval benchmark")
+    parser.add_argument("--channels", type=int, default=5)
+    parser.add_argument("--messages-per-channel", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--page-size", type=int, default=200, help="limit passed to each /extract call")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=5, help="match_count for retrieval and k for recall@k")
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Respond 429 to every Nth Slack call (0 disables)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--diversify", action="store_true", help="Enable MMR re-ranking on /retrieve")
+    parser.add_argument("--workspace-sync", action="store_true", help="Ingest with one /slack/sync call instead of per-channel /extract calls")
+    parser.add_argument("--workers", type=int, default=4, help="max_workers for --workspace-sync")
+    parser.add_argument("--slack-requests-per-minute", type=float, default=60000, help="Shared history budget for --workspace-sync")
+    parser.add_argument("--real-model", action="store_true", help="Use the real embedding model from the local HF cache")
+    parser.add_argument("--save-baseline", metavar="NAME", help="Save results to benchmarks/baselines/NAME.json")
+    parser.add_argument("--compare", metavar="NAME", help="Compare results with benchmarks/baselines/NAME.json")
+    parser.add_argument("--runs", type=int, default=5, help="Runs (one process each) whose median is reported")
+    parser.add_argument("--tolerance", type=float, default=None, help="Allowed relative regression for every metric (defaults to per-metric tolerances)")
+    args = parser.parse_args()
+
+    results = run_benchmark(args) if args.runs <= 1 else run_repeated(args)
+    print(json.dumps(results, indent=2))
+
+    if args.save_baseline:
+        BASELINE_DIR.mkdir(parents=True, exist_ok=True)
+        path = BASELINE_DIR / f"{args.save_baseline}.json"
+        path.write_text(json.dumps(results, indent=2) + "\n")
+        print(f"Saved baseline to {path}")
+
+    if args.compare:
+        baseline = json.loads((BASELINE_DIR / f"{args.compare}.json").read_text())
+        if baseline.get("config") != results["config"]:
+            print("Warning: baseline was recorded with a different config; comparison may not be meaningful")
+        regressions = compare_to_baseline(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            return 1
+        print("No regressions against baseline")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
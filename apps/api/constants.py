@@ -11,22 +11,123 @@ load_dotenv()
 # Slack API configuration
 # Get this from https://api.slack.com/apps -> Your App -> OAuth & Permissions
 SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
-SLACK_API_BASE_URL = "https://slack.com/api"
+# Override to point clients at a local stand-in (e.g. the benchmark fixture in benchmarks/fake_slack.py)
+SLACK_API_BASE_URL = os.getenv("SLACK_API_BASE_URL", "https://slack.com/api")
 
 # GitHub API configuration
 # Get this from https://github.com/settings/tokens
-GITHUB_TOKEN = ""
-GITHUB_API_BASE_URL = "https://api.github.com"
+GITHUB_TOKEN = os.getenv("GITHUB_TOKEN", "")
+# Override to point the extractor at a local mock server
+GITHUB_API_BASE_URL = os.getenv("GITHUB_API_BASE_URL", "https://api.github.com")
 
 # Google API configuration
 # Get these from https://console.cloud.google.com/apis/credentials
 GOOGLE_CLIENT_ID = ""
 GOOGLE_CLIENT_SECRET = ""
-GOOGLE_API_BASE_URL = "https://www.googleapis.com"
+# OAuth access token with drive.readonly and gmail.readonly scopes
+GOOGLE_ACCESS_TOKEN = os.getenv("GOOGLE_ACCESS_TOKEN", "")
+# Override to point the extractor at a local stub server
+GOOGLE_API_BASE_URL = os.getenv("GOOGLE_API_BASE_URL", "https://www.googleapis.com")
+
+# Metrics configuration
+# Counting embedded tokens needs a second tokenizer pass (encode() does not report token counts), so
+# only this fraction of embedding calls is tokenized and the token counter is scaled up to estimate
+# the total. Set to 1 to count every call or 0 to disable token metrics.
+EMBEDDING_TOKEN_SAMPLE_RATE = float(os.getenv("EMBEDDING_TOKEN_SAMPLE_RATE", "0.05"))
 
 # Supabase configuration
 # Get these from your Supabase project settings: https://app.supabase.com/project/_/settings/api
 SUPABASE_URL = os.getenv("SUPABASE_URL", "")
 SUPABASE_KEY = os.getenv("SUPABASE_KEY", "")
 
+# Data access configuration
+# DB_BACKEND is one of: "supabase" (sync supabase-py client), "postgrest" (pooled async HTTP to PostgREST)
+# or "asyncpg" (pooled direct Postgres connection, requires DATABASE_URL and `pip install asyncpg`)
+DB_BACKEND = os.getenv("DB_BACKEND", "supabase")
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_KEEPALIVE_SECONDS = float(os.getenv("DB_KEEPALIVE_SECONDS", "60"))
+DB_QUERY_TIMEOUT_SECONDS = float(os.getenv("DB_QUERY_TIMEOUT_SECONDS", "10"))
+DB_STATEMENT_CACHE_SIZE = int(os.getenv("DB_STATEMENT_CACHE_SIZE", "100"))
+
+# Local embedding store configuration
+# When set, ingested embeddings are also appended to a memory-mapped store in this directory
+LOCAL_EMBEDDING_STORE_PATH = os.getenv("LOCAL_EMBEDDING_STORE_PATH", "")
+
+# Embedding model versions
+# Each version name maps to a SentenceTransformer model. The documents.embedding column always holds
+# DOCUMENTS_EMBEDDING_VERSION; other versions live in the document_embeddings table
+# (see migrations/001_embedding_versions.sql).
+# Add versions with EXTRA_EMBEDDING_MODELS="minilm-l6=sentence-transformers/all-MiniLM-L6-v2,..."
+DOCUMENTS_EMBEDDING_VERSION = "embeddinggemma-300m"
+EMBEDDING_MODELS = {
+    DOCUMENTS_EMBEDDING_VERSION: "google/embeddinggemma-300m",
+    **{
+        name.strip(): model_name.strip()
+        for name, _, model_name in (
+            entry.partition("=") for entry in os.getenv("EXTRA_EMBEDDING_MODELS", "").split(",") if entry.strip()
+        )
+    },
+}
+# Version /retrieve uses when a request does not specify one; change it to cut over
+DEFAULT_EMBEDDING_VERSION = os.getenv("DEFAULT_EMBEDDING_VERSION", DOCUMENTS_EMBEDDING_VERSION)
+# Version embedded synchronously by ingestion. While it is DOCUMENTS_EMBEDDING_VERSION it is written to
+# documents.embedding; set it to another version after cutting over to retire the documents.embedding
+# write (and the old model) entirely. Requires migrations/002_ingest_embedding_version.sql.
+INGEST_EMBEDDING_VERSION = os.getenv("INGEST_EMBEDDING_VERSION", DOCUMENTS_EMBEDDING_VERSION)
+# Versions embedded for newly ingested documents by background re-embedding jobs, off the ingest path
+DUAL_WRITE_EMBEDDING_VERSIONS = [
+    version.strip() for version in os.getenv("DUAL_WRITE_EMBEDDING_VERSIONS", "").split(",") if version.strip()
+]
+# How often the background dual-write jobs poll for documents ingested by other processes
+DUAL_WRITE_POLL_SECONDS = float(os.getenv("DUAL_WRITE_POLL_SECONDS", "30"))
+# Throughput cap of the dual-write jobs, which also backfill existing documents (unset for no cap)
+DUAL_WRITE_MAX_DOCS_PER_SECOND = float(os.getenv("DUAL_WRITE_MAX_DOCS_PER_SECOND", "0")) or None
+# Longest back-off of a dual-write job retrying after a failed batch (it doubles from 1s up to this)
+DUAL_WRITE_RETRY_MAX_SECONDS = float(os.getenv("DUAL_WRITE_RETRY_MAX_SECONDS", "300"))
+# The dual-write jobs run in one process per host: the first API worker to lock this file starts them.
+# Set DUAL_WRITE_JOBS_ENABLED=false on every host but one when running several hosts.
+DUAL_WRITE_LOCK_PATH = os.getenv("DUAL_WRITE_LOCK_PATH", "/tmp/cerium-dual-write-jobs.lock")
+DUAL_WRITE_JOBS_ENABLED = os.getenv("DUAL_WRITE_JOBS_ENABLED", "true").lower() == "true"
+
+# Fail at startup rather than on the first ingest or retrieval
+_unknown_versions = [
+    version
+    for version in [DEFAULT_EMBEDDING_VERSION, INGEST_EMBEDDING_VERSION, *DUAL_WRITE_EMBEDDING_VERSIONS]
+    if version not in EMBEDDING_MODELS
+]
+if _unknown_versions:
+    raise ValueError(
+        f"Unknown embedding version(s) configured: {', '.join(sorted(set(_unknown_versions)))}. "
+        f"Configured versions: {', '.join(EMBEDDING_MODELS)} (register more with EXTRA_EMBEDDING_MODELS)"
+    )
+
+# Slack workspace sync configuration
+# Shared conversations.history budget per bot token (a Tier 3 method, ~50 requests/min)
+SLACK_REQUESTS_PER_MINUTE = float(os.getenv("SLACK_REQUESTS_PER_MINUTE", "50"))
+SLACK_REQUEST_BURST = int(os.getenv("SLACK_REQUEST_BURST", "10"))
+SLACK_USER_CACHE_TTL_SECONDS = float(os.getenv("SLACK_USER_CACHE_TTL_SECONDS", "3600"))
+SLACK_SYNC_MAX_WORKERS = int(os.getenv("SLACK_SYNC_MAX_WORKERS", "8"))
+# Per-token Slack workspaces (client, rate limit budget, user directory) kept in memory, and how long an
+# unused one is kept before its client (and token) is dropped
+SLACK_WORKSPACE_CACHE_SIZE = int(os.getenv("SLACK_WORKSPACE_CACHE_SIZE", "32"))
+SLACK_WORKSPACE_CACHE_TTL_SECONDS = float(os.getenv("SLACK_WORKSPACE_CACHE_TTL_SECONDS", "3600"))
+
+# Extractor configuration
+# Directory for persisted sync state (watermarks, change tokens, ETag caches)
+EXTRACTOR_STATE_DIR = os.getenv("EXTRACTOR_STATE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".state"))
+# Records per micro-batch when extractor streams are ingested (DocumentIngestion.ingest_stream)
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", "128"))
 
+# Google extractor configuration
+# Drive allows 12,000 queries/min per user and Gmail 250 quota units/sec (messages.get costs 5)
+GOOGLE_REQUESTS_PER_MINUTE = float(os.getenv("GOOGLE_REQUESTS_PER_MINUTE", "600"))
+GOOGLE_REQUEST_BURST = int(os.getenv("GOOGLE_REQUEST_BURST", "20"))
+GOOGLE_DOWNLOAD_WORKERS = int(os.getenv("GOOGLE_DOWNLOAD_WORKERS", "8"))
+GOOGLE_MAX_RETRIES = int(os.getenv("GOOGLE_MAX_RETRIES", "3"))
+# Drive files are read at most this far; the rest is skipped
+GOOGLE_MAX_DOWNLOAD_BYTES = int(os.getenv("GOOGLE_MAX_DOWNLOAD_BYTES", str(10 * 1024 * 1024)))
+# Document bodies are split into chunks of about this many characters before embedding
+GOOGLE_CHUNK_CHARS = int(os.getenv("GOOGLE_CHUNK_CHARS", "2000"))
+# Messages ingested by the first Gmail sync, before a historyId watermark exists
+GOOGLE_GMAIL_INITIAL_QUERY = os.getenv("GOOGLE_GMAIL_INITIAL_QUERY", "newer_than:30d")
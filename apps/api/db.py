@@ -1,14 +1,60 @@
 """
-Supabase client for database access.
-Provides a single instance of the Supabase client that can be used across the codebase.
+Supabase client and document store for database access.
+Provides single instances of the Supabase client and the configured DocumentStore that can be used across the codebase.
 """
 from supabase import create_client, Client
+from supabase.lib.client_options import ClientOptions
 import constants
+from document_store import DocumentStore, SupabaseDocumentStore, PostgrestDocumentStore, AsyncpgDocumentStore
 
 # Create a single client instance at module level
 # Usage: from db import supabase; supabase.table('your_table').select('*').execute()
 supabase: Client = create_client(
     constants.SUPABASE_URL,
-    constants.SUPABASE_KEY
+    constants.SUPABASE_KEY,
+    options=ClientOptions(postgrest_client_timeout=constants.DB_QUERY_TIMEOUT_SECONDS)
 )
 
+
+def create_document_store(backend: str) -> DocumentStore:
+    """
+    Create the document store for the configured backend.
+    
+    Args:
+        backend: "supabase", "postgrest" or "asyncpg"
+        
+    Returns:
+        DocumentStore instance (pooled backends connect lazily on first use)
+        
+    Raises:
+        ValueError: If the backend is unknown or misconfigured
+    """
+    if backend == "supabase":
+        return SupabaseDocumentStore(supabase)
+    
+    if backend == "postgrest":
+        return PostgrestDocumentStore(
+            constants.SUPABASE_URL,
+            constants.SUPABASE_KEY,
+            pool_size=constants.DB_POOL_SIZE,
+            keepalive=constants.DB_KEEPALIVE_SECONDS,
+            query_timeout=constants.DB_QUERY_TIMEOUT_SECONDS,
+        )
+    
+    if backend == "asyncpg":
+        if not constants.DATABASE_URL:
+            raise ValueError("DATABASE_URL is required when DB_BACKEND is 'asyncpg'")
+        return AsyncpgDocumentStore(
+            constants.DATABASE_URL,
+            pool_size=constants.DB_POOL_SIZE,
+            keepalive=constants.DB_KEEPALIVE_SECONDS,
+            query_timeout=constants.DB_QUERY_TIMEOUT_SECONDS,
+            statement_cache_size=constants.DB_STATEMENT_CACHE_SIZE,
+        )
+    
+    raise ValueError(f"Unsupported DB_BACKEND: '{backend}'. Supported backends: supabase, postgrest, asyncpg")
+
+
+# Usage: from db import document_store; document_store.insert('documents', rows)
+# or, from async code: await document_store.arpc('match_documents', params)
+document_store: DocumentStore = create_document_store(constants.DB_BACKEND)
@@ -0,0 +1,572 @@
+"""
+Data access layer for the documents table and its Postgres functions.
+
+Three backends share one interface (insert and delete rows, call a Postgres function):
+- "supabase": the synchronous supabase-py client (default)
+- "postgrest": a pooled, keep-alive httpx.AsyncClient talking to PostgREST directly
+- "asyncpg": a direct asyncpg connection pool (requires DATABASE_URL and the asyncpg package)
+
+The pooled backends run on a dedicated event loop thread, so sync code (ingestion running in
+FastAPI's threadpool) and async endpoints share the same pool instead of serializing on one client.
+"""
+import asyncio
+import json
+import re
+import struct
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional, Sequence
+import httpx
+import numpy as np
+from postgrest.types import ReturnMethod
+
+_IDENTIFIER_RE = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+# Postgres caps bind parameters per statement at 32767
+_MAX_BIND_PARAMS = 30000
+
+
+def _check_identifier(name: str) -> str:
+    """Reject anything that is not a plain SQL identifier, since table/function names are interpolated."""
+    if not _IDENTIFIER_RE.match(name):
+        raise ValueError(f"Invalid SQL identifier: '{name}'")
+    return name
+
+
+def _check_filters(filters: Dict[str, Any]) -> Dict[str, Any]:
+    """Reject empty filters (which would delete every row) and non-identifier column names."""
+    if not filters:
+        raise ValueError("Refusing to delete without filters")
+    for column in filters:
+        _check_identifier(column)
+    return filters
+
+
+def _quote_postgrest(value: Any) -> str:
+    """Double-quote a value for a PostgREST in.(...) list, so commas and parentheses in keys are literal."""
+    escaped = str(value).replace("\\", "\\\\").replace('"', '\\"')
+    return f'"{escaped}"'
+
+
+def encode_vector(value) -> bytes:
+    """
+    Encode a list or array of floats in pgvector's binary format (dim, unused, big-endian float4s).
+
+    Args:
+        value: Embedding as a list of floats or a 1-D numpy array
+
+    Returns:
+        Binary vector value
+    """
+    array = np.asarray(value, dtype=">f4").reshape(-1)
+    return struct.pack(">HH", array.shape[0], 0) + array.tobytes()
+
+
+def parse_vector(value) -> Optional[np.ndarray]:
+    """
+    Parse a vector column returned by any backend: PostgREST sends pgvector values as text, asyncpg as arrays.
+
+    Args:
+        value: Returned column value (text, list, array or None)
+
+    Returns:
+        float32 numpy array, or None if the value is null
+    """
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = json.loads(value)
+    return np.asarray(value, dtype=np.float32)
+
+
+def decode_vector(data: bytes) -> np.ndarray:
+    """
+    Decode a pgvector binary value.
+
+    Args:
+        data: Binary vector value
+
+    Returns:
+        float32 numpy array
+    """
+    dim, _ = struct.unpack_from(">HH", data)
+    return np.frombuffer(data, dtype=">f4", count=dim, offset=4).astype(np.float32)
+
+
+class DocumentStore(ABC):
+    """
+    Abstract base class for document data access.
+    All stores expose both sync and async variants of insert, delete and rpc.
+    """
+
+    @abstractmethod
+    def insert(
+        self,
+        table: str,
+        rows: List[Dict[str, Any]],
+        ignore_duplicates: bool = False,
+        returning: Optional[Sequence[str]] = None,
+        on_conflict: Optional[Sequence[str]] = None
+    ) -> List[dict]:
+        """
+        Insert rows into a table.
+
+        Args:
+            table: Table name, e.g. "documents"
+            rows: List of column -> value dicts
+            ignore_duplicates: Skip rows that conflict with an existing key instead of failing
+            returning: Columns to send back for each inserted row (all columns if None, nothing if empty).
+                Pass only what the caller needs, so embeddings are not sent back over the wire
+            on_conflict: Columns of a unique index to upsert on: a row that conflicts with an existing
+                one updates it in place (or is skipped, with ignore_duplicates) instead of failing
+
+        Returns:
+            List of inserted or updated rows as stored (including generated columns such as id)
+        """
+        pass
+
+    @abstractmethod
+    def delete(self, table: str, filters: Dict[str, Any], returning: Sequence[str] = ()) -> List[dict]:
+        """
+        Delete the rows of a table that match every filter.
+
+        Args:
+            table: Table name, e.g. "documents"
+            filters: Column -> value to match; a list or tuple value matches any of its elements.
+                Must not be empty, so a table is never deleted wholesale by accident
+            returning: Columns to send back for each deleted row (nothing if empty)
+
+        Returns:
+            List of deleted rows, with just the returning columns
+        """
+        pass
+
+    @abstractmethod
+    def rpc(self, fn: str, params: Dict[str, Any]) -> List[dict]:
+        """
+        Call a set-returning Postgres function with named arguments.
+
+        Args:
+            fn: Function name, e.g. "match_documents"
+            params: Named arguments for the function
+
+        Returns:
+            List of result rows
+        """
+        pass
+
+    @abstractmethod
+    async def ainsert(
+        self,
+        table: str,
+        rows: List[Dict[str, Any]],
+        ignore_duplicates: bool = False,
+        returning: Optional[Sequence[str]] = None,
+        on_conflict: Optional[Sequence[str]] = None
+    ) -> List[dict]:
+        """Async variant of insert."""
+        pass
+
+    @abstractmethod
+    async def adelete(self, table: str, filters: Dict[str, Any], returning: Sequence[str] = ()) -> List[dict]:
+        """Async variant of delete."""
+        pass
+
+    @abstractmethod
+    async def arpc(self, fn: str, params: Dict[str, Any]) -> List[dict]:
+        """Async variant of rpc."""
+        pass
+
+    async def aclose(self) -> None:
+        """Release pooled connections. Safe to call more than once."""
+        pass
+
+
+class SupabaseDocumentStore(DocumentStore):
+    """
+    Store backed by the synchronous supabase-py client.
+
+    Sync code should call insert/rpc directly; the async variants run them in a worker thread.
+    """
+
+    def __init__(self, client):
+        self.client = client
+
+    def insert(
+        self,
+        table: str,
+        rows: List[Dict[str, Any]],
+        ignore_duplicates: bool = False,
+        returning: Optional[Sequence[str]] = None,
+        on_conflict: Optional[Sequence[str]] = None
+    ) -> List[dict]:
+        return_method = ReturnMethod.minimal if returning is not None and not returning else ReturnMethod.representation
+        if ignore_duplicates or on_conflict:
+            query = self.client.table(table).upsert(
+                rows,
+                returning=return_method,
+                ignore_duplicates=ignore_duplicates,
+                on_conflict=",".join(on_conflict or ())
+            )
+        else:
+            query = self.client.table(table).insert(rows, returning=return_method)
+        if returning:
+            query.params = query.params.add("select", ",".join(returning))
+        result = query.execute()
+        return result.data or []
+
+    def delete(self, table: str, filters: Dict[str, Any], returning: Sequence[str] = ()) -> List[dict]:
+        query = self.client.table(table).delete(
+            returning=ReturnMethod.representation if returning else ReturnMethod.minimal
+        )
+        for column, value in _check_filters(filters).items():
+            query = query.in_(column, value) if isinstance(value, (list, tuple)) else query.eq(column, value)
+        if returning:
+            query.params = query.params.add("select", ",".join(returning))
+        result = query.execute()
+        return (result.data or []) if returning else []
+
+    def rpc(self, fn: str, params: Dict[str, Any]) -> List[dict]:
+        result = self.client.rpc(fn, params).execute()
+        return result.data or []
+
+    async def ainsert(
+        self,
+        table: str,
+        rows: List[Dict[str, Any]],
+        ignore_duplicates: bool = False,
+        returning: Optional[Sequence[str]] = None,
+        on_conflict: Optional[Sequence[str]] = None
+    ) -> List[dict]:
+        return await asyncio.to_thread(self.insert, table, rows, ignore_duplicates, returning, on_conflict)
+
+    async def adelete(self, table: str, filters: Dict[str, Any], returning: Sequence[str] = ()) -> List[dict]:
+        return await asyncio.to_thread(self.delete, table, filters, returning)
+
+    async def arpc(self, fn: str, params: Dict[str, Any]) -> List[dict]:
+        return await asyncio.to_thread(self.rpc, fn, params)
+
+
+class PooledDocumentStore(DocumentStore):
+    """
+    Base class for stores with an async connection pool.
+
+    The pool lives on its own event loop thread, which is started lazily on first use.
+    Sync callers block on the result; async callers await it without blocking their own loop.
+    """
+
+    def __init__(self, query_timeout: float):
+        self.query_timeout = query_timeout
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def _submit(self, coro):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="document-store", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    @abstractmethod
+    async def _insert(
+        self,
+        table: str,
+        rows: List[Dict[str, Any]],
+        ignore_duplicates: bool,
+        returning: Optional[Sequence[str]],
+        on_conflict: Optional[Sequence[str]]
+    ) -> List[dict]:
+        pass
+
+    @abstractmethod
+    async def _delete(self, table: str, filters: Dict[str, Any], returning: Sequence[str]) -> List[dict]:
+        pass
+
+    @abstractmethod
+    async def _rpc(self, fn: str, params: Dict[str, Any]) -> List[dict]:
+        pass
+
+    @abstractmethod
+    async def _close(self) -> None:
+        pass
+
+    def insert(
+        self,
+        table: str,
+        rows: List[Dict[str, Any]],
+        ignore_duplicates: bool = False,
+        returning: Optional[Sequence[str]] = None,
+        on_conflict: Optional[Sequence[str]] = None
+    ) -> List[dict]:
+        return self._submit(
+            self._insert(_check_identifier(table), rows, ignore_duplicates, returning, on_conflict)
+        ).result()
+
+    def delete(self, table: str, filters: Dict[str, Any], returning: Sequence[str] = ()) -> List[dict]:
+        return self._submit(self._delete(_check_identifier(table), _check_filters(filters), returning)).result()
+
+    def rpc(self, fn: str, params: Dict[str, Any]) -> List[dict]:
+        return self._submit(self._rpc(_check_identifier(fn), params)).result()
+
+    async def ainsert(
+        self,
+        table: str,
+        rows: List[Dict[str, Any]],
+        ignore_duplicates: bool = False,
+        returning: Optional[Sequence[str]] = None,
+        on_conflict: Optional[Sequence[str]] = None
+    ) -> List[dict]:
+        return await asyncio.wrap_future(
+            self._submit(self._insert(_check_identifier(table), rows, ignore_duplicates, returning, on_conflict))
+        )
+
+    async def adelete(self, table: str, filters: Dict[str, Any], returning: Sequence[str] = ()) -> List[dict]:
+        return await asyncio.wrap_future(
+            self._submit(self._delete(_check_identifier(table), _check_filters(filters), returning))
+        )
+
+    async def arpc(self, fn: str, params: Dict[str, Any]) -> List[dict]:
+        return await asyncio.wrap_future(self._submit(self._rpc(_check_identifier(fn), params)))
+
+    async def aclose(self) -> None:
+        if self._loop is None:
+            return
+        await asyncio.wrap_future(self._submit(self._close()))
+
+
+class PostgrestDocumentStore(PooledDocumentStore):
+    """Store that talks to PostgREST over a pooled keep-alive HTTP session."""
+
+    def __init__(
+        self,
+        url: str,
+        key: str,
+        pool_size: int,
+        keepalive: float,
+        query_timeout: float,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        """
+        Args:
+            url: Supabase project URL (PostgREST is served under /rest/v1)
+            key: Supabase API key
+            pool_size: Maximum pooled connections
+            keepalive: Seconds an idle connection is kept open
+            query_timeout: Per-request timeout in seconds
+            transport: Optional httpx transport, e.g. httpx.MockTransport in tests
+        """
+        super().__init__(query_timeout)
+        self.base_url = f"{url.rstrip('/')}/rest/v1"
+        self.key = key
+        self.pool_size = pool_size
+        self.keepalive = keepalive
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+
+    def _get_client(self) -> httpx.AsyncClient:
+        # Created on the pool loop so the connection pool is bound to it
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                headers={
+                    "apikey": self.key,
+                    "Authorization": f"Bearer {self.key}",
+                    "Content-Type": "application/json",
+                },
+                limits=httpx.Limits(
+                    max_connections=self.pool_size,
+                    max_keepalive_connections=self.pool_size,
+                    keepalive_expiry=self.keepalive,
+                ),
+                timeout=httpx.Timeout(self.query_timeout),
+                transport=self.transport,
+            )
+        return self._client
+
+    async def _insert(
+        self,
+        table: str,
+        rows: List[Dict[str, Any]],
+        ignore_duplicates: bool,
+        returning: Optional[Sequence[str]],
+        on_conflict: Optional[Sequence[str]]
+    ) -> List[dict]:
+        minimal = returning is not None and not returning
+        prefer = "return=minimal" if minimal else "return=representation"
+        if ignore_duplicates:
+            prefer += ",resolution=ignore-duplicates"
+        elif on_conflict:
+            prefer += ",resolution=merge-duplicates"
+        params = {}
+        if returning:
+            params["select"] = ",".join(returning)
+        if on_conflict:
+            params["on_conflict"] = ",".join(on_conflict)
+        response = await self._get_client().post(
+            f"/{table}",
+            json=rows,
+            params=params or None,
+            headers={"Prefer": prefer},
+        )
+        response.raise_for_status()
+        return [] if minimal else response.json()
+
+    async def _delete(self, table: str, filters: Dict[str, Any], returning: Sequence[str]) -> List[dict]:
+        params = []
+        for column, value in filters.items():
+            if isinstance(value, (list, tuple)):
+                params.append((column, f"in.({','.join(_quote_postgrest(item) for item in value)})"))
+            else:
+                params.append((column, f"eq.{value}"))
+        if returning:
+            params.append(("select", ",".join(returning)))
+        response = await self._get_client().delete(
+            f"/{table}",
+            params=params,
+            headers={"Prefer": "return=representation" if returning else "return=minimal"},
+        )
+        response.raise_for_status()
+        return response.json() if returning else []
+
+    async def _rpc(self, fn: str, params: Dict[str, Any]) -> List[dict]:
+        response = await self._get_client().post(f"/rpc/{fn}", json=params)
+        response.raise_for_status()
+        return response.json()
+
+    async def _close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class AsyncpgDocumentStore(PooledDocumentStore):
+    """
+    Store that connects to Postgres directly with an asyncpg pool.
+
+    asyncpg prepares each distinct statement once per connection and caches it, so the
+    match_documents call is planned once per connection rather than once per query.
+    A binary codec is registered for pgvector's vector type on every connection, so embeddings
+    (lists or numpy arrays) are bound and returned natively instead of as JSON text.
+    """
+
+    def __init__(self, dsn: str, pool_size: int, keepalive: float, query_timeout: float, statement_cache_size: int):
+        super().__init__(query_timeout)
+        self.dsn = dsn
+        self.pool_size = pool_size
+        self.keepalive = keepalive
+        self.statement_cache_size = statement_cache_size
+        self._pool = None
+
+    async def _get_pool(self):
+        if self._pool is None:
+            import asyncpg
+            self._pool = await asyncpg.create_pool(
+                self.dsn,
+                min_size=1,
+                max_size=self.pool_size,
+                max_inactive_connection_lifetime=self.keepalive,
+                statement_cache_size=self.statement_cache_size,
+                command_timeout=self.query_timeout,
+                init=self._init_connection,
+            )
+        return self._pool
+
+    @staticmethod
+    async def _init_connection(connection) -> None:
+        # pgvector may live in any schema (Supabase installs it in "extensions")
+        schema = await connection.fetchval(
+            "SELECT typnamespace::regnamespace::text FROM pg_type WHERE typname = 'vector'"
+        )
+        if schema is not None:
+            await connection.set_type_codec(
+                "vector", schema=schema, encoder=encode_vector, decoder=decode_vector, format="binary"
+            )
+
+    async def _insert(
+        self,
+        table: str,
+        rows: List[Dict[str, Any]],
+        ignore_duplicates: bool,
+        returning: Optional[Sequence[str]],
+        on_conflict: Optional[Sequence[str]]
+    ) -> List[dict]:
+        if not rows:
+            return []
+
+        columns = list(dict.fromkeys(key for row in rows for key in row))
+        for column in columns:
+            _check_identifier(column)
+        if on_conflict:
+            target = ", ".join(_check_identifier(column) for column in on_conflict)
+            updates = ", ".join(f"{column} = EXCLUDED.{column}" for column in columns if column not in on_conflict)
+            if ignore_duplicates or not updates:
+                conflict_sql = f" ON CONFLICT ({target}) DO NOTHING"
+            else:
+                conflict_sql = f" ON CONFLICT ({target}) DO UPDATE SET {updates}"
+        elif ignore_duplicates:
+            conflict_sql = " ON CONFLICT DO NOTHING"
+        else:
+            conflict_sql = ""
+        if returning is None:
+            returning_sql = " RETURNING *"
+        elif returning:
+            returning_sql = f" RETURNING {', '.join(_check_identifier(column) for column in returning)}"
+        else:
+            returning_sql = ""
+
+        pool = await self._get_pool()
+        inserted = []
+        rows_per_statement = max(1, _MAX_BIND_PARAMS // len(columns))
+        for start in range(0, len(rows), rows_per_statement):
+            chunk = rows[start:start + rows_per_statement]
+            args = []
+            values = []
+            for row in chunk:
+                placeholders = []
+                for column in columns:
+                    args.append(row.get(column))
+                    placeholders.append(f"${len(args)}")
+                values.append(f"({', '.join(placeholders)})")
+
+            sql = f"INSERT INTO {table} ({', '.join(columns)}) VALUES {', '.join(values)}{conflict_sql}{returning_sql}"
+            records = await pool.fetch(sql, *args, timeout=self.query_timeout)
+            inserted.extend(dict(record) for record in records)
+
+        return inserted
+
+    async def _delete(self, table: str, filters: Dict[str, Any], returning: Sequence[str]) -> List[dict]:
+        conditions = []
+        args = []
+        for column, value in filters.items():
+            if isinstance(value, (list, tuple)):
+                args.append(list(value))
+                conditions.append(f"{column} = ANY(${len(args)})")
+            else:
+                args.append(value)
+                conditions.append(f"{column} = ${len(args)}")
+
+        sql = f"DELETE FROM {table} WHERE {' AND '.join(conditions)}"
+        pool = await self._get_pool()
+        if not returning:
+            await pool.execute(sql, *args, timeout=self.query_timeout)
+            return []
+        sql += f" RETURNING {', '.join(_check_identifier(column) for column in returning)}"
+        records = await pool.fetch(sql, *args, timeout=self.query_timeout)
+        return [dict(record) for record in records]
+
+    async def _rpc(self, fn: str, params: Dict[str, Any]) -> List[dict]:
+        arguments = []
+        args = []
+        for name, value in params.items():
+            args.append(value)
+            arguments.append(f"{_check_identifier(name)} => ${len(args)}")
+
+        sql = f"SELECT * FROM {fn}({', '.join(arguments)})"
+        pool = await self._get_pool()
+        records = await pool.fetch(sql, *args, timeout=self.query_timeout)
+        return [dict(record) for record in records]
+
+    async def _close(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
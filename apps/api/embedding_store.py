@@ -0,0 +1,329 @@
+"""
+Local columnar embedding store backed by memory-mapped files.
+
+Each embedding version gets its own store directory under LOCAL_EMBEDDING_STORE_PATH.
+Layout of a store directory:
+    manifest.json    {"dim": 768, "dtype": "float32"}
+    embeddings.f32   row-major float32 matrix, one row per document
+    meta.bin         fixed-width records (id, slack_ts, user_id), one per row
+    deleted.i64      ids of deleted documents, one int64 per delete
+
+Rows are append-only. Appends take an exclusive file lock, write the embedding rows first and the
+metadata rows last, so readers treat the metadata row count as the committed length. An append that
+died part way is rolled back by the next one, which truncates both files to the last complete row.
+Reads are zero-copy numpy memmaps, so several processes can share the same page cache.
+
+A document updated in place (an upsert) is appended again under the same id, and a deleted
+document's id is appended to deleted.i64. Only the latest row of an id that was not deleted is
+live: lookup() and iter_batches() return live rows only, and live_mask() marks them for callers of
+the raw embeddings()/metadata() views.
+"""
+import fcntl
+import json
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+import numpy as np
+import constants
+
+META_DTYPE = np.dtype([("id", "<i8"), ("slack_ts", "<f8"), ("user_id", "S64")])
+EMBEDDING_DTYPE = np.dtype("<f4")
+DELETED_DTYPE = np.dtype("<i8")
+
+
+class EmbeddingStore:
+    """
+    Append-only memory-mapped store of document embeddings and their metadata.
+    """
+
+    def __init__(self, path: str):
+        """
+        Args:
+            path: Directory holding the store (created if missing)
+        """
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._manifest_path = os.path.join(path, "manifest.json")
+        self._embeddings_path = os.path.join(path, "embeddings.f32")
+        self._meta_path = os.path.join(path, "meta.bin")
+        self._deleted_path = os.path.join(path, "deleted.i64")
+        self._lock_path = os.path.join(path, ".lock")
+        self.dim: Optional[int] = self._read_dim()
+        # Ids sorted (stably, so duplicates stay in append order) with their row numbers, covering
+        # the first _indexed_rows rows; extended as rows are appended rather than rebuilt per lookup
+        self._index_lock = threading.Lock()
+        self._indexed_rows = 0
+        self._sorted_ids = np.empty(0, dtype=np.int64)
+        self._sorted_rows = np.empty(0, dtype=np.int64)
+        self._deleted_count = 0
+        self._deleted_ids = np.empty(0, dtype=np.int64)
+
+    def _read_dim(self) -> Optional[int]:
+        if not os.path.exists(self._manifest_path):
+            return None
+        with open(self._manifest_path) as f:
+            return int(json.load(f)["dim"])
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        with open(self._lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def __len__(self) -> int:
+        if not os.path.exists(self._meta_path):
+            return 0
+        return os.path.getsize(self._meta_path) // META_DTYPE.itemsize
+
+    def _committed(self) -> int:
+        """Committed row count, loading the dimension if the first append happened after this store was opened."""
+        count = len(self)
+        if count and self.dim is None:
+            # The manifest is written before any row, so it exists once there are rows
+            self.dim = self._read_dim()
+        return count
+
+    def append(
+        self,
+        ids: Sequence[int],
+        embeddings: np.ndarray,
+        user_ids: Optional[Sequence[Optional[str]]] = None,
+        slack_timestamps: Optional[Sequence[Optional[float]]] = None,
+    ) -> None:
+        """
+        Append embeddings and their metadata. Appending an id that is already stored supersedes its
+        earlier row (e.g. a document re-ingested with new content).
+
+        Args:
+            ids: Document ids (one per row)
+            embeddings: Array of shape [len(ids), dim]
+            user_ids: Optional owner user ids (one per row, at most 64 bytes each)
+            slack_timestamps: Optional Slack timestamps (one per row, None stored as NaN)
+
+        Raises:
+            ValueError: If shapes or dimensions do not match the store
+        """
+        matrix = np.ascontiguousarray(embeddings, dtype=EMBEDDING_DTYPE)
+        if matrix.ndim != 2 or matrix.shape[0] != len(ids):
+            raise ValueError(f"Expected embeddings of shape [{len(ids)}, dim], got {matrix.shape}")
+        if len(ids) == 0:
+            return
+
+        meta = np.zeros(len(ids), dtype=META_DTYPE)
+        meta["id"] = ids
+        meta["slack_ts"] = [
+            ts if ts is not None else np.nan
+            for ts in (slack_timestamps or [None] * len(ids))
+        ]
+        encoded_user_ids = [(user_id or "").encode("utf-8") for user_id in (user_ids or [None] * len(ids))]
+        if any(len(user_id) > META_DTYPE["user_id"].itemsize for user_id in encoded_user_ids):
+            raise ValueError("user_id values must be at most 64 bytes to be stored locally")
+        meta["user_id"] = encoded_user_ids
+
+        with self._locked():
+            self.dim = self._read_dim()
+            if self.dim is None:
+                with open(self._manifest_path, "w") as f:
+                    json.dump({"dim": int(matrix.shape[1]), "dtype": "float32"}, f)
+                self.dim = int(matrix.shape[1])
+            elif matrix.shape[1] != self.dim:
+                raise ValueError(f"Store has dimension {self.dim}, got embeddings of dimension {matrix.shape[1]}")
+
+            # Roll back an append that died part way: drop embedding rows without metadata and any
+            # partially written metadata record, so both files end on the same complete row
+            row_bytes = self.dim * EMBEDDING_DTYPE.itemsize
+            embedding_rows = os.path.getsize(self._embeddings_path) // row_bytes if os.path.exists(self._embeddings_path) else 0
+            committed = min(len(self), embedding_rows)
+            with open(self._embeddings_path, "ab") as f:
+                f.truncate(committed * row_bytes)
+                f.write(matrix.tobytes())
+            with open(self._meta_path, "ab") as f:
+                f.truncate(committed * META_DTYPE.itemsize)
+                f.write(meta.tobytes())
+
+    def delete(self, ids: Sequence[int]) -> None:
+        """
+        Record that documents were deleted, so their rows are no longer live.
+
+        Args:
+            ids: Deleted document ids; ids that are not stored are ignored
+        """
+        if len(ids) == 0:
+            return
+        data = np.asarray(ids, dtype=DELETED_DTYPE).tobytes()
+        with self._locked():
+            # Drop a partially written id left by a delete that died part way
+            size = os.path.getsize(self._deleted_path) if os.path.exists(self._deleted_path) else 0
+            with open(self._deleted_path, "ab") as f:
+                f.truncate(size - size % DELETED_DTYPE.itemsize)
+                f.write(data)
+
+    def embeddings(self) -> np.ndarray:
+        """
+        Zero-copy, read-only view of all committed embeddings, including superseded and deleted rows
+        (see live_mask).
+
+        Returns:
+            Array of shape [len(self), dim] (an empty array if the store is empty)
+        """
+        count = self._committed()
+        if count == 0 or self.dim is None:
+            return np.empty((0, self.dim or 0), dtype=EMBEDDING_DTYPE)
+        return np.memmap(self._embeddings_path, dtype=EMBEDDING_DTYPE, mode="r", shape=(count, self.dim))
+
+    def metadata(self) -> np.ndarray:
+        """
+        Zero-copy, read-only view of all committed metadata rows, including superseded and deleted
+        rows (see live_mask).
+
+        Returns:
+            Structured array with fields id, slack_ts and user_id
+        """
+        count = len(self)
+        if count == 0:
+            return np.empty(0, dtype=META_DTYPE)
+        return np.memmap(self._meta_path, dtype=META_DTYPE, mode="r", shape=(count,))
+
+    def _index(self, count: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Sorted ids and their row numbers for the first count rows.
+
+        Rows appended since the last call are merged into the cached index: the stable sort of two
+        sorted runs is linear, and lookups between appends cost only a binary search.
+        """
+        with self._index_lock:
+            if count < self._indexed_rows:
+                self._indexed_rows = 0
+                self._sorted_ids = np.empty(0, dtype=np.int64)
+                self._sorted_rows = np.empty(0, dtype=np.int64)
+            if count > self._indexed_rows:
+                new_ids = np.asarray(self.metadata()["id"][self._indexed_rows:count], dtype=np.int64)
+                new_order = np.argsort(new_ids, kind="stable")
+                ids = np.concatenate([self._sorted_ids, new_ids[new_order]])
+                rows = np.concatenate([self._sorted_rows, np.arange(self._indexed_rows, count, dtype=np.int64)[new_order]])
+                order = np.argsort(ids, kind="stable")
+                self._sorted_ids, self._sorted_rows = ids[order], rows[order]
+                self._indexed_rows = count
+            return self._sorted_ids, self._sorted_rows
+
+    def _deleted(self) -> np.ndarray:
+        """Sorted ids of deleted documents, re-read only when more have been recorded."""
+        size = os.path.getsize(self._deleted_path) if os.path.exists(self._deleted_path) else 0
+        count = size // DELETED_DTYPE.itemsize
+        with self._index_lock:
+            if count != self._deleted_count:
+                deleted = np.fromfile(self._deleted_path, dtype=DELETED_DTYPE, count=count) if count else np.empty(0)
+                self._deleted_ids = np.unique(deleted.astype(np.int64))
+                self._deleted_count = count
+            return self._deleted_ids
+
+    def live_mask(self) -> np.ndarray:
+        """
+        Which committed rows are live: the latest row of each id, unless the document was deleted.
+
+        Returns:
+            Boolean array of shape [len(self)]
+        """
+        count = self._committed()
+        sorted_ids, sorted_rows = self._index(count)
+        live = np.zeros(count, dtype=bool)
+        if count == 0:
+            return live
+        # Duplicates are in append order, so the last row of each run of equal ids is the latest
+        latest = np.append(sorted_ids[1:] != sorted_ids[:-1], True)
+        live[sorted_rows[latest]] = True
+        deleted = self._deleted()
+        if len(deleted):
+            live &= ~np.isin(np.asarray(self.metadata()["id"][:count]), deleted)
+        return live
+
+    def iter_batches(self, batch_size: int = 65536) -> Iterator[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Iterate over the live rows in fixed-size slices of the store, e.g. for re-indexing or bulk export.
+
+        Args:
+            batch_size: Rows of the store per slice (a slice yields fewer if some rows are not live)
+
+        Yields:
+            Tuples of (metadata, embeddings) for the live rows of each slice: zero-copy views when
+            every row in the slice is live, copies otherwise
+        """
+        live = self.live_mask()
+        meta = self.metadata()[:len(live)]
+        embeddings = self.embeddings()[:len(live)]
+        for start in range(0, len(live), batch_size):
+            mask = live[start:start + batch_size]
+            if mask.all():
+                yield meta[start:start + batch_size], embeddings[start:start + batch_size]
+            elif mask.any():
+                yield meta[start:start + batch_size][mask], embeddings[start:start + batch_size][mask]
+
+    def lookup(self, ids: List[int]) -> np.ndarray:
+        """
+        Fetch embeddings for specific document ids.
+
+        Args:
+            ids: Document ids to look up
+
+        Returns:
+            Array of shape [len(ids), dim]; rows for unknown or deleted ids are NaN. An id appended
+            more than once (a re-ingested document) resolves to its latest row
+        """
+        embeddings = self.embeddings()
+        out = np.full((len(ids), self.dim or 0), np.nan, dtype=EMBEDDING_DTYPE)
+        sorted_ids, sorted_rows = self._index(len(embeddings))
+        if len(sorted_ids) == 0 or len(ids) == 0:
+            return out
+
+        wanted = np.asarray(ids, dtype=np.int64)
+        positions = np.clip(np.searchsorted(sorted_ids, wanted, side="right") - 1, 0, len(sorted_ids) - 1)
+        found = sorted_ids[positions] == wanted
+        deleted = self._deleted()
+        if len(deleted):
+            found &= ~np.isin(wanted, deleted)
+        out[found] = embeddings[sorted_rows[positions[found]]]
+        return out
+
+
+# One store per embedding version, each in its own subdirectory of LOCAL_EMBEDDING_STORE_PATH
+_stores: Dict[str, EmbeddingStore] = {}
+_stores_lock = threading.Lock()
+
+
+def get_embedding_store(version: str) -> Optional[EmbeddingStore]:
+    """
+    Get the local store for an embedding version, if a local store path is configured.
+
+    Usage: from embedding_store import get_embedding_store; store = get_embedding_store("embeddinggemma-300m")
+
+    Args:
+        version: Embedding version name
+
+    Returns:
+        EmbeddingStore for the version, or None if LOCAL_EMBEDDING_STORE_PATH is not set
+    """
+    if not constants.LOCAL_EMBEDDING_STORE_PATH:
+        return None
+    with _stores_lock:
+        if version not in _stores:
+            _stores[version] = EmbeddingStore(os.path.join(constants.LOCAL_EMBEDDING_STORE_PATH, version))
+        return _stores[version]
+
+
+def get_existing_embedding_stores() -> List[EmbeddingStore]:
+    """
+    Get the local stores of every registered version that already has a store directory.
+
+    Returns:
+        Stores to keep in sync when documents are deleted (empty if LOCAL_EMBEDDING_STORE_PATH is not set)
+    """
+    if not constants.LOCAL_EMBEDDING_STORE_PATH:
+        return []
+    return [
+        get_embedding_store(version) for version in constants.EMBEDDING_MODELS
+        if os.path.isdir(os.path.join(constants.LOCAL_EMBEDDING_STORE_PATH, version))
+    ]
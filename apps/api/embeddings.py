@@ -1,11 +1,61 @@
 """
-Embedding model for generating vector embeddings.
-Provides a single instance of the SentenceTransformer model that can be used across the codebase.
+Embedding models for generating vector embeddings.
+Provides a single instance of the SentenceTransformer model per embedding version that can be used across the codebase.
 """
+import threading
+from typing import Dict, List, Optional
 from sentence_transformers import SentenceTransformer
+import constants
 
-# Create a single model instance at module level
+# Version name -> Hugging Face model name
+EMBEDDING_MODELS: Dict[str, str] = constants.EMBEDDING_MODELS
+
+# Create a single model instance at module level for the version embedded at ingest
+# (documents.embedding unless INGEST_EMBEDDING_VERSION has been cut over)
 # This model will be downloaded from Hugging Face Hub on first import
 # Usage: from embeddings import model; embeddings = model.encode_query("your text")
-model: SentenceTransformer = SentenceTransformer("google/embeddinggemma-300m")
+model: SentenceTransformer = SentenceTransformer(EMBEDDING_MODELS[constants.INGEST_EMBEDDING_VERSION])
+
+# Other versions are loaded on first use
+_models: Dict[str, SentenceTransformer] = {constants.INGEST_EMBEDDING_VERSION: model}
+_models_lock = threading.Lock()
+
+
+def get_model(version: Optional[str] = None) -> SentenceTransformer:
+    """
+    Get the model for an embedding version, loading it on first use.
+    
+    Args:
+        version: Embedding version name (defaults to the ingest version)
+        
+    Returns:
+        SentenceTransformer instance for the version
+        
+    Raises:
+        ValueError: If the version is not configured
+    """
+    version = version or constants.INGEST_EMBEDDING_VERSION
+    if version not in EMBEDDING_MODELS:
+        raise ValueError(
+            f"Unknown embedding version: '{version}'. Configured versions: {', '.join(EMBEDDING_MODELS)}"
+        )
+    
+    with _models_lock:
+        if version not in _models:
+            _models[version] = SentenceTransformer(EMBEDDING_MODELS[version])
+        return _models[version]
+
 
+def count_tokens(texts: List[str], version: Optional[str] = None) -> int:
+    """
+    Count the non-padding tokens the model will see for the given texts.
+    
+    Args:
+        texts: List of strings to tokenize
+        version: Embedding version whose tokenizer to use (defaults to the ingest version)
+        
+    Returns:
+        Total number of tokens across all texts (after truncation to the model's max length)
+    """
+    features = get_model(version).tokenize(texts)
+    return int(features["attention_mask"].sum())
@@ -0,0 +1,91 @@
+"""
+One-off export of stored embeddings into the local embedding store.
+
+The local store only mirrors documents ingested while LOCAL_EMBEDDING_STORE_PATH is set, so documents
+stored before it was configured (including every documents.embedding vector, which no re-embedding job
+writes) are missing from it. This export pages through a version's stored vectors in id order (keyset
+pagination via the document_embeddings_after function, migrations/005_document_embeddings_after.sql)
+and appends the ones the local store does not have yet, so it can be interrupted and re-run safely,
+also while the API is ingesting.
+
+Usage: LOCAL_EMBEDDING_STORE_PATH=/var/lib/cerium/embeddings python -m export_local_store embeddinggemma-300m
+"""
+import argparse
+import logging
+import sys
+import numpy as np
+import constants
+from document_store import DocumentStore, parse_vector
+from embedding_store import get_embedding_store
+from metrics import stage
+
+logger = logging.getLogger(__name__)
+
+
+def export_embeddings(version: str, store: DocumentStore, batch_size: int = 1000) -> int:
+    """
+    Append a version's stored embeddings that are missing from its local store.
+
+    Args:
+        version: Embedding version to export
+        store: Document store to read the embeddings from
+        batch_size: Documents fetched per call
+
+    Returns:
+        Number of documents appended to the local store
+
+    Raises:
+        ValueError: If the version is unknown or LOCAL_EMBEDDING_STORE_PATH is not set
+    """
+    if version not in constants.EMBEDDING_MODELS:
+        raise ValueError(f"Unknown embedding version: '{version}'")
+    local_store = get_embedding_store(version)
+    if local_store is None:
+        raise ValueError("LOCAL_EMBEDDING_STORE_PATH must be set to export embeddings")
+
+    exported = 0
+    after_id = 0
+    while True:
+        with stage("export.fetch"):
+            rows = store.rpc("document_embeddings_after", {
+                "embedding_version": version,
+                "in_documents": version == constants.DOCUMENTS_EMBEDDING_VERSION,
+                "after_id": after_id,
+                "batch_size": batch_size,
+            })
+        if not rows:
+            return exported
+        after_id = rows[-1]["id"]
+
+        # Documents ingested since the store was configured (or exported by an earlier run) are already there
+        known = ~np.isnan(local_store.lookup([row["id"] for row in rows])).all(axis=1)
+        missing = [row for row, present in zip(rows, known) if not present]
+        if not missing:
+            continue
+
+        with stage("export.local_store"):
+            local_store.append(
+                [row["id"] for row in missing],
+                np.stack([parse_vector(row["embedding"]) for row in missing]),
+                user_ids=[row.get("user_id") for row in missing],
+                slack_timestamps=[row.get("slack_ts") for row in missing]
+            )
+        exported += len(missing)
+        logger.info("Exported %d %s embeddings (up to id %d)", exported, version, after_id)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Backfill the local embedding store from the database")
+    parser.add_argument("version", help="Embedding version to export, e.g. embeddinggemma-300m")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    from db import document_store
+    exported = export_embeddings(args.version, document_store, batch_size=args.batch_size)
+    print(f"Exported {exported} {args.version} embeddings to {constants.LOCAL_EMBEDDING_STORE_PATH}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
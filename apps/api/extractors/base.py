@@ -1,27 +1,48 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any
+from typing import Dict, Any, Iterator
 from models import ExtractRequest
+from records import DocumentRecord
 
 
 class BaseExtractor(ABC):
     """
     Abstract base class for all service extractors.
     All extractors must implement the extract method.
+
+    Extraction is streamed: extract() yields records as pages are fetched, the ingestion pipeline
+    consumes them in micro-batches, and summary()/commit() are called once the stream is exhausted.
     """
-    
+
     @abstractmethod
-    def extract(self, request: ExtractRequest) -> Dict[str, Any]:
+    def extract(self, request: ExtractRequest) -> Iterator[DocumentRecord]:
         """
-        Extract data from the service based on the request.
-        
+        Stream documents from the service based on the request.
+
         Args:
             request: ExtractRequest containing service-specific parameters
-            
-        Returns:
-            Dictionary containing the extracted data in service-specific format
-            
+
+        Yields:
+            DocumentRecord per document to ingest
+
         Raises:
             HTTPException: If extraction fails
         """
         pass
 
+    def summary(self) -> Dict[str, Any]:
+        """
+        Describe the last extract() call (pagination cursors, watermarks, counts).
+
+        Returns:
+            Service-specific response fields, valid once the extract() stream is exhausted
+        """
+        return {"ok": True}
+
+    def commit(self) -> None:
+        """
+        Persist sync state (watermarks, cursors) from the last extract() call.
+
+        Called once the extracted documents have been ingested, so a failed ingestion is retried
+        by the next sync. Extractors without incremental state do not need to override this.
+        """
+        pass
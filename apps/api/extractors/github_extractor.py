@@ -1,22 +1,259 @@
+from typing import Any, Dict, Iterator, List, Optional
+import httpx
+from fastapi import HTTPException
+import constants
 from extractors.base import BaseExtractor
+from extractors.state import load_state, save_state
+from metrics import stage, record_cache, BATCH_SIZE
 from models import ExtractRequest
+from records import DocumentRecord
+
+# List endpoints synced per repository, as (document kind, path template, extra query parameters)
+# The issues endpoint also returns pull requests
+RESOURCES = [
+    ("issue", "/repos/{repository}/issues", {"state": "all"}),
+    ("comment", "/repos/{repository}/issues/comments", {}),
+    ("review_comment", "/repos/{repository}/pulls/comments", {}),
+]
+
+# Items per list page (GitHub's maximum); a sync always fetches everything new since the watermark
+PAGE_SIZE = 100
+
+
+def _since_window(since: Optional[str]) -> Optional[str]:
+    """
+    Floor a watermark to the start of its UTC day for the since query parameter.
+
+    The exact watermark moves on every sync, which would change every page URL and defeat the ETag
+    cache. Requesting from the start of the day keeps the pages stable until the watermark crosses
+    midnight; items before the exact watermark are filtered client-side.
+    """
+    if not since:
+        return None
+    return f"{since[:10]}T00:00:00Z"
 
 
 class GitHubExtractor(BaseExtractor):
-    """Placeholder extractor for GitHub data (PRs, Issues, Commits, etc.)."""
-    
-    def extract(self, request: ExtractRequest) -> dict:
+    """
+    Extractor for GitHub issues, pull requests and their comments.
+
+    Syncs incrementally: each repository has a persisted `since` watermark per resource (the newest
+    updated_at it has read), and every list page is fetched with If-None-Match/If-Modified-Since so
+    unchanged pages return 304 Not Modified, which GitHub does not count against the rate limit.
+    ETags are cached per resource and page number for the current since window (see _since_window).
+    Call commit() once the returned documents have been ingested to persist the new watermarks and ETags.
+
+    The resources are listed one after another, so each keeps its own watermark: an item created in
+    one resource while a later one is being listed is still after its own resource's watermark.
+    Edited items are yielded again and replace the stored document under their source key.
+    """
+
+    def __init__(self):
+        self.repository: Optional[str] = None
+        self.pending_state: Optional[Dict[str, Any]] = None
+        self._summary: Dict[str, Any] = {"ok": True}
+
+    def extract(self, request: ExtractRequest) -> Iterator[DocumentRecord]:
         """
-        Placeholder implementation for GitHub extraction.
-        
+        Stream new and edited issues, pull requests and comments from a GitHub repository.
+
         Args:
-            request: ExtractRequest (GitHub-specific fields to be added later)
-            
-        Returns:
-            TODO message indicating this service is not yet implemented
+            request: ExtractRequest with GitHub-specific fields
+
+        Yields:
+            DocumentRecord per new or edited issue, pull request or comment
         """
-        return {
-            "message": "TODO",
-            "service": "github"
+        token = request.github_token or constants.GITHUB_TOKEN
+        if not token:
+            raise HTTPException(
+                status_code=400,
+                detail="GitHub token is required. Please provide github_token in request."
+            )
+
+        repository = request.repository
+        state = load_state("github", repository)
+        since: Dict[str, Optional[str]] = state.get("since") or {}
+        seen: Dict[str, List[str]] = state.get("seen") or {}
+        if not isinstance(since, dict):
+            # State saved with one watermark for every resource
+            since = {kind: since for kind, _, _ in RESOURCES}
+            seen = {kind: [key for key in seen if key.startswith(f"{kind}:")] for kind, _, _ in RESOURCES}
+        etags: Dict[str, Dict[str, Any]] = state.get("etags", {})
+
+        headers = {
+            "Accept": "application/vnd.github+json",
+            "Authorization": f"Bearer {token}",
+            "X-GitHub-Api-Version": "2022-11-28",
         }
 
+        fresh_etags: Dict[str, Dict[str, Any]] = {}
+        stats = {"requests": 0, "not_modified": 0, "rate_limit_remaining": None}
+        document_count = 0
+        next_since: Dict[str, Optional[str]] = {}
+        next_seen: Dict[str, List[str]] = {}
+
+        try:
+            with httpx.Client(base_url=constants.GITHUB_API_BASE_URL, headers=headers, timeout=30.0) as client:
+                for kind, template, extra_params in RESOURCES:
+                    kind_since = since.get(kind)
+                    kind_seen = set(seen.get(kind, []))
+                    window = _since_window(kind_since)
+                    newest = kind_since
+                    # Keys of the items updated at the newest time read, which the next sync's
+                    # (inclusive) since returns again
+                    newest_keys: List[str] = []
+
+                    params = {**extra_params, "sort": "updated", "direction": "asc", "per_page": PAGE_SIZE}
+                    if window:
+                        params["since"] = window
+
+                    # Cached pages only apply while the since window (and so every page URL) is unchanged
+                    cached = etags.get(kind)
+                    cached_pages = cached["pages"] if isinstance(cached, dict) and cached.get("window") == window else []
+                    fresh_pages: List[Dict[str, Optional[str]]] = []
+                    fresh_etags[kind] = {"window": window, "pages": fresh_pages}
+
+                    path = template.format(repository=repository)
+                    for item in self._paginate(client, path, params, cached_pages, fresh_pages, stats):
+                        # The window starts before the watermark; skip what an earlier sync read
+                        seen_key = f"{kind}:{item['id']}"
+                        updated_at = item.get("updated_at") or item.get("created_at", "")
+                        if kind_since and (
+                            updated_at < kind_since or (updated_at == kind_since and seen_key in kind_seen)
+                        ):
+                            continue
+
+                        if not newest or updated_at > newest:
+                            newest, newest_keys = updated_at, [seen_key]
+                        elif updated_at == newest:
+                            newest_keys.append(seen_key)
+
+                        # Skip bots (CI, dependency updates) to keep noise out of the index
+                        user = item.get("user") or {}
+                        if user.get("type") == "Bot":
+                            continue
+
+                        content = self._to_content(kind, item)
+                        if not content:
+                            continue
+
+                        document_count += 1
+                        yield DocumentRecord(
+                            content=content,
+                            user_name=user.get("login"),
+                            key=f"github:{repository}:{seen_key}"
+                        )
+
+                    next_since[kind] = newest
+                    # Items on an unchanged watermark were already read too
+                    next_seen[kind] = sorted(kind_seen | set(newest_keys)) if newest == kind_since else newest_keys
+
+        except httpx.HTTPStatusError as e:
+            status_code = e.response.status_code
+            if status_code in (403, 429) and e.response.headers.get("x-ratelimit-remaining") == "0":
+                raise HTTPException(status_code=429, detail="GitHub API rate limit exceeded")
+            if status_code == 404:
+                raise HTTPException(status_code=404, detail=f"Repository '{repository}' not found")
+            if status_code == 401:
+                raise HTTPException(status_code=401, detail="GitHub API error: bad credentials")
+            raise HTTPException(status_code=500, detail=f"GitHub API error: {status_code} {e.response.text}")
+        except httpx.HTTPError as e:
+            raise HTTPException(status_code=500, detail=f"GitHub API error: {str(e)}")
+
+        self.repository = repository
+        self.pending_state = {"since": next_since, "seen": next_seen, "etags": fresh_etags}
+        self._summary = {
+            "ok": True,
+            "service": "github",
+            "repository": repository,
+            "document_count": document_count,
+            "since": since,
+            "next_since": next_since,
+            **stats,
+        }
+
+    def summary(self) -> Dict[str, Any]:
+        """Sync statistics and the new watermarks (per resource) from the last extract()."""
+        return self._summary
+
+    def commit(self) -> None:
+        """Persist the watermarks and ETags from the last extract() once its documents are ingested."""
+        if self.repository and self.pending_state is not None:
+            save_state("github", self.repository, self.pending_state)
+            self.pending_state = None
+
+    def _paginate(
+        self,
+        client: httpx.Client,
+        path: str,
+        params: Dict[str, Any],
+        cached_pages: List[Dict[str, Optional[str]]],
+        fresh_pages: List[Dict[str, Optional[str]]],
+        stats: dict
+    ):
+        """
+        Yield items from every page of a list endpoint using conditional requests.
+
+        Unchanged pages (304) yield nothing, since their items were ingested by an earlier sync,
+        but pagination continues through the next link cached with the page's ETag.
+        Every page visited is appended to fresh_pages, so pages past the new end are dropped.
+        """
+        next_url: Optional[str] = path
+        request_params: Optional[Dict[str, Any]] = params
+        while next_url:
+            page = len(fresh_pages)
+            cached = cached_pages[page] if page < len(cached_pages) else {}
+            conditional_headers = {}
+            if cached.get("etag"):
+                conditional_headers["If-None-Match"] = cached["etag"]
+            if cached.get("last_modified"):
+                conditional_headers["If-Modified-Since"] = cached["last_modified"]
+
+            # Next links already carry the query string
+            with stage("github.list"):
+                response = client.get(next_url, params=request_params, headers=conditional_headers)
+            request_params = None
+            stats["requests"] += 1
+            stats["rate_limit_remaining"] = response.headers.get("x-ratelimit-remaining", stats["rate_limit_remaining"])
+
+            if response.status_code == 304:
+                stats["not_modified"] += 1
+                record_cache("github_etag", hit=True)
+                fresh_pages.append(cached)
+                next_url = cached.get("next")
+                continue
+
+            record_cache("github_etag", hit=False)
+            response.raise_for_status()
+            items = response.json()
+            BATCH_SIZE.labels(stage="github.list").observe(len(items))
+
+            following = self._next_link(response)
+            fresh_pages.append({
+                "etag": response.headers.get("etag"),
+                "last_modified": response.headers.get("last-modified"),
+                "next": following,
+            })
+
+            yield from items
+            next_url = following
+
+    @staticmethod
+    def _next_link(response: httpx.Response) -> Optional[str]:
+        """Return the next page URL from the Link header, relative to the API base URL."""
+        link = response.links.get("next", {}).get("url")
+        base = constants.GITHUB_API_BASE_URL.rstrip("/")
+        if link and link.startswith(base):
+            return link[len(base):]
+        return link
+
+    @staticmethod
+    def _to_content(kind: str, item: dict) -> str:
+        """Build the text to embed for an issue, pull request or comment."""
+        body = (item.get("body") or "").strip()
+        if kind == "issue":
+            label = "Pull request" if item.get("pull_request") else "Issue"
+            title = (item.get("title") or "").strip()
+            return f"{label} #{item.get('number')}: {title}\n\n{body}".strip()
+        return body
+
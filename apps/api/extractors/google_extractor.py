@@ -1,22 +1,530 @@
+import base64
+import codecs
+import contextvars
+from contextlib import closing
+import queue
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.utils import parseaddr
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+import httpx
+from fastapi import HTTPException
+import constants
 from extractors.base import BaseExtractor
+from extractors.state import load_state, save_state
+from helpers import RateLimiter
+from metrics import stage, BATCH_SIZE
 from models import ExtractRequest
+from records import DocumentRecord
+
+SOURCES = ("drive", "gmail")
+
+# Google Workspace files are exported as text; other files are downloaded as-is if they are text
+EXPORT_MIME_TYPES = {
+    "application/vnd.google-apps.document": "text/plain",
+    "application/vnd.google-apps.presentation": "text/plain",
+    "application/vnd.google-apps.spreadsheet": "text/csv",
+}
+DOWNLOAD_MIME_TYPES = ("text/", "application/json")
+
+DRIVE_FILE_FIELDS = "id,name,mimeType,modifiedTime,trashed,webViewLink,lastModifyingUser(displayName)"
+
+# Gmail labels whose messages are never ingested
+SKIPPED_LABELS = {"DRAFT", "SPAM", "TRASH"}
+
+# Rate limit reasons Google returns with 403 instead of 429
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded"}
+
+# Items per list page (the maximum for both APIs); a sync always fetches everything that changed
+PAGE_SIZE = 100
+
+# Chunks a download may buffer ahead of the consumer before its worker blocks
+CHUNKS_BUFFERED_PER_DOWNLOAD = 8
+
+# Marks the end of one download's chunks on its queue
+_END_OF_DOWNLOAD = object()
+
+
+def iter_chunks(pieces: Iterable[str], chunk_chars: int) -> Iterator[str]:
+    """
+    Split streamed text into chunks of about chunk_chars characters.
+
+    Chunks end at the last paragraph break, line break or space before the limit when there is one
+    in the second half of the chunk, so words are not cut in half.
+
+    Args:
+        pieces: Text in arbitrary pieces, e.g. decoded download chunks
+        chunk_chars: Maximum characters per chunk
+
+    Yields:
+        Non-empty, stripped chunks
+    """
+    buffer = ""
+    for piece in pieces:
+        buffer += piece
+        while len(buffer) >= chunk_chars:
+            window = buffer[:chunk_chars]
+            cut = max(window.rfind("\n\n"), window.rfind("\n"), window.rfind(" "))
+            if cut < chunk_chars // 2:
+                cut = chunk_chars
+            chunk, buffer = buffer[:cut].strip(), buffer[cut:]
+            if chunk:
+                yield chunk
+    if buffer.strip():
+        yield buffer.strip()
 
 
 class GoogleExtractor(BaseExtractor):
-    """Placeholder extractor for Google services (Gmail, Drive, Docs, Sheets, etc.)."""
-    
-    def extract(self, request: ExtractRequest) -> dict:
+    """
+    Extractor for Google Drive files and Gmail messages.
+
+    Syncs incrementally from change feeds: Drive changes.list page tokens and Gmail history IDs are
+    persisted per account, so each sync only fetches what changed since the last one. File and
+    message bodies are downloaded concurrently under a shared request budget, streamed and chunked
+    before embedding. Chunks are keyed "drive:<file id>:<n>" and "gmail:<message id>:<n>", so a
+    changed file replaces its chunks in place; the chunk count of every Drive file is persisted so
+    the chunks a file no longer has, and those of removed or trashed files, are deleted with
+    tombstone records. Call commit() once the returned documents have been ingested to persist the
+    new tokens.
+    """
+
+    def __init__(self):
+        self.pending_state: Dict[str, Dict[str, Any]] = {}
+        self.source_stats: Dict[str, dict] = {}
+
+    def extract(self, request: ExtractRequest) -> Iterator[DocumentRecord]:
         """
-        Placeholder implementation for Google extraction.
-        
+        Stream new and changed Drive files and Gmail messages.
+
         Args:
-            request: ExtractRequest (Google-specific fields to be added later)
-            
-        Returns:
-            TODO message indicating this service is not yet implemented
+            request: ExtractRequest with Google-specific fields
+
+        Yields:
+            DocumentRecord per chunk of each file or message body, and tombstones for deleted chunks
         """
-        return {
-            "message": "TODO",
-            "service": "google"
+        token = request.google_access_token or constants.GOOGLE_ACCESS_TOKEN
+        if not token:
+            raise HTTPException(
+                status_code=400,
+                detail="Google access token is required. Please provide google_access_token in request."
+            )
+
+        sources = request.google_sources or list(SOURCES)
+        unknown = [source for source in sources if source not in SOURCES]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Unsupported Google sources: {', '.join(unknown)}. Supported sources: {', '.join(SOURCES)}"
+            )
+
+        rate_limiter = RateLimiter(constants.GOOGLE_REQUESTS_PER_MINUTE, constants.GOOGLE_REQUEST_BURST, name="google")
+        self.pending_state = {}
+        self.source_stats = {}
+
+        try:
+            with httpx.Client(
+                base_url=constants.GOOGLE_API_BASE_URL,
+                headers={"Authorization": f"Bearer {token}"},
+                timeout=30.0
+            ) as client, ThreadPoolExecutor(
+                max_workers=constants.GOOGLE_DOWNLOAD_WORKERS,
+                thread_name_prefix="google-download"
+            ) as executor:
+                session = _GoogleSession(client, rate_limiter, executor)
+                if "drive" in sources:
+                    yield from self._sync_drive(session)
+                if "gmail" in sources:
+                    yield from self._sync_gmail(session)
+
+        except httpx.HTTPStatusError as e:
+            status_code = e.response.status_code
+            if status_code == 401:
+                raise HTTPException(status_code=401, detail="Google API error: invalid credentials")
+            if status_code == 429 or _rate_limit_reason(e.response):
+                raise HTTPException(status_code=429, detail="Google API quota exceeded")
+            if status_code == 403:
+                raise HTTPException(status_code=403, detail=f"Google API error: {e.response.text}")
+            raise HTTPException(status_code=500, detail=f"Google API error: {status_code} {e.response.text}")
+        except httpx.HTTPError as e:
+            raise HTTPException(status_code=500, detail=f"Google API error: {str(e)}")
+
+    def summary(self) -> Dict[str, Any]:
+        """Per-source sync statistics from the last extract()."""
+        return {"ok": True, "service": "google", "sources": self.source_stats}
+
+    def commit(self) -> None:
+        """Persist the change tokens from the last extract() once its documents are ingested."""
+        for key, state in self.pending_state.items():
+            save_state("google", key, state)
+        self.pending_state = {}
+
+    def _sync_drive(self, session: "_GoogleSession") -> Iterator[DocumentRecord]:
+        """Fetch Drive files changed since the saved page token (or all files on the first sync)."""
+        account = session.get_json("/drive/v3/about", {"fields": "user(emailAddress)"})["user"]["emailAddress"]
+        key = f"{account}/drive"
+        state = load_state("google", key)
+        page_token = state.get("page_token")
+        # Chunks stored per file id, so shrunk, removed and trashed files can delete theirs
+        chunk_counts: Dict[str, int] = dict(state.get("chunk_counts", {}))
+        stats = {
+            "account": account, "incremental": page_token is not None,
+            "pages": 0, "files": 0, "skipped": 0, "removed": 0, "chunks": 0, "deleted_chunks": 0,
         }
+        self.source_stats["drive"] = stats
+
+        # File id -> latest metadata, or None once removed or trashed
+        files: Dict[str, Optional[dict]] = {}
+        if page_token:
+            while True:
+                with stage("google.drive.changes"):
+                    data = session.get_json("/drive/v3/changes", {
+                        "pageToken": page_token,
+                        "pageSize": PAGE_SIZE,
+                        "spaces": "drive",
+                        "fields": f"nextPageToken,newStartPageToken,changes(fileId,removed,file({DRIVE_FILE_FIELDS}))",
+                    })
+                stats["pages"] += 1
+                for change in data.get("changes", []):
+                    file = change.get("file")
+                    # A file changed several times appears once per change; keep the latest
+                    if change.get("removed") or not file or file.get("trashed"):
+                        files[change.get("fileId") or file["id"]] = None
+                    else:
+                        files[file["id"]] = file
+                if data.get("nextPageToken"):
+                    page_token = data["nextPageToken"]
+                    continue
+                next_token = data["newStartPageToken"]
+                break
+        else:
+            # Take the start token before listing, so changes made during the listing are not missed
+            next_token = session.get_json("/drive/v3/changes/startPageToken")["startPageToken"]
+            params = {
+                "pageSize": PAGE_SIZE,
+                "q": "trashed = false",
+                "fields": f"nextPageToken,files({DRIVE_FILE_FIELDS})",
+            }
+            while True:
+                with stage("google.drive.list"):
+                    data = session.get_json("/drive/v3/files", params)
+                stats["pages"] += 1
+                for file in data.get("files", []):
+                    files[file["id"]] = file
+                if not data.get("nextPageToken"):
+                    break
+                params["pageToken"] = data["nextPageToken"]
+
+        downloadable = [file for file in files.values() if file is not None and self._is_downloadable(file)]
+        stats["skipped"] = sum(1 for file in files.values() if file is not None) - len(downloadable)
+
+        # Files that are gone, or no longer have text to index, lose all their chunks
+        for file_id, file in files.items():
+            if (file is None or not self._is_downloadable(file)) and file_id in chunk_counts:
+                stats["removed"] += 1
+                for record in self._drive_tombstones(file_id, 0, chunk_counts.pop(file_id)):
+                    stats["deleted_chunks"] += 1
+                    yield record
+
+        BATCH_SIZE.labels(stage="google.drive.download").observe(len(downloadable))
+        # Closed explicitly, so downloads are cancelled as soon as this generator stops
+        with closing(session.map(self._download_file, downloadable)) as downloads:
+            for file, file_records in downloads:
+                count = 0
+                for record in file_records:
+                    count += 1
+                    yield record
+                if count:
+                    stats["files"] += 1
+                    stats["chunks"] += count
+
+                # A file that shrank (or became empty or inaccessible) deletes the chunks it no longer has
+                for record in self._drive_tombstones(file["id"], count, chunk_counts.get(file["id"], 0)):
+                    stats["deleted_chunks"] += 1
+                    yield record
+                if count:
+                    chunk_counts[file["id"]] = count
+                else:
+                    chunk_counts.pop(file["id"], None)
+
+        self.pending_state[key] = {"page_token": next_token, "chunk_counts": chunk_counts}
+
+    @staticmethod
+    def _drive_tombstones(file_id: str, start: int, stop: int) -> Iterator[DocumentRecord]:
+        """Tombstones for a Drive file's chunks start..stop-1."""
+        for index in range(start, stop):
+            yield DocumentRecord.tombstone(f"drive:{file_id}:{index}")
+
+    def _sync_gmail(self, session: "_GoogleSession") -> Iterator[DocumentRecord]:
+        """Fetch Gmail messages added since the saved history ID (or recent messages on the first sync)."""
+        profile = session.get_json("/gmail/v1/users/me/profile")
+        account = profile["emailAddress"]
+        key = f"{account}/gmail"
+        history_id = load_state("google", key).get("history_id")
+        stats = {"account": account, "incremental": history_id is not None, "pages": 0, "messages": 0, "chunks": 0}
+        self.source_stats["gmail"] = stats
+
+        message_ids: List[str] = []
+        next_history_id = profile["historyId"]
+        if history_id:
+            params = {"startHistoryId": history_id, "historyTypes": "messageAdded", "maxResults": PAGE_SIZE}
+            try:
+                while True:
+                    with stage("google.gmail.history"):
+                        data = session.get_json("/gmail/v1/users/me/history", params)
+                    stats["pages"] += 1
+                    for record in data.get("history", []):
+                        for added in record.get("messagesAdded", []):
+                            message = added["message"]
+                            if not SKIPPED_LABELS.intersection(message.get("labelIds", [])):
+                                message_ids.append(message["id"])
+                    next_history_id = data.get("historyId", next_history_id)
+                    if not data.get("nextPageToken"):
+                        break
+                    params["pageToken"] = data["nextPageToken"]
+            except httpx.HTTPStatusError as e:
+                # History IDs expire after about a week; fall back to a full sync. Messages are
+                # upserted by key, so ones the relist finds again are updated, not duplicated
+                if e.response.status_code != 404:
+                    raise
+                history_id = None
+                stats["incremental"] = False
+                message_ids = []
+                next_history_id = profile["historyId"]
+
+        if not history_id:
+            params = {"q": constants.GOOGLE_GMAIL_INITIAL_QUERY, "maxResults": PAGE_SIZE}
+            while True:
+                with stage("google.gmail.list"):
+                    data = session.get_json("/gmail/v1/users/me/messages", params)
+                stats["pages"] += 1
+                message_ids.extend(message["id"] for message in data.get("messages", []))
+                if not data.get("nextPageToken"):
+                    break
+                params["pageToken"] = data["nextPageToken"]
+
+        message_ids = list(dict.fromkeys(message_ids))
+        BATCH_SIZE.labels(stage="google.gmail.download").observe(len(message_ids))
+
+        with closing(session.map(self._fetch_message, message_ids)) as downloads:
+            for _, message_records in downloads:
+                count = 0
+                for record in message_records:
+                    count += 1
+                    yield record
+                if count:
+                    stats["messages"] += 1
+                    stats["chunks"] += count
+
+        self.pending_state[key] = {"history_id": next_history_id}
+
+    @staticmethod
+    def _is_downloadable(file: dict) -> bool:
+        mime_type = file.get("mimeType", "")
+        return mime_type in EXPORT_MIME_TYPES or mime_type.startswith(DOWNLOAD_MIME_TYPES)
+
+    def _download_file(self, session: "_GoogleSession", file: dict) -> Iterator[DocumentRecord]:
+        """Stream a Drive file's text and split it into chunk records as it downloads."""
+        export_mime_type = EXPORT_MIME_TYPES.get(file["mimeType"])
+        if export_mime_type:
+            url, params = f"/drive/v3/files/{file['id']}/export", {"mimeType": export_mime_type}
+        else:
+            url, params = f"/drive/v3/files/{file['id']}", {"alt": "media"}
+
+        name = file.get("name", "")
+        user_name = (file.get("lastModifyingUser") or {}).get("displayName")
+        try:
+            with stage("google.drive.download"):
+                for index, chunk in enumerate(iter_chunks(session.stream_text(url, params), constants.GOOGLE_CHUNK_CHARS)):
+                    yield DocumentRecord(
+                        content=f"{name}\n\n{chunk}",
+                        user_name=user_name,
+                        key=f"drive:{file['id']}:{index}"
+                    )
+        except httpx.HTTPStatusError as e:
+            # Deleted or unshared since the change was recorded
+            if e.response.status_code != 404:
+                raise
+
+    def _fetch_message(self, session: "_GoogleSession", message_id: str) -> Iterator[DocumentRecord]:
+        """Fetch a Gmail message and split its plain-text body into chunk records."""
+        try:
+            with stage("google.gmail.download"):
+                message = session.get_json(f"/gmail/v1/users/me/messages/{message_id}", {"format": "full"})
+        except httpx.HTTPStatusError as e:
+            # Deleted since it was added
+            if e.response.status_code == 404:
+                return
+            raise
+
+        if SKIPPED_LABELS.intersection(message.get("labelIds", [])):
+            return
+
+        payload = message.get("payload", {})
+        headers = {header["name"].lower(): header["value"] for header in payload.get("headers", [])}
+        subject = headers.get("subject", "")
+        sender_name, sender_address = parseaddr(headers.get("from", ""))
+        body_parts = self._plain_text_parts(payload) or [message.get("snippet", "")]
+        for index, chunk in enumerate(iter_chunks(body_parts, constants.GOOGLE_CHUNK_CHARS)):
+            yield DocumentRecord(
+                content=f"{subject}\n\n{chunk}",
+                user_name=sender_name or sender_address or None,
+                key=f"gmail:{message_id}:{index}"
+            )
+
+    @classmethod
+    def _plain_text_parts(cls, part: dict) -> List[str]:
+        """Decode every inline text/plain part of a MIME payload, depth first."""
+        if part.get("mimeType") == "text/plain" and part.get("body", {}).get("data"):
+            return [base64.urlsafe_b64decode(part["body"]["data"] + "==").decode("utf-8", errors="replace")]
+        texts = []
+        for child in part.get("parts", []):
+            texts.extend(cls._plain_text_parts(child))
+        return texts
+
+
+class _GoogleSession:
+    """
+    HTTP client, request budget and download pool shared by one extract() call.
+    """
+
+    def __init__(self, client: httpx.Client, rate_limiter: RateLimiter, executor: ThreadPoolExecutor):
+        self.client = client
+        self.rate_limiter = rate_limiter
+        self.executor = executor
+
+    def send(self, request: httpx.Request, stream: bool = False) -> httpx.Response:
+        """
+        Send a request under the shared budget, retrying rate limited responses with backoff.
+
+        Raises:
+            httpx.HTTPStatusError: For error responses, once retries are exhausted
+        """
+        for attempt in range(constants.GOOGLE_MAX_RETRIES + 1):
+            self.rate_limiter.acquire()
+            response = self.client.send(request, stream=stream)
+            if response.status_code in (403, 429):
+                # Streamed error bodies must be read before the rate limit reason can be checked
+                response.read()
+            if response.status_code != 429 and not (response.status_code == 403 and _rate_limit_reason(response)):
+                break
+            if attempt == constants.GOOGLE_MAX_RETRIES:
+                break
+            # Google asks for exponential backoff when it does not send Retry-After
+            response.close()
+            self.rate_limiter.pause(float(response.headers.get("retry-after", 2 ** attempt)))
+
+        if response.is_error:
+            response.read()
+            response.close()
+            response.raise_for_status()
+        return response
+
+    def get_json(self, url: str, params: Optional[dict] = None) -> dict:
+        return self.send(self.client.build_request("GET", url, params=params)).json()
+
+    def stream_text(self, url: str, params: Optional[dict] = None) -> Iterator[str]:
+        """Yield a response body as decoded text, reading at most GOOGLE_MAX_DOWNLOAD_BYTES."""
+        response = self.send(self.client.build_request("GET", url, params=params), stream=True)
+        decoder = codecs.getincrementaldecoder(response.encoding or "utf-8")(errors="replace")
+        remaining = constants.GOOGLE_MAX_DOWNLOAD_BYTES
+        try:
+            for data in response.iter_bytes():
+                data = data[:remaining]
+                remaining -= len(data)
+                yield decoder.decode(data)
+                if remaining <= 0:
+                    break
+            yield decoder.decode(b"", final=True)
+        finally:
+            response.close()
+
+    def map(
+        self,
+        fn: Callable[["_GoogleSession", Any], Iterator[Any]],
+        items: List[Any]
+    ) -> Iterator[Tuple[Any, Iterator[Any]]]:
+        """
+        Run the generator fn(session, item) for every item on the download pool.
+
+        Yields (item, values) in item order, where values streams what fn yields as it is produced.
+        Each download buffers at most CHUNKS_BUFFERED_PER_DOWNLOAD values and at most two downloads
+        per worker are started ahead of the consumer, so a slow consumer (e.g. embedding) holds back
+        downloads instead of buffering whole files in memory. The first failed download is raised
+        as soon as the consumer next waits, and once the consumer stops (on error or close) pending
+        downloads are cancelled and running ones stop at their next value.
+        """
+        window = constants.GOOGLE_DOWNLOAD_WORKERS * 2
+        cancelled = threading.Event()
+        failures: List[BaseException] = []
+        pending = deque()
+
+        def put(results: queue.Queue, value: Any) -> bool:
+            while not cancelled.is_set():
+                try:
+                    results.put(value, timeout=0.1)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+
+        def run(item: Any, results: queue.Queue) -> None:
+            if cancelled.is_set():
+                return
+            values = fn(self, item)
+            try:
+                for value in values:
+                    if not put(results, value):
+                        return
+                put(results, _END_OF_DOWNLOAD)
+            except BaseException as e:
+                failures.append(e)
+                cancelled.set()
+            finally:
+                values.close()
+
+        def submit(item: Any) -> None:
+            results = queue.Queue(maxsize=CHUNKS_BUFFERED_PER_DOWNLOAD)
+            # Run each download in a copy of this context so stage timings reach the request's breakdown
+            future = self.executor.submit(contextvars.copy_context().run, run, item, results)
+            pending.append((item, results, future))
+
+        def drain(results: queue.Queue) -> Iterator[Any]:
+            while True:
+                if failures:
+                    raise failures[0]
+                try:
+                    value = results.get(timeout=0.1)
+                except queue.Empty:
+                    continue
+                if value is _END_OF_DOWNLOAD:
+                    return
+                yield value
+
+        remaining = iter(items)
+        try:
+            for item in remaining:
+                submit(item)
+                if len(pending) >= window:
+                    break
+            while pending:
+                item, results, _ = pending.popleft()
+                yield item, drain(results)
+                next_item = next(remaining, _END_OF_DOWNLOAD)
+                if next_item is not _END_OF_DOWNLOAD:
+                    submit(next_item)
+            if failures:
+                raise failures[0]
+        finally:
+            cancelled.set()
+            for _, _, future in pending:
+                future.cancel()
+
 
+def _rate_limit_reason(response: httpx.Response) -> bool:
+    """Whether a 403 response is Google's rate limit error rather than a permission error."""
+    try:
+        errors = response.json().get("error", {}).get("errors", [])
+    except ValueError:
+        return False
+    return any(error.get("reason") in RATE_LIMIT_REASONS for error in errors)
@@ -1,23 +1,31 @@
+from typing import Iterator
 from fastapi import HTTPException
-from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
 from extractors.base import BaseExtractor
 from models import ExtractRequest
-from helpers import get_conversation_id
+from records import DocumentRecord
+from helpers import get_conversation_id, create_slack_client, get_slack_workspace, messages_to_records
+from metrics import stage, BATCH_SIZE
+
+# Messages per conversations.history call; larger limits are fetched over several pages
+HISTORY_PAGE_SIZE = 200
 
 
 class SlackExtractor(BaseExtractor):
     """Extractor for Slack messages from channels, groups, or DMs."""
     
-    def extract(self, request: ExtractRequest) -> dict:
+    def __init__(self):
+        self._summary = {"ok": True}
+    
+    def extract(self, request: ExtractRequest) -> Iterator[DocumentRecord]:
         """
-        Extract messages from a Slack conversation.
+        Stream messages from a Slack conversation, up to request.limit messages.
         
         Args:
             request: ExtractRequest with Slack-specific fields
             
-        Returns:
-            Raw Slack API response format
+        Yields:
+            DocumentRecord per message with text, skipping bot messages
         """
         # Get Slack token from request - no fallback
         slack_token = request.slack_bot_token
@@ -30,7 +38,12 @@ class SlackExtractor(BaseExtractor):
             )
         
         # Initialize Slack client
-        client = WebClient(token=slack_token)
+        client = create_slack_client(slack_token)
+        
+        # Look up user names through the token's shared user directory
+        users = get_slack_workspace(slack_token).users
+        
+        self._summary = {"ok": True, "message_count": 0, "has_more": False, "response_metadata": {}, "pin_count": 0}
         
         try:
             # Resolve conversation name to ID
@@ -40,46 +53,57 @@ class SlackExtractor(BaseExtractor):
                 request.conversation_type
             )
             
-            # Prepare parameters for conversations.history
-            params = {
-                "channel": conversation_id,
-                "limit": request.limit
-            }
-            
-            if request.oldest is not None:
-                params["oldest"] = str(request.oldest)
-            
-            if request.latest is not None:
-                params["latest"] = str(request.latest)
-            
-            if request.cursor:
-                params["cursor"] = request.cursor
-            
-            # Fetch conversation history
-            response = client.conversations_history(**params)
-            
-            # If bot is not in channel, provide clear error message
-            # (Note: Only channels the bot is already a member of should be shown in the UI)
-            if not response["ok"] and response.get("error") == "not_in_channel":
-                raise HTTPException(
-                    status_code=403,
-                    detail=f"Bot is not a member of channel '{request.conversation_name}'. Please add the bot to this channel in Slack before extracting messages."
-                )
-            
-            if not response["ok"]:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Failed to fetch messages: {response.get('error', 'Unknown error')}"
-                )
-            
-            # Return raw Slack API response format
-            return {
-                "ok": response["ok"],
-                "messages": response.get("messages", []),
-                "has_more": response.get("has_more", False),
-                "response_metadata": response.get("response_metadata", {}),
-                "pin_count": response.get("pin_count", 0)
-            }
+            remaining = request.limit or HISTORY_PAGE_SIZE
+            cursor = request.cursor
+            while remaining > 0:
+                # Prepare parameters for conversations.history
+                params = {
+                    "channel": conversation_id,
+                    "limit": min(remaining, HISTORY_PAGE_SIZE)
+                }
+                
+                if request.oldest is not None:
+                    params["oldest"] = str(request.oldest)
+                
+                if request.latest is not None:
+                    params["latest"] = str(request.latest)
+                
+                if cursor:
+                    params["cursor"] = cursor
+                
+                # Fetch conversation history
+                with stage("slack.history"):
+                    response = client.conversations_history(**params)
+                
+                # If bot is not in channel, provide clear error message
+                # (Note: Only channels the bot is already a member of should be shown in the UI)
+                if not response["ok"] and response.get("error") == "not_in_channel":
+                    raise HTTPException(
+                        status_code=403,
+                        detail=f"Bot is not a member of channel '{request.conversation_name}'. Please add the bot to this channel in Slack before extracting messages."
+                    )
+                
+                if not response["ok"]:
+                    raise HTTPException(
+                        status_code=500,
+                        detail=f"Failed to fetch messages: {response.get('error', 'Unknown error')}"
+                    )
+                
+                messages = response.get("messages", [])
+                BATCH_SIZE.labels(stage="slack.history").observe(len(messages))
+                remaining -= len(messages)
+                
+                # Keep the raw Slack pagination fields of the last page for the caller
+                self._summary["message_count"] += len(messages)
+                self._summary["has_more"] = response.get("has_more", False)
+                self._summary["response_metadata"] = response.get("response_metadata", {})
+                self._summary["pin_count"] = response.get("pin_count", 0)
+                
+                yield from messages_to_records(messages, users, channel_id=conversation_id)
+                
+                cursor = response.get("response_metadata", {}).get("next_cursor")
+                if not messages or not response.get("has_more") or not cursor:
+                    break
         
         except HTTPException:
             # Re-raise HTTP exceptions as-is
@@ -107,4 +131,12 @@ class SlackExtractor(BaseExtractor):
                 status_code=500,
                 detail=f"Unexpected error: {str(e)}"
             )
-
+    
+    def summary(self) -> dict:
+        """
+        Slack pagination fields of the last page fetched by extract().
+        
+        Returns:
+            Dictionary with ok, message_count, has_more, response_metadata (next_cursor) and pin_count
+        """
+        return self._summary
@@ -0,0 +1,46 @@
+import json
+import os
+import re
+from typing import Any, Dict
+import constants
+
+
+def _state_path(service: str, key: str) -> str:
+    # Keys like "owner/repo" become "owner__repo.json"
+    safe_key = re.sub(r"[^A-Za-z0-9_.-]", "__", key)
+    return os.path.join(constants.EXTRACTOR_STATE_DIR, service, f"{safe_key}.json")
+
+
+def load_state(service: str, key: str) -> Dict[str, Any]:
+    """
+    Load persisted sync state (watermarks, change tokens, ETags) for an extractor.
+    
+    Args:
+        service: Service name, e.g. "github"
+        key: Per-source key, e.g. "owner/repo"
+        
+    Returns:
+        State dictionary, or an empty dict if nothing has been saved yet
+    """
+    path = _state_path(service, key)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(service: str, key: str, state: Dict[str, Any]) -> None:
+    """
+    Atomically persist sync state for an extractor.
+    
+    Args:
+        service: Service name, e.g. "github"
+        key: Per-source key, e.g. "owner/repo"
+        state: JSON-serializable state dictionary
+    """
+    path = _state_path(service, key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
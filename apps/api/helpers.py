@@ -1,7 +1,311 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
+from slack_sdk.http_retry.builtin_handlers import RateLimitErrorRetryHandler
 from fastapi import HTTPException
-from typing import Optional
+from typing import Dict, Iterator, List, Optional, Tuple
+import constants
+from metrics import stage, record_cache, SLACK_RATE_LIMITED, SLACK_RATE_LIMIT_WAIT_SECONDS
+from records import DocumentRecord
+
+
+class RateLimiter:
+    """
+    Token bucket shared by every worker that uses the same API credentials.
+    
+    Workers call acquire() before each rate-limited call (e.g. Slack conversations.history). When the API
+    answers with HTTP 429 the whole bucket is paused for Retry-After seconds, so other workers back off too.
+    """
+    
+    def __init__(self, requests_per_minute: float, burst: int, name: str = "slack"):
+        """
+        Args:
+            requests_per_minute: Sustained request rate
+            burst: Requests allowed back to back before the rate applies
+            name: Prefix of the stage that records time spent waiting for the budget
+        """
+        self.name = name
+        self.rate = requests_per_minute / 60.0
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+    
+    def acquire(self) -> None:
+        """Block until a request is allowed under the shared budget."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                elif self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                else:
+                    wait = (1 - self._tokens) / self.rate
+            with stage(f"{self.name}.budget_wait"):
+                time.sleep(wait)
+    
+    def pause(self, seconds: float) -> None:
+        """Stop handing out requests for the given number of seconds."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+
+
+class InstrumentedRateLimitRetryHandler(RateLimitErrorRetryHandler):
+    """
+    Rate limit retry handler that records how often and how long we wait on Slack's Retry-After.
+    Optionally pauses a shared RateLimiter so concurrent workers back off together.
+    """
+    
+    def __init__(self, max_retry_count: int = 1, rate_limiter: Optional[RateLimiter] = None):
+        super().__init__(max_retry_count=max_retry_count)
+        self.rate_limiter = rate_limiter
+    
+    def can_retry(self, *, state, request, response=None, error=None) -> bool:
+        # Called once per response, before the retry budget is checked, so every 429 is counted
+        # exactly once, including the last one that is not retried
+        if response is not None and response.status_code == 429:
+            SLACK_RATE_LIMITED.inc()
+        return super().can_retry(state=state, request=request, response=response, error=error)
+    
+    def prepare_for_next_attempt(self, *, state, request, response=None, error=None) -> None:
+        if self.rate_limiter is not None and response is not None:
+            retry_after = next(
+                (values[0] for name, values in response.headers.items() if name.lower() == "retry-after"),
+                "1"
+            )
+            self.rate_limiter.pause(float(retry_after))
+        
+        start = time.perf_counter()
+        try:
+            super().prepare_for_next_attempt(state=state, request=request, response=response, error=error)
+        finally:
+            SLACK_RATE_LIMIT_WAIT_SECONDS.observe(time.perf_counter() - start)
+
+
+def create_slack_client(token: str, rate_limiter: Optional[RateLimiter] = None) -> WebClient:
+    """
+    Create a Slack WebClient that waits out rate limits instead of failing immediately.
+    
+    Args:
+        token: Slack bot token
+        rate_limiter: Optional shared budget to pause when Slack rate limits this client
+    
+    Returns:
+        WebClient instance with an instrumented rate limit retry handler
+    """
+    client = WebClient(token=token, base_url=constants.SLACK_API_BASE_URL.rstrip("/") + "/")
+    client.retry_handlers.append(InstrumentedRateLimitRetryHandler(max_retry_count=2, rate_limiter=rate_limiter))
+    return client
+
+
+class SlackUserDirectory:
+    """
+    Cache of Slack user ID -> display name, shared by every request using the same token.
+    
+    Names are resolved lazily with users.info, or in bulk with users.list via preload()
+    when many channels are about to be processed. User methods have their own Slack rate
+    limit tiers, so they do not draw from the history budget; 429s are still retried.
+    """
+    
+    def __init__(self, client: WebClient, ttl_seconds: float):
+        self.client = client
+        self.ttl_seconds = ttl_seconds
+        self._names: Dict[str, Tuple[Optional[str], float]] = {}
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+    
+    def preload(self) -> None:
+        """Load every user in the workspace with paginated users.list, unless loaded recently."""
+        if time.monotonic() - self._loaded_at < self.ttl_seconds:
+            return
+        
+        cursor = None
+        while True:
+            with stage("slack.users_list"):
+                response = self.client.users_list(limit=200, cursor=cursor)
+            if not response["ok"]:
+                return
+            
+            now = time.monotonic()
+            with self._lock:
+                for user in response.get("members", []):
+                    self._names[user["id"]] = (_display_name(user), now)
+            
+            cursor = response.get("response_metadata", {}).get("next_cursor")
+            if not cursor:
+                break
+        
+        self._loaded_at = time.monotonic()
+    
+    def get_name(self, user_id: str) -> Optional[str]:
+        """
+        Get a user's display name, looking it up with users.info on a cache miss.
+        
+        Args:
+            user_id: Slack user ID
+        
+        Returns:
+            User's display name, real name, or None if not found
+        """
+        with self._lock:
+            cached = self._names.get(user_id)
+        if cached is not None and time.monotonic() - cached[1] < self.ttl_seconds:
+            record_cache("slack_user_directory", hit=True)
+            return cached[0]
+        
+        record_cache("slack_user_directory", hit=False)
+        name = get_user_name(self.client, user_id)
+        with self._lock:
+            self._names[user_id] = (name, time.monotonic())
+        return name
+
+
+class SlackWorkspace:
+    """
+    Shared per-token Slack state: one client, one rate limit budget and one user directory.
+    """
+    
+    def __init__(self, token: str):
+        self.rate_limiter = RateLimiter(
+            requests_per_minute=constants.SLACK_REQUESTS_PER_MINUTE,
+            burst=constants.SLACK_REQUEST_BURST
+        )
+        self.client = create_slack_client(token, rate_limiter=self.rate_limiter)
+        self.users = SlackUserDirectory(self.client, ttl_seconds=constants.SLACK_USER_CACHE_TTL_SECONDS)
+
+
+# Token digest -> (workspace, last used), least recently used first
+_workspaces: "OrderedDict[str, Tuple[SlackWorkspace, float]]" = OrderedDict()
+_workspaces_lock = threading.Lock()
+
+
+def get_slack_workspace(token: str) -> SlackWorkspace:
+    """
+    Get the shared Slack state for a bot token, creating it on first use.
+    
+    The cache holds at most SLACK_WORKSPACE_CACHE_SIZE workspaces and drops those unused for
+    SLACK_WORKSPACE_CACHE_TTL_SECONDS. Requests still using an evicted workspace keep working.
+    
+    Args:
+        token: Slack bot token
+    
+    Returns:
+        SlackWorkspace shared by all requests using this token
+    """
+    # Keyed by digest so tokens do not show up as dict keys; each cached WebClient still holds its
+    # raw token, which is why the cache is bounded and idle workspaces are dropped
+    key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    now = time.monotonic()
+    with _workspaces_lock:
+        # Least recently used entries are at the front, so expired ones are found first
+        while _workspaces:
+            oldest_key, (_, last_used) = next(iter(_workspaces.items()))
+            if now - last_used < constants.SLACK_WORKSPACE_CACHE_TTL_SECONDS:
+                break
+            del _workspaces[oldest_key]
+        
+        cached = _workspaces.pop(key, None)
+        workspace = cached[0] if cached is not None else SlackWorkspace(token)
+        record_cache("slack_workspace", hit=cached is not None)
+        _workspaces[key] = (workspace, now)
+        
+        while len(_workspaces) > constants.SLACK_WORKSPACE_CACHE_SIZE:
+            _workspaces.popitem(last=False)
+        return workspace
+
+
+def list_member_channels(client: WebClient) -> List[dict]:
+    """
+    List all non-archived channels (public and private) that the bot is a member of.
+    
+    Args:
+        client: Slack WebClient instance
+    
+    Returns:
+        Raw Slack channel objects
+    
+    Raises:
+        HTTPException: If Slack returns an error response
+        SlackApiError: If the Slack API call fails
+    """
+    # users_conversations only returns channels the bot is already in
+    all_channels = []
+    cursor = None
+    
+    while True:
+        with stage("slack.users_conversations"):
+            response = client.users_conversations(
+                types="public_channel,private_channel",
+                exclude_archived=True,
+                cursor=cursor
+            )
+        
+        if not response["ok"]:
+            raise HTTPException(
+                status_code=500,
+                detail=f"Failed to list channels: {response.get('error', 'Unknown error')}"
+            )
+        
+        all_channels.extend(response.get("channels", []))
+        
+        # Check for pagination
+        cursor = response.get("response_metadata", {}).get("next_cursor")
+        if not cursor:
+            break
+    
+    return [channel for channel in all_channels if not channel.get("is_archived", False)]
+
+
+def messages_to_records(
+    messages: List[dict],
+    users: Optional[SlackUserDirectory] = None,
+    channel_id: Optional[str] = None
+) -> Iterator[DocumentRecord]:
+    """
+    Convert Slack messages into ingestion records, skipping bot messages and messages without text.
+    
+    Args:
+        messages: Raw Slack message objects
+        users: Optional user directory used to resolve user names
+        channel_id: Conversation the messages belong to; records are keyed "slack:<channel_id>:<ts>"
+            so re-syncing a channel updates the stored messages instead of duplicating them
+    
+    Yields:
+        DocumentRecord per kept message
+    """
+    for message in messages:
+        # Skip bot messages and messages without text (whitespace-only text cannot be embedded)
+        if message.get("bot_id") or not (message.get("text") or "").strip():
+            continue
+        
+        slack_user_id = message.get("user")
+        ts = message.get("ts")
+        
+        # Look up user name from Slack user ID
+        user_name = None
+        if slack_user_id and users:
+            try:
+                user_name = users.get_name(slack_user_id)
+            except Exception:
+                # If lookup fails, continue without user name
+                pass
+        
+        # Use just the text content (no user ID prefix)
+        yield DocumentRecord(
+            content=message.get("text", ""),
+            user_name=user_name,
+            slack_ts=float(ts) if ts else None,
+            key=f"slack:{channel_id}:{ts}" if channel_id and ts else None
+        )
 
 
 def get_conversation_id(client: WebClient, conversation_name: str, conversation_type: str) -> str:
@@ -29,10 +333,11 @@ def get_conversation_id(client: WebClient, conversation_name: str, conversation_
         # Only do name-based lookup if it's not already an ID
         if conversation_type == "channel":
             # Fetch all channels (public and private)
-            response = client.conversations_list(
-                types="public_channel,private_channel",
-                exclude_archived=True
-            )
+            with stage("slack.conversations_list"):
+                response = client.conversations_list(
+                    types="public_channel,private_channel",
+                    exclude_archived=True
+                )
             
             if not response["ok"]:
                 raise HTTPException(
@@ -52,10 +357,11 @@ def get_conversation_id(client: WebClient, conversation_name: str, conversation_
         
         elif conversation_type == "group":
             # Fetch private channels/groups
-            response = client.conversations_list(
-                types="private_channel",
-                exclude_archived=True
-            )
+            with stage("slack.conversations_list"):
+                response = client.conversations_list(
+                    types="private_channel",
+                    exclude_archived=True
+                )
             
             if not response["ok"]:
                 raise HTTPException(
@@ -75,7 +381,8 @@ def get_conversation_id(client: WebClient, conversation_name: str, conversation_
         
         elif conversation_type == "im":
             # For DMs, first find the user by name or email
-            users_response = client.users_list()
+            with stage("slack.users_list"):
+                users_response = client.users_list()
             
             if not users_response["ok"]:
                 raise HTTPException(
@@ -103,7 +410,8 @@ def get_conversation_id(client: WebClient, conversation_name: str, conversation_
                 )
             
             # Open or get the DM conversation
-            dm_response = client.conversations_open(users=[user_id])
+            with stage("slack.conversations_open"):
+                dm_response = client.conversations_open(users=[user_id])
             
             if not dm_response["ok"]:
                 raise HTTPException(
@@ -138,22 +446,26 @@ def get_user_name(client: WebClient, user_id: str) -> Optional[str]:
         User's display name, real name, or None if not found
     """
     try:
-        response = client.users_info(user=user_id)
+        with stage("slack.users_info"):
+            response = client.users_info(user=user_id)
         
         if not response["ok"]:
             return None
         
-        user = response.get("user", {})
-        profile = user.get("profile", {})
-        
-        # Prefer display_name, fallback to real_name, then to name
-        return (
-            profile.get("display_name") or
-            profile.get("real_name") or
-            user.get("name") or
-            None
-        )
+        return _display_name(response.get("user", {}))
     except SlackApiError:
         return None
     except Exception:
         return None
+
+
+def _display_name(user: dict) -> Optional[str]:
+    profile = user.get("profile", {})
+    
+    # Prefer display_name, fallback to real_name, then to name
+    return (
+        profile.get("display_name") or
+        profile.get("real_name") or
+        user.get("name") or
+        None
+    )
@@ -1,10 +1,30 @@
 """
 Ingestion module for embedding and storing documents in the database.
 """
-from typing import List, Optional
+import contextvars
+import logging
+import queue
+import threading
+import time
+from typing import Callable, Iterable, Iterator, List, Optional
 import numpy as np
-from embeddings import model
-from db import supabase
+import constants
+from embeddings import model, get_model, count_tokens
+from db import document_store
+from embedding_store import get_embedding_store, get_existing_embedding_stores
+from metrics import stage, record_embedding, should_count_tokens, BATCH_SIZE
+from records import DocumentRecord
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a record stream on the micro-batch queue
+_END_OF_STREAM = object()
+
+# Columns read back from document inserts; the embedding is never sent back
+DOCUMENT_RETURN_COLUMNS = ("id", "user_id", "slack_ts")
+
+# Unique index that keyed documents are upserted on (see migrations/003_document_source_keys.sql)
+SOURCE_KEY_CONFLICT_COLUMNS = ("source_owner", "source_key")
 
 
 class DocumentIngestion:
@@ -14,7 +34,117 @@ class DocumentIngestion:
     
     def __init__(self):
         self.model = model
-        self.supabase = supabase
+        self.store = document_store
+        self.ingest_version = constants.INGEST_EMBEDDING_VERSION
+        # Embedded by background jobs (see reembedding.start_dual_write_jobs), not on the ingest path
+        self.dual_write_versions = [
+            version for version in dict.fromkeys(constants.DUAL_WRITE_EMBEDDING_VERSIONS)
+            if version not in (constants.DOCUMENTS_EMBEDDING_VERSION, self.ingest_version)
+        ]
+        self._insert_listeners: List[Callable[[List[int]], None]] = []
+    
+    def add_insert_listener(self, listener: Callable[[List[int]], None]) -> None:
+        """
+        Register a callback that receives the ids of every batch of stored documents.
+        
+        Listeners run on the ingest path, so they must only signal (e.g. wake a background job).
+        
+        Args:
+            listener: Callable taking the list of stored document ids
+        """
+        self._insert_listeners.append(listener)
+    
+    def _notify_inserted(self, rows: List[dict]) -> None:
+        ids = [row["id"] for row in rows]
+        for listener in self._insert_listeners:
+            try:
+                listener(ids)
+            except Exception:
+                logger.exception("Insert listener %r failed", listener)
+    
+    def append_local(self, version: str, rows: List[dict], embeddings) -> None:
+        """
+        Mirror stored documents into the local embedding store for a version, if one is configured.
+        
+        The database is the source of truth, so a failure here is logged rather than raised.
+        
+        Args:
+            version: Embedding version the embeddings belong to
+            rows: Document rows (with id, and optionally user_id and slack_ts), in the same order as embeddings
+            embeddings: Embeddings for the rows
+        """
+        local_store = get_embedding_store(version)
+        if local_store is None or not rows:
+            return
+        
+        try:
+            with stage("ingest.local_store"):
+                local_store.append(
+                    [row["id"] for row in rows],
+                    np.asarray(embeddings, dtype=np.float32).reshape(len(rows), -1),
+                    user_ids=[row.get("user_id") for row in rows],
+                    slack_timestamps=[row.get("slack_ts") for row in rows]
+                )
+        except Exception:
+            logger.exception("Failed to append %d documents to the local %s store", len(rows), version)
+    
+    def encode_documents(self, contents: List[str], version: Optional[str] = None, stage_prefix: str = "ingest"):
+        """
+        Tokenize and embed a batch of documents, recording per-stage timings and throughput.
+        
+        Args:
+            contents: Non-empty list of document strings
+            version: Embedding version to use (defaults to the ingest version)
+            stage_prefix: Prefix for the recorded stage names, e.g. "ingest" or "reembed"
+            
+        Returns:
+            Embeddings as returned by the model (numpy array of shape [len(contents), dim])
+        """
+        encoder = self.model if version is None else get_model(version)
+        BATCH_SIZE.labels(stage=f"{stage_prefix}.encode").observe(len(contents))
+        
+        # Token counts need a separate tokenizer pass, so only sampled calls pay for it
+        token_count = None
+        if should_count_tokens():
+            with stage(f"{stage_prefix}.tokenize"):
+                token_count = count_tokens(contents, version)
+        
+        start = time.perf_counter()
+        with stage(f"{stage_prefix}.encode"):
+            embeddings = encoder.encode_document(contents)
+        if token_count is not None:
+            record_embedding("document", token_count, time.perf_counter() - start)
+        
+        return embeddings
+    
+    def store_version_embeddings(self, version: str, rows: List[dict], embeddings) -> int:
+        """
+        Store embeddings for a non-primary version in the document_embeddings table.
+        
+        Rows that already have an embedding for the version are skipped, so ingestion and the
+        background re-embedding jobs can safely overlap.
+        
+        Args:
+            version: Embedding version name
+            rows: Document rows (with id), in the same order as embeddings
+            embeddings: Embeddings for the rows
+            
+        Returns:
+            Number of rows submitted
+        """
+        with stage("ingest.to_list"):
+            embeddings_list = np.asarray(embeddings, dtype=np.float32).tolist()
+        
+        version_rows = [
+            {'document_id': row['id'], 'version': version, 'embedding': embedding}
+            for row, embedding in zip(rows, embeddings_list)
+        ]
+        
+        with stage("ingest.insert_version"):
+            self.store.insert('document_embeddings', version_rows, ignore_duplicates=True, returning=())
+        
+        self.append_local(version, rows, embeddings)
+        return len(version_rows)
     
     def ingest(self, content: str, user_id: Optional[str] = None) -> dict:
         """
@@ -33,57 +163,32 @@ class DocumentIngestion:
         if not content or not content.strip():
             raise ValueError("Content cannot be empty")
         
-        # Generate embedding for the content
-        # Using encode_document for document content (encode_query is for search queries)
-        embedding = self.model.encode_document(content)
-        
-        # Convert numpy array to list for JSON serialization
-        # Handle both single document and batch cases
-        if isinstance(embedding, np.ndarray):
-            if embedding.ndim == 1:
-                embedding_list = embedding.tolist()
-            else:
-                # If batch, take first item
-                embedding_list = embedding[0].tolist()
-        else:
-            embedding_list = list(embedding)
-        
-        # Prepare document data
-        document_data = {
-            'content': content,
-            'embedding': embedding_list
-        }
-        
-        # Add user_id if provided
-        if user_id:
-            document_data['user_id'] = user_id
-        
-        # Insert into Supabase documents table
-        result = self.supabase.table('documents').insert(document_data).execute()
-        
-        if not result.data:
-            raise Exception("Failed to insert document into database")
-        
-        return result.data[0] if isinstance(result.data, list) else result.data
+        return self.ingest_batch([content], user_id=user_id)[0]
     
     def ingest_batch(
         self, 
         contents: List[str], 
         user_id: Optional[str] = None,
         user_names: Optional[List[Optional[str]]] = None,
-        slack_timestamps: Optional[List[Optional[float]]] = None
+        slack_timestamps: Optional[List[Optional[float]]] = None,
+        source_keys: Optional[List[Optional[str]]] = None
     ) -> List[dict]:
         """
         Embed multiple strings and insert them into the documents table in batch.
         
+        Documents with a source key are upserted: a document already stored under the same key
+        (for the same user_id) is updated in place instead of duplicated, so re-running a sync
+        that failed part way is safe.
+        
         Args:
             contents: List of text contents to embed and store
             user_id: Optional user ID to associate with all documents
             user_names: Optional list of user names (one per content item)
             slack_timestamps: Optional list of Slack timestamps (one per content item)
+            source_keys: Optional list of source keys (one per content item), e.g. "slack:C123:1700000000.000100"
             
         Returns:
-            List of dictionaries containing the inserted document data
+            List of dictionaries containing the inserted or updated document data
             
         Raises:
             Exception: If embedding or insertion fails
@@ -91,55 +196,211 @@ class DocumentIngestion:
         if not contents:
             raise ValueError("Contents list cannot be empty")
         
-        # Filter out empty content and keep track of valid indices
+        def column(values, i):
+            return values[i] if values and i < len(values) else None
+        
+        # Filter out empty content; a key repeated within the batch keeps its last occurrence,
+        # since one upsert statement cannot update the same row twice
         valid_indices = [i for i, c in enumerate(contents) if c and c.strip()]
+        last_index_by_key = {column(source_keys, i): i for i in valid_indices if column(source_keys, i) is not None}
+        valid_indices = [
+            i for i in valid_indices
+            if column(source_keys, i) is None or last_index_by_key[column(source_keys, i)] == i
+        ]
         valid_contents = [contents[i] for i in valid_indices]
         
         if not valid_contents:
             raise ValueError("No valid content to process")
         
         # Generate embeddings for all documents at once (more efficient)
-        embeddings = self.model.encode_document(valid_contents)
+        embeddings = self.encode_documents(valid_contents)
         
         # Convert numpy arrays to lists
-        if isinstance(embeddings, np.ndarray):
-            embeddings_list = embeddings.tolist()
-        else:
-            embeddings_list = [list(emb) for emb in embeddings]
+        with stage("ingest.to_list"):
+            if isinstance(embeddings, np.ndarray):
+                embeddings_list = embeddings.tolist()
+            else:
+                embeddings_list = [list(emb) for emb in embeddings]
         
-        # Prepare batch insert data
+        # documents.embedding is only written while it holds the ingest version; after cutover the
+        # vectors go to document_embeddings and the old model is never run
+        write_primary = self.ingest_version == constants.DOCUMENTS_EMBEDDING_VERSION
+        
+        # Prepare batch insert data; every row has the same columns, as bulk upserts require
         documents = []
-        for idx, (content, embedding) in enumerate(zip(valid_contents, embeddings_list)):
+        for i, content, embedding in zip(valid_indices, valid_contents, embeddings_list):
             doc_data = {
                 'content': content,
-                'embedding': embedding,
+                'user_id': user_id or None,
+                'user_name': column(user_names, i) or None,
+                'slack_ts': column(slack_timestamps, i),
+                'source_key': column(source_keys, i),
             }
-            
-            # Add user_id if provided
-            if user_id:
-                doc_data['user_id'] = user_id
-            
-            # Add user_name if provided (match by index in valid_indices)
-            if user_names and valid_indices[idx] < len(user_names):
-                user_name = user_names[valid_indices[idx]]
-                if user_name:
-                    doc_data['user_name'] = user_name
-            
-            # Add slack_ts if provided (match by index in valid_indices)
-            if slack_timestamps and valid_indices[idx] < len(slack_timestamps):
-                slack_ts = slack_timestamps[valid_indices[idx]]
-                if slack_ts is not None:
-                    doc_data['slack_ts'] = slack_ts
-            
+            if write_primary:
+                doc_data['embedding'] = embedding
             documents.append(doc_data)
         
-        # Insert batch into Supabase
-        result = self.supabase.table('documents').insert(documents).execute()
+        # Insert batch into the documents table
+        BATCH_SIZE.labels(stage="ingest.insert").observe(len(documents))
+        with stage("ingest.insert"):
+            inserted = self.store.insert(
+                'documents',
+                documents,
+                returning=DOCUMENT_RETURN_COLUMNS,
+                on_conflict=SOURCE_KEY_CONFLICT_COLUMNS if last_index_by_key else None
+            )
         
-        if not result.data:
+        if not inserted:
             raise Exception("Failed to insert documents into database")
         
-        return result.data
+        if write_primary:
+            self.append_local(self.ingest_version, inserted, embeddings)
+        else:
+            self.store_version_embeddings(self.ingest_version, inserted, embeddings)
+        
+        # Wake the background jobs that embed the dual-write versions
+        self._notify_inserted(inserted)
+        
+        return inserted
+    
+    def delete_keys(self, source_keys: List[str], user_id: Optional[str] = None) -> None:
+        """
+        Delete the documents stored under source keys, e.g. the chunks of a removed file.
+        
+        Their embeddings in other versions are removed with them (on delete cascade), and they are
+        marked deleted in every local embedding store.
+        
+        Args:
+            source_keys: Source keys to delete; keys with no stored document are ignored
+            user_id: User ID the documents were ingested for
+        """
+        if not source_keys:
+            return
+        with stage("ingest.delete"):
+            deleted = self.store.delete(
+                'documents',
+                {'source_owner': user_id or '', 'source_key': list(source_keys)},
+                returning=('id',)
+            )
+        ids = [row['id'] for row in deleted]
+        if not ids:
+            return
+        for local_store in get_existing_embedding_stores():
+            try:
+                with stage("ingest.local_store"):
+                    local_store.delete(ids)
+            except Exception:
+                logger.exception("Failed to mark %d documents deleted in the local store at %s", len(ids), local_store.path)
+    
+    def ingest_stream(
+        self,
+        records: Iterable[DocumentRecord],
+        user_id: Optional[str] = None,
+        batch_size: Optional[int] = None,
+        prefetch_batches: int = 2
+    ) -> Iterator[List[int]]:
+        """
+        Embed and insert a stream of records in fixed-size micro-batches.
+        
+        A background thread pulls records from the stream (i.e. runs the extractor's fetches) and
+        fills a bounded queue of micro-batches while the calling thread embeds and inserts them, so
+        fetching and embedding overlap and at most prefetch_batches + 2 batches are held in memory.
+        If the consumer stops early (an ingest error, or the caller closing this generator), the
+        record stream is closed as well.
+        
+        Tombstone records delete the documents stored under their keys. Within a micro-batch the
+        last record for a key wins, as if the records were applied one by one.
+        
+        Args:
+            records: Records to ingest, typically an extractor's extract() generator
+            user_id: Optional user ID to associate with all documents
+            batch_size: Records per micro-batch (defaults to INGEST_BATCH_SIZE)
+            prefetch_batches: Micro-batches fetched ahead of the one being embedded
+            
+        Yields:
+            Inserted document ids, one list per micro-batch
+            
+        Raises:
+            Exception: Errors from the record stream (e.g. HTTPException from an extractor) or from ingestion
+        """
+        batch_size = batch_size or constants.INGEST_BATCH_SIZE
+        records = iter(records)
+        batches: queue.Queue = queue.Queue(maxsize=prefetch_batches)
+        stopped = threading.Event()
+        
+        def put(item) -> None:
+            # Give up once the consumer has stopped, so the producer never blocks on a full queue forever
+            while not stopped.is_set():
+                try:
+                    batches.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+        
+        def produce() -> None:
+            try:
+                batch: List[DocumentRecord] = []
+                for record in records:
+                    if stopped.is_set():
+                        return
+                    if not record.deleted and (not record.content or not record.content.strip()):
+                        continue
+                    batch.append(record)
+                    if len(batch) >= batch_size:
+                        put(batch)
+                        batch = []
+                if batch:
+                    put(batch)
+                put(_END_OF_STREAM)
+            except BaseException as e:
+                put(e)
+            finally:
+                # Close the generator on this thread when the consumer stops early, so the
+                # extractor's cleanup (HTTP clients, download pools, finally blocks) runs now
+                close = getattr(records, "close", None)
+                if close is not None:
+                    close()
+        
+        # Run the producer in a copy of this context so stage timings reach the request's breakdown
+        producer = threading.Thread(
+            target=contextvars.copy_context().run,
+            args=(produce,),
+            name="ingest-fetch",
+            daemon=True
+        )
+        producer.start()
+        
+        try:
+            while True:
+                with stage("ingest.wait_fetch"):
+                    item = batches.get()
+                if item is _END_OF_STREAM:
+                    return
+                if isinstance(item, BaseException):
+                    raise item
+                
+                BATCH_SIZE.labels(stage="ingest.micro_batch").observe(len(item))
+                last_by_key = {record.key: record for record in item if record.key is not None}
+                self.delete_keys([key for key, record in last_by_key.items() if record.deleted], user_id=user_id)
+                
+                live = [
+                    record for record in item
+                    if not record.deleted and (record.key is None or not last_by_key[record.key].deleted)
+                ]
+                if not live:
+                    yield []
+                    continue
+                inserted = self.ingest_batch(
+                    [record.content for record in live],
+                    user_id=user_id,
+                    user_names=[record.user_name for record in live],
+                    slack_timestamps=[record.slack_ts for record in live],
+                    source_keys=[record.key for record in live]
+                )
+                yield [row.get("id") for row in inserted]
+        finally:
+            stopped.set()
+            producer.join()
 
 
 # Create a module-level instance for convenient access
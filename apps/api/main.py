@@ -1,16 +1,39 @@
-from fastapi import FastAPI, HTTPException
+import time
+from contextlib import asynccontextmanager
+from typing import List
+from fastapi import FastAPI, HTTPException, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from models import ExtractRequest, RetrieveRequest, RetrieveResponse, DocumentMatch, SlackChannelsRequest, SlackChannelsResponse, SlackChannel
+import constants
+from models import MAX_FETCH_K, ExtractRequest, RetrieveRequest, RetrieveResponse, DocumentMatch, SlackChannelsRequest, SlackChannelsResponse, SlackChannel, SlackSyncRequest, SlackSyncResponse, EmbeddingVersionsResponse, ReembedRequest, ReembedStatus
 from extractors import get_extractor
-from embeddings import model
-from db import supabase
-from slack_sdk import WebClient
+from embeddings import get_model, count_tokens
+from db import document_store
 from slack_sdk.errors import SlackApiError
 from ingestion import ingestion
-from helpers import get_user_name
+from reembedding import reembedding_jobs, start_reembedding, start_dual_write_jobs
+from rerank import diversify
+from helpers import create_slack_client, list_member_channels
+from slack_sync import sync_workspace
+from metrics import stage, record_embedding, should_count_tokens, start_breakdown, format_server_timing, render_latest, REQUEST_SECONDS
 import numpy as np
 
-app = FastAPI()
+# Clients opt in to a per-request stage breakdown by sending this header with any non-empty value
+# The breakdown is returned in the standard Server-Timing response header
+TIMING_REQUEST_HEADER = "X-Cerium-Timing"
+# Request latency path label for requests that did not match any route
+UNMATCHED_ROUTE_LABEL = "unmatched"
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Keep dual-write embedding versions current in the background, off the ingest path
+    start_dual_write_jobs()
+    yield
+    # Close pooled database connections on shutdown
+    await document_store.aclose()
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -19,16 +42,43 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["Server-Timing"],
 )
 
 
+@app.middleware("http")
+async def record_request_timing(request: Request, call_next):
+    """
+    Record end-to-end latency for every request and, when requested, return a per-stage breakdown.
+    """
+    breakdown = start_breakdown() if request.headers.get(TIMING_REQUEST_HEADER) else None
+    start = time.perf_counter()
+    response = await call_next(request)
+    elapsed = time.perf_counter() - start
+    
+    # Label by route template rather than raw path to keep label cardinality bounded
+    # Requests that match no route (404s, scanners) share one label
+    route = request.scope.get("route")
+    path = getattr(route, "path", UNMATCHED_ROUTE_LABEL)
+    REQUEST_SECONDS.labels(method=request.method, path=path, status=str(response.status_code)).observe(elapsed)
+    
+    if breakdown is not None:
+        breakdown["total"] = elapsed
+        response.headers["Server-Timing"] = format_server_timing(breakdown)
+    
+    return response
+
+
 @app.post("/extract")
 def extract_data(request: ExtractRequest):
     """
     Extract data from various services (Slack, GitHub, Google, etc.).
     
     Accepts a service parameter and service-specific fields to extract data.
-    For Slack, also ingests the extracted messages as embeddings into Supabase.
+    Extracted documents are ingested as embeddings into Supabase as they are fetched.
+    For Slack, ingests up to `limit` messages and returns the cursor for the next call.
+    For GitHub, syncs incrementally from the repository's last watermark and ingests new items.
+    For Google, syncs Drive and Gmail changes since the last change tokens and ingests the chunks.
     Returns service-specific response format.
     """
     # Validate service-specific required fields
@@ -43,115 +93,149 @@ def extract_data(request: ExtractRequest):
                 status_code=400,
                 detail="conversation_type is required when service is 'slack'"
             )
+    elif request.service.value == "github":
+        if not request.repository or request.repository.count("/") != 1:
+            raise HTTPException(
+                status_code=400,
+                detail="repository ('owner/name') is required when service is 'github'"
+            )
     
     # Get the appropriate extractor for the service
     extractor = get_extractor(request.service.value)
     
-    # Extract data using the service-specific extractor
-    extracted_data = extractor.extract(request)
-    
-    # If Slack, ingest the messages into the database
-    if request.service.value == "slack" and extracted_data.get("ok") and extracted_data.get("messages"):
-        try:
-            messages = extracted_data.get("messages", [])
-            
-            # Initialize Slack client to look up user names
-            slack_token = request.slack_bot_token
-            client = WebClient(token=slack_token) if slack_token else None
-            
-            # Prepare content strings and user names for ingestion
-            contents = []
-            user_names = []
-            slack_timestamps = []
-            
-            for message in messages:
-                # Skip bot messages and messages without text
-                if message.get("bot_id") or not message.get("text"):
-                    continue
-                
-                # Get message details
-                slack_user_id = message.get("user")
-                text = message.get("text", "")
-                ts = message.get("ts")
-                
-                # Look up user name from Slack user ID
-                user_name = None
-                if slack_user_id and client:
-                    try:
-                        user_name = get_user_name(client, slack_user_id)
-                    except Exception:
-                        # If lookup fails, continue without user name
-                        pass
-                
-                # Use just the text content (no user ID prefix)
-                contents.append(text)
-                user_names.append(user_name)
-                slack_timestamps.append(float(ts) if ts else None)
-            
-            # Ingest messages in batch if there are any
-            if contents:
-                ingested_docs = ingestion.ingest_batch(
-                    contents, 
-                    user_id=request.user_id,
-                    user_names=user_names,
-                    slack_timestamps=slack_timestamps
-                )
-                
-                # Update the response to include ingestion info
-                extracted_data["ingested_count"] = len(ingested_docs)
-                extracted_data["ingested_document_ids"] = [doc.get("id") for doc in ingested_docs]
-            else:
-                extracted_data["ingested_count"] = 0
-                extracted_data["ingested_document_ids"] = []
-                
-        except Exception as e:
-            # Log the error but don't fail the extraction
-            # The extraction was successful, ingestion failure is separate
-            extracted_data["ingestion_error"] = str(e)
-            extracted_data["ingested_count"] = 0
+    # Stream records from the extractor into ingestion in fixed-size micro-batches, so fetching the
+    # next batch overlaps with embedding the current one and memory stays constant
+    ingested_document_ids = []
+    ingestion_error = None
+    try:
+        with stage("extract.ingest"):
+            for document_ids in ingestion.ingest_stream(extractor.extract(request), user_id=request.user_id):
+                ingested_document_ids.extend(document_ids)
+    except HTTPException:
+        # Extraction errors are reported as-is
+        raise
+    except Exception as e:
+        # The extraction was successful, ingestion failure is separate
+        ingestion_error = str(e)
+    
+    extracted_data = extractor.summary()
+    extracted_data["ingested_count"] = len(ingested_document_ids)
+    extracted_data["ingested_document_ids"] = ingested_document_ids
+    
+    if ingestion_error is not None:
+        # Keep the old watermark so the next sync retries these documents
+        extracted_data["ingestion_error"] = ingestion_error
+    else:
+        # Only advance the watermark once everything up to it is stored
+        extractor.commit()
     
     return extracted_data
 
 
+def embed_query(prompt: str, version: str) -> List[float]:
+    """
+    Embed a search prompt, recording tokenization, forward pass and list conversion timings.
+    
+    Args:
+        prompt: The user prompt to embed
+        version: Embedding version to embed with
+        
+    Returns:
+        Query embedding as a list of floats
+    """
+    # Token counts need a separate tokenizer pass, so only sampled calls pay for it
+    token_count = None
+    if should_count_tokens():
+        with stage("retrieve.tokenize"):
+            token_count = count_tokens([prompt], version)
+    
+    start = time.perf_counter()
+    with stage("retrieve.encode"):
+        # Using encode() for query embedding (standard SentenceTransformer method)
+        embedding = get_model(version).encode(prompt)
+    if token_count is not None:
+        record_embedding("query", token_count, time.perf_counter() - start)
+    
+    # Convert numpy array to list for JSON serialization
+    with stage("retrieve.to_list"):
+        if isinstance(embedding, np.ndarray):
+            if embedding.ndim == 1:
+                return embedding.tolist()
+            # If batch, take first item
+            return embedding[0].tolist()
+        return list(embedding)
+
+
 @app.post("/retrieve", response_model=RetrieveResponse)
 def retrieve_documents(request: RetrieveRequest):
     """
     Retrieve documents using semantic search based on a user prompt.
     
     Converts the prompt to an embedding and searches for similar documents
-    using the match_documents Postgres function.
+    using the match_documents Postgres function. Requests for a non-default
+    embedding version are routed to match_document_embeddings instead.
+    With diversify set, an over-fetched candidate set is re-ranked with MMR
+    and near-duplicates are collapsed, returning fewer, more diverse matches.
+    
+    The handler is sync, so FastAPI runs it in one threadpool hop: the CPU-bound
+    encode, the (sync or pooled) database call and the re-rank all run there.
     """
+    version = request.embedding_version or constants.DEFAULT_EMBEDDING_VERSION
+    if version not in constants.EMBEDDING_MODELS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Unknown embedding_version: '{version}'. Configured versions: {', '.join(constants.EMBEDDING_MODELS)}"
+        )
+    if request.diversify and request.match_count is None:
+        raise HTTPException(status_code=400, detail="match_count is required when diversify is set")
+    
     try:
         # Generate embedding from the prompt
-        # Using encode() for query embedding (standard SentenceTransformer method)
-        embedding = model.encode(request.prompt)
-        # Convert numpy array to list for JSON serialization
-        if isinstance(embedding, np.ndarray):
-            if embedding.ndim == 1:
-                embedding_list = embedding.tolist()
-            else:
-                # If batch, take first item
-                embedding_list = embedding[0].tolist()
-        else:
-            embedding_list = list(embedding)
+        embedding_list = embed_query(request.prompt, version)
         
-        # Call the Postgres function via Supabase RPC
+        # Over-fetch candidates when diversifying, since re-ranking drops redundant ones
+        match_count = request.match_count
+        if request.diversify:
+            match_count = min(request.fetch_k or request.match_count * 4, MAX_FETCH_K)
+        
+        # Call the Postgres function through the document store
         rpc_params = {
             "query_embedding": embedding_list,
-            "match_count": request.match_count,
+            "match_count": match_count,
             "match_threshold": request.match_threshold
         }
         
+        # Re-ranking needs the candidates' stored vectors (migrations/004_match_include_embedding.sql)
+        if request.diversify:
+            rpc_params["include_embedding"] = True
+        
         # Add user_id filter if provided
         if request.user_id:
             rpc_params["filter_user_id"] = request.user_id
         
-        response = supabase.rpc("match_documents", rpc_params).execute()
+        rpc_name = "match_documents"
+        if version != constants.DOCUMENTS_EMBEDDING_VERSION:
+            rpc_name = "match_document_embeddings"
+            rpc_params["embedding_version"] = version
+        
+        with stage("retrieve.rpc"):
+            rows = document_store.rpc(rpc_name, rpc_params)
+        
+        if request.diversify:
+            with stage("retrieve.rerank"):
+                rows = diversify(
+                    rows,
+                    version,
+                    request.match_count,
+                    request.mmr_lambda,
+                    request.dedup_threshold
+                )
         
         # Parse the response
-        matches = [
-            DocumentMatch(**match) for match in response.data
-        ]
+        with stage("retrieve.parse"):
+            matches = [
+                DocumentMatch(**match) for match in rows
+            ]
         
         return RetrieveResponse(
             matches=matches,
@@ -165,6 +249,71 @@ def retrieve_documents(request: RetrieveRequest):
         )
 
 
+@app.get("/embeddings/versions", response_model=EmbeddingVersionsResponse)
+def list_embedding_versions():
+    """
+    List configured embedding versions and which ones are used for storage, retrieval and dual-writes.
+    """
+    return EmbeddingVersionsResponse(
+        versions=constants.EMBEDDING_MODELS,
+        documents_version=constants.DOCUMENTS_EMBEDDING_VERSION,
+        default_version=constants.DEFAULT_EMBEDDING_VERSION,
+        ingest_version=ingestion.ingest_version,
+        dual_write_versions=ingestion.dual_write_versions
+    )
+
+
+@app.post("/embeddings/reembed", response_model=ReembedStatus)
+def start_reembed(request: ReembedRequest):
+    """
+    Start a throttled background job that backfills an embedding version for all existing documents.
+    
+    Documents that already have an embedding for the version are skipped, so the job can be
+    restarted safely. Dual-write versions already have a following job that backfills them;
+    cancel it first to restart it with a different throughput cap. The restarted job keeps
+    following unless the request sets "follow": false.
+    """
+    follow = request.follow
+    if follow is None:
+        follow = request.version in ingestion.dual_write_versions
+    try:
+        job = start_reembedding(
+            request.version,
+            batch_size=request.batch_size,
+            max_docs_per_second=request.max_docs_per_second,
+            follow=follow
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    return ReembedStatus(**job.status())
+
+
+@app.get("/embeddings/reembed/{version}", response_model=ReembedStatus)
+def get_reembed_status(version: str):
+    """
+    Get the status of the most recent re-embedding job for a version.
+    """
+    job = reembedding_jobs.get(version)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No re-embedding job found for '{version}'")
+    
+    return ReembedStatus(**job.status())
+
+
+@app.delete("/embeddings/reembed/{version}", response_model=ReembedStatus)
+def cancel_reembed(version: str):
+    """
+    Cancel a running re-embedding job. Progress is kept; a new job resumes where it stopped.
+    """
+    job = reembedding_jobs.get(version)
+    if job is None or not job.is_running:
+        raise HTTPException(status_code=404, detail=f"No running re-embedding job for '{version}'")
+    
+    job.cancel()
+    return ReembedStatus(**job.status())
+
+
 @app.post("/slack/channels", response_model=SlackChannelsResponse)
 def list_slack_channels(request: SlackChannelsRequest):
     """
@@ -174,32 +323,10 @@ def list_slack_channels(request: SlackChannelsRequest):
     Requires a Slack bot token with appropriate scopes.
     """
     try:
-        client = WebClient(token=request.slack_bot_token)
+        client = create_slack_client(request.slack_bot_token)
         
         # Fetch channels that the bot is a member of (public and private)
-        # users_conversations only returns channels the bot is already in
-        all_channels = []
-        cursor = None
-        
-        while True:
-            response = client.users_conversations(
-                types="public_channel,private_channel",
-                exclude_archived=True,
-                cursor=cursor
-            )
-            
-            if not response["ok"]:
-                raise HTTPException(
-                    status_code=500,
-                    detail=f"Failed to list channels: {response.get('error', 'Unknown error')}"
-                )
-            
-            all_channels.extend(response.get("channels", []))
-            
-            # Check for pagination
-            cursor = response.get("response_metadata", {}).get("next_cursor")
-            if not cursor:
-                break
+        all_channels = list_member_channels(client)
         
         # Parse channels
         channels = [
@@ -210,7 +337,6 @@ def list_slack_channels(request: SlackChannelsRequest):
                 is_archived=channel.get("is_archived", False)
             )
             for channel in all_channels
-            if not channel.get("is_archived", False)  # Filter out archived channels
         ]
         
         return SlackChannelsResponse(channels=channels)
@@ -235,6 +361,30 @@ def list_slack_channels(request: SlackChannelsRequest):
         )
 
 
+@app.post("/slack/sync", response_model=SlackSyncResponse)
+def sync_slack_workspace(request: SlackSyncRequest):
+    """
+    Incrementally sync many Slack channels in one call.
+    
+    Channels (every channel the bot is in, unless channel_ids is given) are synced by a bounded
+    worker pool, stalest first, sharing one rate limit budget and one user directory for the
+    token. Returns per-channel progress and throughput; store each channel's latest_ts and pass it
+    back in 'since' to fetch only new messages next time. Messages are upserted by channel and ts,
+    so retrying a channel that failed part way does not duplicate what was already stored.
+    """
+    return sync_workspace(request)
+
+
+@app.get("/metrics")
+def get_metrics():
+    """
+    Expose Prometheus metrics (stage latencies, batch sizes, embedding throughput,
+    cache hit rates and Slack rate limit waits) in the text exposition format.
+    """
+    payload, content_type = render_latest()
+    return Response(content=payload, media_type=content_type)
+
+
 @app.get("/health")
 def health_check():
     return {"status": "ok"}
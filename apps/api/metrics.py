@@ -0,0 +1,161 @@
+"""
+Prometheus metrics and per-request stage timing.
+Provides module-level metric instances and a `stage` context manager that can be used across the codebase.
+"""
+import random
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, Optional
+from prometheus_client import Counter, Histogram, CONTENT_TYPE_LATEST, generate_latest
+import constants
+
+# Buckets tuned for stages ranging from sub-millisecond JSON conversion to multi-second Slack pagination
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+BATCH_SIZE_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 200, 500, 1000)
+
+# Usage: with stage("slack.history"): client.conversations_history(...)
+STAGE_SECONDS = Histogram(
+    "cerium_stage_seconds",
+    "Time spent in each processing stage",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+
+REQUEST_SECONDS = Histogram(
+    "cerium_request_seconds",
+    "End-to-end HTTP request latency",
+    ["method", "path", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+BATCH_SIZE = Histogram(
+    "cerium_batch_size",
+    "Number of items processed per batch",
+    ["stage"],
+    buckets=BATCH_SIZE_BUCKETS,
+)
+
+EMBEDDED_TOKENS = Counter(
+    "cerium_embedded_tokens_total",
+    "Number of tokens passed through the embedding model (estimated from sampled calls)",
+    ["kind"],
+)
+
+EMBEDDING_TOKENS_PER_SECOND = Histogram(
+    "cerium_embedding_tokens_per_second",
+    "Embedding throughput per model call",
+    ["kind"],
+    buckets=(100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000),
+)
+
+CACHE_REQUESTS = Counter(
+    "cerium_cache_requests_total",
+    "Cache lookups by cache name and result (hit or miss)",
+    ["cache", "result"],
+)
+
+SLACK_RATE_LIMITED = Counter(
+    "cerium_slack_rate_limited_total",
+    "Slack Web API responses that were rate limited (HTTP 429)",
+)
+
+SLACK_RATE_LIMIT_WAIT_SECONDS = Histogram(
+    "cerium_slack_rate_limit_wait_seconds",
+    "Time spent waiting on Slack Retry-After before retrying",
+    buckets=(0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 120.0),
+)
+
+# Per-request stage breakdown, only populated when a request opts in
+# The dict is shared by reference so threadpool workers that copy the context still write into it
+_breakdown: ContextVar[Optional[Dict[str, float]]] = ContextVar("cerium_stage_breakdown", default=None)
+
+
+@contextmanager
+def stage(name: str) -> Iterator[None]:
+    """
+    Time a block of code and record it under the given stage name.
+
+    Args:
+        name: Stage name, e.g. "ingest.encode" or "retrieve.rpc"
+    """
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(stage=name).observe(elapsed)
+        breakdown = _breakdown.get()
+        if breakdown is not None:
+            breakdown[name] = breakdown.get(name, 0.0) + elapsed
+
+
+def record_cache(cache: str, hit: bool) -> None:
+    """Record a single cache lookup result."""
+    CACHE_REQUESTS.labels(cache=cache, result="hit" if hit else "miss").inc()
+
+
+def should_count_tokens() -> bool:
+    """
+    Decide whether the next embedding call is sampled for token metrics.
+
+    Returns:
+        True for about EMBEDDING_TOKEN_SAMPLE_RATE of calls
+    """
+    rate = constants.EMBEDDING_TOKEN_SAMPLE_RATE
+    return rate >= 1 or (rate > 0 and random.random() < rate)
+
+
+def record_embedding(kind: str, token_count: int, seconds: float) -> None:
+    """
+    Record token volume and throughput for one sampled embedding model call.
+
+    The token counter is scaled by the sample rate, so it estimates the tokens of all calls.
+
+    Args:
+        kind: "document" or "query"
+        token_count: Number of non-padding tokens in the batch
+        seconds: Wall time of the forward pass
+    """
+    rate = constants.EMBEDDING_TOKEN_SAMPLE_RATE
+    EMBEDDED_TOKENS.labels(kind=kind).inc(token_count / rate if 0 < rate < 1 else token_count)
+    if seconds > 0:
+        EMBEDDING_TOKENS_PER_SECOND.labels(kind=kind).observe(token_count / seconds)
+
+
+def start_breakdown() -> Dict[str, float]:
+    """
+    Start collecting a per-request stage breakdown in the current context.
+
+    Returns:
+        The dict that stage timings for this request will be accumulated into
+    """
+    breakdown: Dict[str, float] = {}
+    _breakdown.set(breakdown)
+    return breakdown
+
+
+def format_server_timing(breakdown: Dict[str, float]) -> str:
+    """
+    Format a stage breakdown as a Server-Timing header value (durations in milliseconds).
+
+    Args:
+        breakdown: Mapping of stage name to accumulated seconds
+
+    Returns:
+        Header value, e.g. "slack.history;dur=120.5, ingest.encode;dur=310.2"
+    """
+    return ", ".join(
+        f"{name.replace(' ', '_')};dur={seconds * 1000:.1f}"
+        for name, seconds in breakdown.items()
+    )
+
+
+def render_latest() -> tuple:
+    """
+    Render all registered metrics in the Prometheus text exposition format.
+
+    Returns:
+        Tuple of (payload bytes, content type)
+    """
+    return generate_latest(), CONTENT_TYPE_LATEST
@@ -0,0 +1,78 @@
+-- Versioned embedding spaces.
+--
+-- documents.embedding keeps holding the original model's vectors. Every other embedding version gets
+-- one row per document here, so a new model can be backfilled and A/B tested next to the old one and
+-- cut over (DEFAULT_EMBEDDING_VERSION) without a stop-the-world re-embed.
+--
+-- Run in the Supabase SQL editor (or psql) once before enabling DUAL_WRITE_EMBEDDING_VERSIONS.
+
+create table if not exists document_embeddings (
+  document_id bigint not null references documents (id) on delete cascade,
+  version text not null,
+  -- Untyped dimension so versions of different sizes can share the table
+  embedding vector not null,
+  created_at timestamptz not null default now(),
+  primary key (document_id, version)
+);
+
+-- ANN indexes need a fixed dimension, so create one partial index per version, e.g.:
+-- create index document_embeddings_minilm_l6_hnsw on document_embeddings
+--   using hnsw ((embedding::vector(384)) vector_cosine_ops) where version = 'minilm-l6';
+
+create or replace function match_document_embeddings (
+  query_embedding vector,
+  match_count int,
+  match_threshold float,
+  embedding_version text,
+  filter_user_id text default null
+)
+returns table (
+  id bigint,
+  content text,
+  user_name text,
+  slack_ts double precision,
+  created_at timestamptz,
+  similarity float
+)
+language sql stable
+as $$
+  select
+    d.id,
+    d.content,
+    d.user_name,
+    d.slack_ts,
+    d.created_at,
+    1 - (e.embedding <=> query_embedding) as similarity
+  from document_embeddings e
+  join documents d on d.id = e.document_id
+  where e.version = embedding_version
+    and (filter_user_id is null or d.user_id = filter_user_id)
+    and 1 - (e.embedding <=> query_embedding) > match_threshold
+  order by e.embedding <=> query_embedding
+  limit match_count;
+$$;
+
+-- Keyset-paginated scan used by the background re-embedding job
+create or replace function documents_missing_embedding (
+  embedding_version text,
+  after_id bigint,
+  batch_size int
+)
+returns table (
+  id bigint,
+  content text,
+  user_id text,
+  slack_ts double precision
+)
+language sql stable
+as $$
+  select d.id, d.content, d.user_id, d.slack_ts
+  from documents d
+  where d.id > after_id
+    and not exists (
+      select 1 from document_embeddings e
+      where e.document_id = d.id and e.version = embedding_version
+    )
+  order by d.id
+  limit batch_size;
+$$;
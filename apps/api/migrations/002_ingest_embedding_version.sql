@@ -0,0 +1,9 @@
+-- Retiring the documents.embedding write.
+--
+-- Once retrieval has cut over to another version (DEFAULT_EMBEDDING_VERSION), set
+-- INGEST_EMBEDDING_VERSION to that version so ingestion stops running the original model. New documents
+-- are then stored with a null documents.embedding and their vector in document_embeddings.
+--
+-- Run once before changing INGEST_EMBEDDING_VERSION.
+
+alter table documents alter column embedding drop not null;
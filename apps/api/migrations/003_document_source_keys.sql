@@ -0,0 +1,35 @@
+-- Idempotent ingestion.
+--
+-- Extractors tag each document with a source key (e.g. "slack:C123:1700000000.000100",
+-- "github:owner/repo:issue:42", "drive:<file id>:0"). Ingestion upserts on (source_owner, source_key),
+-- so re-running a sync that failed part way, or re-ingesting a changed document, updates the existing
+-- row instead of adding a duplicate. Documents without a key (null source_key) never conflict.
+--
+-- Run once before deploying the version of the API that writes source_key.
+
+alter table documents add column if not exists source_key text;
+
+-- Keys are scoped per owner. A generated column because unique indexes treat null user_ids as distinct.
+alter table documents add column if not exists source_owner text
+  generated always as (coalesce(user_id, '')) stored;
+
+create unique index if not exists documents_source_key_idx on documents (source_owner, source_key);
+
+-- A document whose content changed no longer matches its embeddings in other versions; drop them so
+-- the re-embedding jobs (which scan for documents missing a version) embed the new content
+create or replace function documents_drop_stale_embeddings()
+returns trigger
+language plpgsql
+as $$
+begin
+  if new.content is distinct from old.content then
+    delete from document_embeddings where document_id = new.id;
+  end if;
+  return new;
+end;
+$$;
+
+drop trigger if exists documents_content_changed on documents;
+create trigger documents_content_changed
+  after update of content on documents
+  for each row execute function documents_drop_stale_embeddings();
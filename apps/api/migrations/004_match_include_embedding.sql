@@ -0,0 +1,84 @@
+-- Return candidate vectors for re-ranking.
+--
+-- /retrieve with diversify=true re-ranks its over-fetched candidates by maximal marginal relevance,
+-- which needs their embeddings. Passing include_embedding => true makes the match functions return
+-- the stored vector with each row, so the API does not re-encode every candidate; by default the
+-- column is null and nothing extra is sent.
+--
+-- Adding a parameter changes the function signatures, so the old versions are dropped first
+-- (otherwise PostgREST sees two overloads). If match_documents was created with a different
+-- argument list, adjust its drop statement to match.
+--
+-- Run once before deploying the version of the API that sends include_embedding.
+
+drop function if exists match_documents (vector, int, float, text);
+drop function if exists match_document_embeddings (vector, int, float, text, text);
+
+create or replace function match_documents (
+  query_embedding vector,
+  match_count int,
+  match_threshold float,
+  filter_user_id text default null,
+  include_embedding boolean default false
+)
+returns table (
+  id bigint,
+  content text,
+  user_name text,
+  slack_ts double precision,
+  created_at timestamptz,
+  similarity float,
+  embedding vector
+)
+language sql stable
+as $$
+  select
+    d.id,
+    d.content,
+    d.user_name,
+    d.slack_ts,
+    d.created_at,
+    1 - (d.embedding <=> query_embedding) as similarity,
+    case when include_embedding then d.embedding end as embedding
+  from documents d
+  where (filter_user_id is null or d.user_id = filter_user_id)
+    and 1 - (d.embedding <=> query_embedding) > match_threshold
+  order by d.embedding <=> query_embedding
+  limit match_count;
+$$;
+
+create or replace function match_document_embeddings (
+  query_embedding vector,
+  match_count int,
+  match_threshold float,
+  embedding_version text,
+  filter_user_id text default null,
+  include_embedding boolean default false
+)
+returns table (
+  id bigint,
+  content text,
+  user_name text,
+  slack_ts double precision,
+  created_at timestamptz,
+  similarity float,
+  embedding vector
+)
+language sql stable
+as $$
+  select
+    d.id,
+    d.content,
+    d.user_name,
+    d.slack_ts,
+    d.created_at,
+    1 - (e.embedding <=> query_embedding) as similarity,
+    case when include_embedding then e.embedding end as embedding
+  from document_embeddings e
+  join documents d on d.id = e.document_id
+  where e.version = embedding_version
+    and (filter_user_id is null or d.user_id = filter_user_id)
+    and 1 - (e.embedding <=> query_embedding) > match_threshold
+  order by e.embedding <=> query_embedding
+  limit match_count;
+$$;
@@ -0,0 +1,34 @@
+-- Export of stored embeddings.
+--
+-- The local embedding store (LOCAL_EMBEDDING_STORE_PATH) only mirrors documents ingested while it is
+-- configured. export_local_store.py backfills it by paging through a version's stored vectors in id
+-- order with this function: documents.embedding for the documents.embedding version
+-- (in_documents => true), document_embeddings for every other version.
+--
+-- Run once before running export_local_store.py.
+
+create or replace function document_embeddings_after (
+  embedding_version text,
+  in_documents boolean,
+  after_id bigint,
+  batch_size int
+)
+returns table (
+  id bigint,
+  user_id text,
+  slack_ts double precision,
+  embedding vector
+)
+language sql stable
+as $$
+  select d.id, d.user_id, d.slack_ts, d.embedding
+  from documents d
+  where in_documents and d.id > after_id and d.embedding is not null
+  union all
+  select d.id, d.user_id, d.slack_ts, e.embedding
+  from document_embeddings e
+  join documents d on d.id = e.document_id
+  where not in_documents and e.version = embedding_version and e.document_id > after_id
+  order by id
+  limit batch_size;
+$$;
@@ -1,8 +1,11 @@
 from pydantic import BaseModel, Field
-from typing import Optional, List
+from typing import Optional, List, Dict
 from enum import Enum
 from datetime import datetime
 
+# Upper bound on the candidates /retrieve over-fetches for re-ranking
+MAX_FETCH_K = 200
+
 
 class ServiceType(str, Enum):
     """Supported service types for extraction."""
@@ -18,18 +21,29 @@ class ExtractRequest(BaseModel):
     slack_bot_token: Optional[str] = Field(default=None, description="Slack bot token (if not provided, uses configured token)")
     conversation_name: Optional[str] = Field(default=None, description="Channel name, private group name, or username/email for DM (Slack)")
     conversation_type: Optional[str] = Field(default=None, description="Type: 'channel', 'group', or 'im' (DM) (Slack)")
-    limit: Optional[int] = Field(default=100, description="Number of items to retrieve")
+    limit: Optional[int] = Field(default=100, description="Number of items to retrieve (Slack; GitHub and Google syncs fetch everything new since their last sync)")
     oldest: Optional[float] = Field(default=None, description="Oldest timestamp to include")
     latest: Optional[float] = Field(default=None, description="Latest timestamp to include")
     cursor: Optional[str] = Field(default=None, description="Pagination cursor for next page")
+    # GitHub-specific fields (optional, only required when service is 'github')
+    github_token: Optional[str] = Field(default=None, description="GitHub token (if not provided, uses configured token)")
+    repository: Optional[str] = Field(default=None, description="Repository to sync as 'owner/name' (GitHub)")
+    # Google-specific fields (optional, only used when service is 'google')
+    google_access_token: Optional[str] = Field(default=None, description="Google OAuth access token (if not provided, uses configured token)")
+    google_sources: Optional[List[str]] = Field(default=None, description="Google sources to sync: 'drive' and/or 'gmail' (defaults to both)")
 
 
 class RetrieveRequest(BaseModel):
     """Request model for semantic search retrieval."""
     prompt: str = Field(..., description="The user prompt to search for")
     user_id: Optional[str] = Field(default=None, description="User ID to filter documents by. If provided, only searches documents belonging to this user.")
-    match_count: Optional[int] = Field(default=5, description="Number of documents to retrieve")
+    match_count: Optional[int] = Field(default=5, ge=1, description="Number of documents to retrieve")
     match_threshold: Optional[float] = Field(default=0.7, description="Minimum similarity threshold (0-1)")
+    embedding_version: Optional[str] = Field(default=None, description="Embedding version to search. If not provided, uses the configured default version.")
+    diversify: bool = Field(default=False, description="Collapse near-duplicates and re-rank with maximal marginal relevance (MMR)")
+    fetch_k: Optional[int] = Field(default=None, ge=1, le=MAX_FETCH_K, description=f"Candidates fetched before diversifying (defaults to 4x match_count, at most {MAX_FETCH_K})")
+    mmr_lambda: float = Field(default=0.5, ge=0, le=1, description="MMR trade-off between relevance (1.0) and diversity (0.0)")
+    dedup_threshold: float = Field(default=0.95, gt=0, le=1, description="Cosine similarity at or above which candidates are collapsed as near-duplicates")
 
 
 class DocumentMatch(BaseModel):
@@ -40,6 +54,7 @@ class DocumentMatch(BaseModel):
     slack_ts: Optional[float] = None
     created_at: datetime
     similarity: float
+    duplicate_count: int = Field(default=0, description="Near-duplicates collapsed into this match (only when diversify is set)")
 
 
 class RetrieveResponse(BaseModel):
@@ -48,6 +63,37 @@ class RetrieveResponse(BaseModel):
     count: int
 
 
+class EmbeddingVersionsResponse(BaseModel):
+    """Response model for listing embedding versions."""
+    versions: Dict[str, str] = Field(..., description="Embedding version name -> model name")
+    documents_version: str = Field(..., description="Version stored in documents.embedding")
+    default_version: str = Field(..., description="Version used by /retrieve when none is requested")
+    ingest_version: str = Field(..., description="Version embedded synchronously by ingestion")
+    dual_write_versions: List[str] = Field(..., description="Versions embedded for new documents by background jobs")
+
+
+class ReembedRequest(BaseModel):
+    """Request model for starting a background re-embedding job."""
+    version: str = Field(..., description="Embedding version to backfill")
+    batch_size: int = Field(default=256, ge=1, le=4096, description="Documents fetched and embedded per batch")
+    max_docs_per_second: Optional[float] = Field(default=None, gt=0, description="Throughput cap (no cap if not provided)")
+    follow: Optional[bool] = Field(default=None, description="Keep embedding newly ingested documents once caught up (defaults to true for dual-write versions)")
+
+
+class ReembedStatus(BaseModel):
+    """Status of a background re-embedding job."""
+    version: str
+    state: str = Field(..., description="'running', 'completed', 'cancelled' or 'failed'")
+    follow: bool = Field(default=False, description="Whether the job keeps embedding newly ingested documents (dual-write versions)")
+    processed: int
+    last_id: int
+    docs_per_second: float
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    error: Optional[str] = Field(default=None, description="Why the job failed, or the last error a following job is retrying after")
+    consecutive_failures: int = Field(default=0, description="Failed batches in a row a following job is backing off from")
+
+
 class SlackChannelsRequest(BaseModel):
     """Request model for listing Slack channels."""
     slack_bot_token: str = Field(..., description="Slack bot token")
@@ -64,3 +110,36 @@ class SlackChannel(BaseModel):
 class SlackChannelsResponse(BaseModel):
     """Response model for Slack channels list."""
     channels: List[SlackChannel]
+
+
+class SlackSyncRequest(BaseModel):
+    """Request model for syncing many Slack channels in one call."""
+    slack_bot_token: str = Field(..., description="Slack bot token")
+    user_id: Optional[str] = Field(default=None, description="ID of the user who owns the extracted data")
+    channel_ids: Optional[List[str]] = Field(default=None, description="Channels to sync. If not provided, syncs every channel the bot is a member of.")
+    since: Dict[str, float] = Field(default_factory=dict, description="Per-channel watermark: only messages newer than this Slack timestamp are synced")
+    max_workers: Optional[int] = Field(default=None, ge=1, le=32, description="Channels synced concurrently (defaults to SLACK_SYNC_MAX_WORKERS)")
+    page_size: int = Field(default=200, ge=1, le=999, description="Messages fetched per conversations.history call")
+
+
+class SlackChannelSyncResult(BaseModel):
+    """Progress and throughput for one synced channel."""
+    channel_id: str
+    name: str
+    pages: int
+    message_count: int
+    ingested_count: int
+    latest_ts: Optional[float] = Field(default=None, description="Newest synced Slack timestamp; pass it back in 'since' for the next incremental sync")
+    seconds: float
+    messages_per_second: float
+    error: Optional[str] = Field(default=None, description="Why the job failed, or the last error a following job is retrying after")
+    consecutive_failures: int = Field(default=0, description="Failed batches in a row a following job is backing off from")
+
+
+class SlackSyncResponse(BaseModel):
+    """Response model for a workspace sync."""
+    channels: List[SlackChannelSyncResult]
+    total_messages: int
+    total_ingested: int
+    seconds: float
+    messages_per_second: float
@@ -0,0 +1,48 @@
+"""
+Compact records streamed from extractors into ingestion.
+
+Extractors yield one DocumentRecord per document (or per chunk of a long document) instead of
+returning whole pages, so memory stays constant no matter how much a sync fetches. A tombstone
+record asks ingestion to delete the document stored under its key instead.
+"""
+from typing import Optional
+
+
+class DocumentRecord:
+    """
+    One document to embed and store. Uses __slots__ to avoid a per-record __dict__.
+    """
+
+    __slots__ = ("content", "user_name", "slack_ts", "key", "deleted")
+
+    def __init__(
+        self,
+        content: str,
+        user_name: Optional[str] = None,
+        slack_ts: Optional[float] = None,
+        key: Optional[str] = None,
+        deleted: bool = False
+    ):
+        """
+        Args:
+            content: Text to embed
+            user_name: Author name stored with the document
+            slack_ts: Slack message timestamp (Slack only)
+            key: Source key the document is upserted on, e.g. "drive:<file id>:0"
+            deleted: Whether this is a tombstone for the document stored under key
+        """
+        self.content = content
+        self.user_name = user_name
+        self.slack_ts = slack_ts
+        self.key = key
+        self.deleted = deleted
+
+    @classmethod
+    def tombstone(cls, key: str) -> "DocumentRecord":
+        """A record that deletes the document stored under key (e.g. a removed file's chunk)."""
+        return cls(content="", key=key, deleted=True)
+
+    def __repr__(self) -> str:
+        if self.deleted:
+            return f"DocumentRecord.tombstone({self.key!r})"
+        return f"DocumentRecord(key={self.key!r}, user_name={self.user_name!r}, content={self.content[:40]!r})"
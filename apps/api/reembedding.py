@@ -0,0 +1,290 @@
+"""
+Background re-embedding of existing documents into a new embedding version.
+
+The job walks documents that have no embedding for the target version in id order (keyset
+pagination via the documents_missing_embedding function), embeds them in large batches and writes
+them to document_embeddings. It is throttled to a maximum documents/sec so it does not starve
+live ingestion or retrieval of CPU and database capacity.
+
+Dual-write versions (DUAL_WRITE_EMBEDDING_VERSIONS) are kept current by the same jobs running in
+follow mode: once caught up they wait to be woken by ingestion (or poll every DUAL_WRITE_POLL_SECONDS
+for documents ingested by other processes), so shadow models never run on the ingest request path.
+A following job retries failed batches with exponential back-off instead of stopping, and only one
+process per host runs them (see start_dual_write_jobs).
+"""
+import fcntl
+import logging
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+import constants
+from ingestion import ingestion
+from metrics import stage, BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class ReembeddingJob:
+    """
+    Throttled backfill of one embedding version, run on a daemon thread.
+    """
+
+    def __init__(
+        self,
+        version: str,
+        batch_size: int = 256,
+        max_docs_per_second: Optional[float] = None,
+        follow: bool = False
+    ):
+        """
+        Args:
+            version: Embedding version to backfill
+            batch_size: Documents fetched and embedded per batch
+            max_docs_per_second: Throughput cap (None for no cap)
+            follow: Keep running once caught up and embed newly ingested documents as they arrive
+        """
+        self.version = version
+        self.batch_size = batch_size
+        self.max_docs_per_second = max_docs_per_second
+        self.follow = follow
+        self.state = "pending"
+        self.processed = 0
+        self.last_id = 0
+        self.error: Optional[str] = None
+        self.started_at: Optional[datetime] = None
+        self.finished_at: Optional[datetime] = None
+        self.consecutive_failures = 0
+        self._cancelled = threading.Event()
+        self._wakeup = threading.Event()
+        self._rescan_after: Optional[int] = None
+        self._rescan_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> None:
+        self.state = "running"
+        self.started_at = datetime.now(timezone.utc)
+        self._thread = threading.Thread(target=self._run, name=f"reembed-{self.version}", daemon=True)
+        self._thread.start()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+        self._wakeup.set()
+
+    def notify(self, document_ids: List[int]) -> None:
+        """
+        Wake a following job because documents were stored.
+
+        Args:
+            document_ids: Ids of the stored documents. Ids at or below the job's position were
+                updated in place (re-ingested) and are rescanned
+        """
+        if document_ids:
+            lowest = min(document_ids)
+            with self._rescan_lock:
+                if lowest <= self.last_id:
+                    self._rescan_after = lowest - 1 if self._rescan_after is None else min(self._rescan_after, lowest - 1)
+        self._wakeup.set()
+
+    def status(self) -> dict:
+        elapsed = None
+        if self.started_at:
+            elapsed = ((self.finished_at or datetime.now(timezone.utc)) - self.started_at).total_seconds()
+        return {
+            "version": self.version,
+            "state": self.state,
+            "follow": self.follow,
+            "processed": self.processed,
+            "last_id": self.last_id,
+            "docs_per_second": round(self.processed / elapsed, 2) if elapsed else 0.0,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "consecutive_failures": self.consecutive_failures,
+        }
+
+    def _run_batch(self) -> bool:
+        """
+        Fetch, embed and store the next batch of documents missing the version.
+
+        Returns:
+            False if there was nothing left to embed
+        """
+        batch_start = time.perf_counter()
+
+        with self._rescan_lock:
+            if self._rescan_after is not None:
+                self.last_id = min(self.last_id, self._rescan_after)
+                self._rescan_after = None
+
+        with stage("reembed.fetch"):
+            rows = ingestion.store.rpc("documents_missing_embedding", {
+                "embedding_version": self.version,
+                "after_id": self.last_id,
+                "batch_size": self.batch_size,
+            })
+        if not rows:
+            return False
+
+        BATCH_SIZE.labels(stage="reembed.fetch").observe(len(rows))
+        embeddings = ingestion.encode_documents(
+            [row["content"] for row in rows],
+            self.version,
+            stage_prefix="reembed",
+        )
+        ingestion.store_version_embeddings(self.version, rows, embeddings)
+
+        self.processed += len(rows)
+        self.last_id = rows[-1]["id"]
+
+        # Throttle: make each batch take at least len(rows) / max_docs_per_second seconds
+        if self.max_docs_per_second:
+            remaining = len(rows) / self.max_docs_per_second - (time.perf_counter() - batch_start)
+            if remaining > 0:
+                self._cancelled.wait(remaining)
+        return True
+
+    def _run(self) -> None:
+        try:
+            while not self._cancelled.is_set():
+                try:
+                    found = self._run_batch()
+                except Exception as e:
+                    if not self.follow:
+                        raise
+                    # A following job is its version's only writer, so a transient error (a database
+                    # timeout or restart) must not stop dual-writes: back off and retry the batch
+                    self.consecutive_failures += 1
+                    self.error = str(e)
+                    delay = min(2 ** (self.consecutive_failures - 1), constants.DUAL_WRITE_RETRY_MAX_SECONDS)
+                    logger.exception(
+                        "Re-embedding batch for version %s failed (%d in a row), retrying in %.0fs",
+                        self.version, self.consecutive_failures, delay
+                    )
+                    self._cancelled.wait(delay)
+                    continue
+                self.consecutive_failures = 0
+                self.error = None
+                if not found:
+                    if not self.follow:
+                        break
+                    # Caught up: sleep until ingestion stores more documents (or the next poll)
+                    self._wakeup.wait(constants.DUAL_WRITE_POLL_SECONDS)
+                    self._wakeup.clear()
+
+            self.state = "cancelled" if self._cancelled.is_set() else "completed"
+        except Exception as e:
+            logger.exception("Re-embedding into version %s failed after %d documents", self.version, self.processed)
+            self.state = "failed"
+            self.error = str(e)
+        finally:
+            self.finished_at = datetime.now(timezone.utc)
+
+
+# Most recent job per version
+# Usage: from reembedding import start_reembedding; job = start_reembedding("minilm-l6")
+reembedding_jobs: Dict[str, ReembeddingJob] = {}
+_jobs_lock = threading.Lock()
+
+
+def start_reembedding(
+    version: str,
+    batch_size: int = 256,
+    max_docs_per_second: Optional[float] = None,
+    follow: bool = False
+) -> ReembeddingJob:
+    """
+    Start a background backfill for an embedding version.
+
+    Args:
+        version: Embedding version to backfill (must not be the documents.embedding version)
+        batch_size: Documents fetched and embedded per batch
+        max_docs_per_second: Throughput cap (None for no cap)
+        follow: Keep the job running to embed newly ingested documents
+
+    Returns:
+        The started job
+
+    Raises:
+        ValueError: If the version is invalid or a job for it is already running
+    """
+    if version not in constants.EMBEDDING_MODELS:
+        raise ValueError(f"Unknown embedding version: '{version}'")
+    if version == constants.DOCUMENTS_EMBEDDING_VERSION:
+        raise ValueError(f"'{version}' is stored in documents.embedding and does not need re-embedding")
+
+    with _jobs_lock:
+        existing = reembedding_jobs.get(version)
+        if existing is not None and existing.is_running:
+            raise ValueError(f"A re-embedding job for '{version}' is already running")
+
+        job = ReembeddingJob(version, batch_size=batch_size, max_docs_per_second=max_docs_per_second, follow=follow)
+        reembedding_jobs[version] = job
+        job.start()
+        return job
+
+
+# Lock file held open while this process runs the dual-write jobs
+_dual_write_lock_file = None
+
+
+def _acquire_dual_write_lock() -> bool:
+    """Take the host-wide dual-write lock for the life of this process; False if another process holds it."""
+    global _dual_write_lock_file
+    if _dual_write_lock_file is not None:
+        return True
+    lock_file = open(constants.DUAL_WRITE_LOCK_PATH, "a")
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return False
+    # Released by the OS when the process exits, so a restarted worker takes over
+    _dual_write_lock_file = lock_file
+    return True
+
+
+def start_dual_write_jobs() -> List[ReembeddingJob]:
+    """
+    Start a following job for every dual-write version that does not have a running job yet.
+
+    Each job loads its version's model and backfills from the start, so they run in a single
+    process: only the API worker holding DUAL_WRITE_LOCK_PATH starts them, and none does where
+    DUAL_WRITE_JOBS_ENABLED is false. Documents ingested by other workers are picked up by the
+    DUAL_WRITE_POLL_SECONDS poll.
+
+    Usage: called once at application startup
+
+    Returns:
+        The jobs that were started (empty if another process runs them)
+    """
+    if not ingestion.dual_write_versions or not constants.DUAL_WRITE_JOBS_ENABLED:
+        return []
+    if not _acquire_dual_write_lock():
+        logger.info("Dual-write jobs are run by another process holding %s", constants.DUAL_WRITE_LOCK_PATH)
+        return []
+
+    started = []
+    for version in ingestion.dual_write_versions:
+        existing = reembedding_jobs.get(version)
+        if existing is not None and existing.is_running:
+            continue
+        started.append(start_reembedding(
+            version,
+            max_docs_per_second=constants.DUAL_WRITE_MAX_DOCS_PER_SECOND,
+            follow=True
+        ))
+    return started
+
+
+def _notify_dual_write_jobs(document_ids: List[int]) -> None:
+    for job in list(reembedding_jobs.values()):
+        if job.follow and job.is_running:
+            job.notify(document_ids)
+
+
+ingestion.add_insert_listener(_notify_dual_write_jobs)
@@ -0,0 +1,149 @@
+"""
+Redundancy-aware re-ranking of retrieved documents.
+
+Runs after match_documents on an over-fetched candidate set: near-duplicates of an already
+selected document are collapsed into it, and the rest are ordered by maximal marginal relevance
+(MMR) so the final matches are both relevant and diverse.
+"""
+from typing import List, Tuple
+import numpy as np
+from document_store import parse_vector
+from embeddings import get_model
+from embedding_store import get_embedding_store
+from metrics import record_cache
+
+
+def candidate_embeddings(rows: List[dict], version: str) -> np.ndarray:
+    """
+    Get L2-normalized embeddings for retrieved rows.
+
+    Embeddings come from the cheapest source that has them: the embedding column returned by
+    match_documents (include_embedding), then the local embedding store, and only then the
+    version's model for any rows neither has.
+
+    Args:
+        rows: Rows returned by match_documents (with id, content and optionally embedding)
+        version: Embedding version the rows were retrieved with
+
+    Returns:
+        Array of shape [len(rows), dim] with unit-length rows
+    """
+    embeddings = None
+    missing = set(range(len(rows)))
+
+    def fill(i: int, vector: np.ndarray) -> None:
+        nonlocal embeddings
+        if embeddings is None:
+            embeddings = np.full((len(rows), vector.shape[0]), np.nan, dtype=np.float32)
+        embeddings[i] = vector
+        missing.discard(i)
+
+    for i, row in enumerate(rows):
+        vector = parse_vector(row.get("embedding"))
+        if vector is not None:
+            fill(i, vector)
+
+    local_store = get_embedding_store(version)
+    if missing and local_store is not None and len(local_store) > 0:
+        wanted = sorted(missing)
+        for i, vector in zip(wanted, local_store.lookup([rows[i]["id"] for i in wanted])):
+            hit = not np.isnan(vector[0])
+            record_cache("rerank_local_embeddings", hit=hit)
+            if hit:
+                fill(i, vector)
+
+    if missing:
+        wanted = sorted(missing)
+        encoded = np.asarray(
+            get_model(version).encode_document([rows[i]["content"] for i in wanted]),
+            dtype=np.float32
+        )
+        for i, vector in zip(wanted, encoded):
+            fill(i, vector)
+
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+
+def mmr_select(
+    relevance: np.ndarray,
+    embeddings: np.ndarray,
+    k: int,
+    mmr_lambda: float,
+    dedup_threshold: float
+) -> Tuple[List[int], List[int]]:
+    """
+    Select up to k diverse candidates with maximal marginal relevance.
+
+    Each step picks argmax(lambda * relevance - (1 - lambda) * max similarity to the selected set).
+    Candidates at least dedup_threshold similar to a selected document are collapsed into it and
+    never selected.
+
+    Args:
+        relevance: Query similarity per candidate, shape [n]
+        embeddings: Unit-length candidate embeddings, shape [n, dim]
+        k: Maximum number of candidates to select
+        mmr_lambda: Trade-off between relevance (1.0) and diversity (0.0)
+        dedup_threshold: Cosine similarity at or above which candidates count as duplicates
+
+    Returns:
+        Tuple of (selected candidate indices in order, duplicates collapsed into each selection)
+    """
+    n = len(relevance)
+    pairwise = embeddings @ embeddings.T
+    max_similarity = np.full(n, -np.inf, dtype=np.float32)
+    available = np.ones(n, dtype=bool)
+    selected: List[int] = []
+    duplicate_counts: List[int] = []
+
+    while available.any() and len(selected) < k:
+        # Nothing is selected on the first step, so rank by relevance alone
+        redundancy = np.where(np.isfinite(max_similarity), max_similarity, 0.0)
+        scores = mmr_lambda * relevance - (1 - mmr_lambda) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+
+        duplicates = available & (pairwise[best] >= dedup_threshold)
+        duplicates[best] = False
+        available &= ~duplicates
+        available[best] = False
+
+        selected.append(best)
+        duplicate_counts.append(int(duplicates.sum()))
+        max_similarity = np.maximum(max_similarity, pairwise[best])
+
+    return selected, duplicate_counts
+
+
+def diversify(
+    rows: List[dict],
+    version: str,
+    match_count: int,
+    mmr_lambda: float,
+    dedup_threshold: float
+) -> List[dict]:
+    """
+    Re-rank over-fetched match_documents rows for diversity and collapse near-duplicates.
+
+    Args:
+        rows: Candidate rows ordered by similarity (each with id, content and similarity)
+        version: Embedding version the rows were retrieved with
+        match_count: Maximum number of rows to return
+        mmr_lambda: Trade-off between relevance (1.0) and diversity (0.0)
+        dedup_threshold: Cosine similarity at or above which candidates count as duplicates
+
+    Returns:
+        At most match_count rows (without their embedding), each with a duplicate_count of collapsed near-duplicates
+    """
+    if not rows:
+        return []
+
+    embeddings = candidate_embeddings(rows, version)
+    relevance = np.asarray([row["similarity"] for row in rows], dtype=np.float32)
+    selected, duplicate_counts = mmr_select(relevance, embeddings, match_count, mmr_lambda, dedup_threshold)
+
+    # The vectors were only needed for re-ranking; do not send them back to the client
+    return [
+        {**{key: value for key, value in rows[i].items() if key != "embedding"}, "duplicate_count": count}
+        for i, count in zip(selected, duplicate_counts)
+    ]
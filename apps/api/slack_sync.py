@@ -0,0 +1,189 @@
+"""
+Parallel incremental sync of many Slack channels.
+
+Channels are synced by a bounded worker pool, stalest first (never synced, then oldest watermark).
+Every worker shares the token's SlackWorkspace, so conversations.history calls draw from one rate
+limit budget and user names come from one user directory.
+
+Messages are ingested with "slack:<channel>:<ts>" source keys, so when a channel fails part way the
+pages already stored are updated in place, not duplicated, when the next sync retries from the
+unchanged watermark.
+"""
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, Optional
+from fastapi import HTTPException
+from slack_sdk.errors import SlackApiError
+import constants
+from helpers import SlackWorkspace, get_slack_workspace, list_member_channels, messages_to_records
+from ingestion import ingestion
+from metrics import stage, BATCH_SIZE
+from models import SlackSyncRequest, SlackSyncResponse, SlackChannelSyncResult
+from records import DocumentRecord
+
+
+def sync_channel(
+    workspace: SlackWorkspace,
+    channel: dict,
+    since: Optional[float],
+    page_size: int,
+    user_id: Optional[str]
+) -> SlackChannelSyncResult:
+    """
+    Fetch and ingest every message newer than the watermark in one channel.
+
+    Args:
+        workspace: Shared Slack state for the token
+        channel: Raw Slack channel object
+        since: Only sync messages newer than this Slack timestamp
+        page_size: Messages per conversations.history call
+        user_id: ID of the user who owns the ingested documents
+
+    Returns:
+        Per-channel progress; on error, latest_ts is left at the incoming watermark
+    """
+    start = time.perf_counter()
+    pages = 0
+    message_count = 0
+    ingested_count = 0
+    latest_ts = since
+    error = None
+
+    # Watermark of the messages fetched so far, only reported once the whole channel has been synced
+    newest = since
+
+    def fetch() -> Iterator[DocumentRecord]:
+        nonlocal pages, message_count, newest
+        cursor = None
+        while True:
+            params = {"channel": channel["id"], "limit": page_size}
+            if since is not None:
+                params["oldest"] = str(since)
+            if cursor:
+                params["cursor"] = cursor
+
+            workspace.rate_limiter.acquire()
+            with stage("slack.history"):
+                response = workspace.client.conversations_history(**params)
+
+            if not response["ok"]:
+                raise Exception(response.get("error", "Unknown error"))
+
+            messages = response.get("messages", [])
+            pages += 1
+            message_count += len(messages)
+            BATCH_SIZE.labels(stage="slack.history").observe(len(messages))
+
+            for message in messages:
+                if message.get("ts"):
+                    ts = float(message["ts"])
+                    newest = ts if newest is None else max(newest, ts)
+
+            yield from messages_to_records(messages, workspace.users, channel_id=channel["id"])
+
+            cursor = response.get("response_metadata", {}).get("next_cursor")
+            if not response.get("has_more") or not cursor:
+                break
+
+    try:
+        # The next page is fetched while the current micro-batch is embedded
+        with stage("sync.ingest"):
+            for document_ids in ingestion.ingest_stream(fetch(), user_id=user_id):
+                ingested_count += len(document_ids)
+
+        # Only advance the watermark once the whole channel has been synced
+        latest_ts = newest
+
+    except SlackApiError as e:
+        error = f"Slack API error: {e.response.get('error', str(e))}"
+    except Exception as e:
+        error = str(e)
+
+    seconds = time.perf_counter() - start
+    return SlackChannelSyncResult(
+        channel_id=channel["id"],
+        name=channel.get("name", ""),
+        pages=pages,
+        message_count=message_count,
+        ingested_count=ingested_count,
+        latest_ts=latest_ts,
+        seconds=round(seconds, 3),
+        messages_per_second=round(message_count / seconds, 2) if seconds > 0 else 0.0,
+        error=error
+    )
+
+
+def sync_workspace(request: SlackSyncRequest) -> SlackSyncResponse:
+    """
+    Sync many channels concurrently under one shared rate limit budget.
+
+    Args:
+        request: SlackSyncRequest with the token, channels and per-channel watermarks
+
+    Returns:
+        SlackSyncResponse with per-channel progress and overall throughput
+
+    Raises:
+        HTTPException: If the channel list cannot be fetched or requested channels are unknown
+    """
+    start = time.perf_counter()
+    workspace = get_slack_workspace(request.slack_bot_token)
+
+    try:
+        channels = list_member_channels(workspace.client)
+    except SlackApiError as e:
+        error_code = e.response.get("error")
+        raise HTTPException(
+            status_code=401 if error_code in ("not_authed", "invalid_auth", "invalid_token") else 500,
+            detail=f"Slack API error: {error_code or str(e)}"
+        )
+
+    if request.channel_ids is not None:
+        by_id = {channel["id"]: channel for channel in channels}
+        missing = [channel_id for channel_id in request.channel_ids if channel_id not in by_id]
+        if missing:
+            raise HTTPException(
+                status_code=404,
+                detail=f"Bot is not a member of channels: {', '.join(missing)}"
+            )
+        channels = [by_id[channel_id] for channel_id in request.channel_ids]
+
+    # Stalest channels first: never synced, then oldest watermark. conversations.list has no
+    # last-message time (its "updated" field changes on metadata edits), but the watermark we were
+    # given says how far behind each channel is
+    channels.sort(key=lambda channel: (channel["id"] in request.since, request.since.get(channel["id"], 0.0)))
+
+    # One users.list pass is far cheaper than a users.info call per author across many channels
+    try:
+        workspace.users.preload()
+    except SlackApiError:
+        # Fall back to lazy users.info lookups
+        pass
+
+    max_workers = request.max_workers or constants.SLACK_SYNC_MAX_WORKERS
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="slack-sync") as executor:
+        # Run each worker in a copy of this context so stage timings reach the request's breakdown
+        futures = [
+            executor.submit(
+                contextvars.copy_context().run,
+                sync_channel,
+                workspace,
+                channel,
+                request.since.get(channel["id"]),
+                request.page_size,
+                request.user_id
+            )
+            for channel in channels
+        ]
+        results = [future.result() for future in futures]
+
+    seconds = time.perf_counter() - start
+    total_messages = sum(result.message_count for result in results)
+    return SlackSyncResponse(
+        channels=results,
+        total_messages=total_messages,
+        total_ingested=sum(result.ingested_count for result in results),
+        seconds=round(seconds, 3),
+        messages_per_second=round(total_messages / seconds, 2) if seconds > 0 else 0.0
+    )
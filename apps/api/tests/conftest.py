@@ -0,0 +1,157 @@
+"""
+Shared test setup.
+
+The API modules connect to Supabase and download the embedding model at import time, so tests run
+against the same offline stand-ins as the benchmarks (in-memory Supabase, hashing embedder). They are
+installed before any test module imports the API.
+"""
+import os
+import sys
+
+API_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if API_DIR not in sys.path:
+    sys.path.insert(0, API_DIR)
+
+from benchmarks.run import install_stand_ins  # noqa: E402
+
+install_stand_ins(real_model=False)
+
+import threading  # noqa: E402
+from datetime import datetime, timezone  # noqa: E402
+from typing import Any, Dict, List, Optional, Sequence  # noqa: E402
+import pytest  # noqa: E402
+from document_store import DocumentStore  # noqa: E402
+
+
+class MemoryDocumentStore(DocumentStore):
+    """
+    In-memory DocumentStore with just enough Postgres semantics for ingestion tests: generated ids,
+    primary keys for ignore_duplicates, upserts on the source key index, column selection, deletes
+    (cascading to document_embeddings) and the functions the API calls.
+    """
+
+    PRIMARY_KEYS = {"documents": ("id",), "document_embeddings": ("document_id", "version")}
+
+    def __init__(self):
+        self.tables: Dict[str, List[dict]] = {"documents": [], "document_embeddings": []}
+        self._next_id = 1
+        self._lock = threading.Lock()
+
+    def insert(
+        self,
+        table: str,
+        rows: List[Dict[str, Any]],
+        ignore_duplicates: bool = False,
+        returning: Optional[Sequence[str]] = None,
+        on_conflict: Optional[Sequence[str]] = None
+    ) -> List[dict]:
+        inserted = []
+        with self._lock:
+            stored_rows = self.tables.setdefault(table, [])
+            for row in rows:
+                stored = dict(row)
+                if table == "documents":
+                    # Generated column from migrations/003_document_source_keys.sql
+                    stored["source_owner"] = stored.get("user_id") or ""
+                key_columns = tuple(on_conflict or self.PRIMARY_KEYS.get(table, ()))
+                key = tuple(stored.get(column) for column in key_columns)
+                existing = next(
+                    (
+                        candidate for candidate in stored_rows
+                        if None not in key and tuple(candidate.get(column) for column in key_columns) == key
+                    ),
+                    None
+                )
+                if existing is not None:
+                    if ignore_duplicates:
+                        continue
+                    if not on_conflict:
+                        raise ValueError(f"duplicate key {key} in {table}")
+                    if table == "documents" and existing.get("content") != stored.get("content"):
+                        # The documents_content_changed trigger
+                        self.tables["document_embeddings"] = [
+                            version_row for version_row in self.tables["document_embeddings"]
+                            if version_row["document_id"] != existing["id"]
+                        ]
+                    existing.update(stored)
+                    inserted.append(existing)
+                    continue
+                if table == "documents":
+                    stored["id"] = self._next_id
+                    stored["created_at"] = datetime.now(timezone.utc).isoformat()
+                    self._next_id += 1
+                stored_rows.append(stored)
+                inserted.append(stored)
+        return self._project(inserted, returning)
+
+    def delete(self, table: str, filters: Dict[str, Any], returning: Sequence[str] = ()) -> List[dict]:
+        def matches(row):
+            return all(
+                row.get(column) in value if isinstance(value, (list, tuple)) else row.get(column) == value
+                for column, value in filters.items()
+            )
+
+        with self._lock:
+            deleted = [row for row in self.tables.get(table, []) if matches(row)]
+            deleted_ids = {row.get("id") for row in deleted}
+            self.tables[table] = [row for row in self.tables.get(table, []) if not matches(row)]
+            if table == "documents":
+                # document_embeddings.document_id references documents on delete cascade
+                self.tables["document_embeddings"] = [
+                    row for row in self.tables["document_embeddings"] if row["document_id"] not in deleted_ids
+                ]
+            return self._project(deleted, returning) if returning else []
+
+    def rpc(self, fn: str, params: Dict[str, Any]) -> List[dict]:
+        with self._lock:
+            if fn == "documents_missing_embedding":
+                have = {
+                    row["document_id"] for row in self.tables["document_embeddings"]
+                    if row["version"] == params["embedding_version"]
+                }
+                rows = sorted(
+                    (row for row in self.tables["documents"] if row["id"] > params["after_id"] and row["id"] not in have),
+                    key=lambda row: row["id"]
+                )[:params["batch_size"]]
+                return self._project(rows, ("id", "content", "user_id", "slack_ts"))
+            if fn == "document_embeddings_after":
+                if params["in_documents"]:
+                    rows = [row for row in self.tables["documents"] if row.get("embedding") is not None]
+                else:
+                    documents = {row["id"]: row for row in self.tables["documents"]}
+                    rows = [
+                        {**documents[row["document_id"]], "embedding": row["embedding"]}
+                        for row in self.tables["document_embeddings"] if row["version"] == params["embedding_version"]
+                    ]
+                rows = sorted((row for row in rows if row["id"] > params["after_id"]), key=lambda row: row["id"])
+                return self._project(rows[:params["batch_size"]], ("id", "user_id", "slack_ts", "embedding"))
+        raise ValueError(f"Unsupported function in test store: {fn}")
+
+    async def ainsert(self, table, rows, ignore_duplicates=False, returning=None, on_conflict=None):
+        return self.insert(table, rows, ignore_duplicates, returning, on_conflict)
+
+    async def adelete(self, table, filters, returning=()):
+        return self.delete(table, filters, returning)
+
+    async def arpc(self, fn, params):
+        return self.rpc(fn, params)
+
+    @staticmethod
+    def _project(rows: List[dict], columns: Optional[Sequence[str]]) -> List[dict]:
+        if columns is None:
+            return [dict(row) for row in rows]
+        return [{column: row.get(column) for column in columns} for row in rows]
+
+    def rows(self, table: str = "documents") -> List[dict]:
+        with self._lock:
+            return [dict(row) for row in self.tables.get(table, [])]
+
+
+@pytest.fixture
+def memory_store(monkeypatch):
+    """A fresh MemoryDocumentStore wired into the shared ingestion instance."""
+    from ingestion import ingestion
+
+    store = MemoryDocumentStore()
+    monkeypatch.setattr(ingestion, "store", store)
+    return store
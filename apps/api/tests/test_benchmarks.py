@@ -0,0 +1,84 @@
+import numpy as np
+from slack_sdk import WebClient
+from benchmarks.fake_embeddings import HashingEmbedder
+from benchmarks.fake_slack import FakeSlackServer, SlackWorkspace
+from benchmarks.run import aggregate_runs, compare_to_baseline
+
+
+def results(messages_per_sec=1000.0, p50=1.0, recall=0.9, rss=200.0):
+    return {
+        "ingest": {"messages_per_sec": messages_per_sec},
+        "retrieve": {"p50_ms": p50, "p95_ms": p50 * 2, "p99_ms": p50 * 3, "recall_at_k": recall},
+        "peak_rss_mb": rss,
+    }
+
+
+def test_compare_to_baseline_flags_regressions_in_the_bad_direction_only():
+    baseline = results()
+
+    assert compare_to_baseline(results(messages_per_sec=1500, p50=0.5), baseline, tolerance=0.1) == []
+
+    regressions = compare_to_baseline(results(messages_per_sec=800, p50=1.2), baseline, tolerance=0.1)
+    assert [regression.split(":")[0] for regression in regressions] == [
+        "ingest.messages_per_sec", "retrieve.p50_ms", "retrieve.p95_ms", "retrieve.p99_ms",
+    ]
+
+
+def test_compare_to_baseline_respects_tolerance_and_skips_zero_baselines():
+    baseline = results(rss=0.0)
+
+    assert compare_to_baseline(results(messages_per_sec=950, p50=1.05, rss=500.0), baseline, tolerance=0.1) == []
+
+
+def test_compare_to_baseline_defaults_to_per_metric_tolerances():
+    baseline = results()
+
+    # Latency noise within its tolerance passes; any real recall drop does not
+    assert compare_to_baseline(results(p50=1.2), baseline) == []
+    assert [regression.split(":")[0] for regression in compare_to_baseline(results(recall=0.85), baseline)] == [
+        "retrieve.recall_at_k",
+    ]
+
+
+def test_aggregate_runs_keeps_the_best_checked_metrics_and_medians_of_the_rest():
+    runs = [
+        {"config": {"seed": 7}, **results(messages_per_sec=rate, p50=p50), "slack": {"requests": requests}}
+        for rate, p50, requests in [(900.0, 1.5, 75), (1100.0, 1.0, 75), (1000.0, 2.0, 80)]
+    ]
+
+    aggregated = aggregate_runs(runs)
+
+    assert aggregated["config"] == {"seed": 7}
+    assert aggregated["runs"] == 3
+    assert aggregated["ingest"]["messages_per_sec"] == 1100.0
+    assert aggregated["retrieve"]["p50_ms"] == 1.0
+    assert aggregated["retrieve"]["p99_ms"] == 3.0
+    assert aggregated["slack"]["requests"] == 75
+
+
+def test_hashing_embedder_is_deterministic_and_normalized():
+    embedder = HashingEmbedder(dim=64)
+
+    first = embedder.encode(["deploy the canary build", "invoice refund"])
+    second = HashingEmbedder(dim=64).encode(["deploy the canary build", "invoice refund"])
+
+    np.testing.assert_array_equal(first, second)
+    np.testing.assert_allclose(np.linalg.norm(first, axis=1), 1.0, rtol=1e-6)
+    assert embedder.tokenize(["a b c", "d"])["attention_mask"].sum() == 4
+
+
+def test_fake_slack_paginates_history_newest_first_and_filters_by_oldest():
+    workspace = SlackWorkspace(channels=1, messages_per_channel=30, users=2)
+    channel_id = workspace.channels[0]["id"]
+    oldest = workspace.history[channel_id][-10]["ts"]
+
+    with FakeSlackServer(workspace) as server:
+        client = WebClient(token="xoxb-test", base_url=server.base_url + "/")
+        first = client.conversations_history(channel=channel_id, limit=15, oldest=oldest)
+        second = client.conversations_history(channel=channel_id, limit=15, oldest=oldest, cursor=first["response_metadata"]["next_cursor"])
+
+    timestamps = [float(m["ts"]) for m in first["messages"] + second["messages"]]
+    assert len(timestamps) == 20
+    assert timestamps == sorted(timestamps, reverse=True)
+    assert min(timestamps) > float(oldest)
+    assert first["has_more"] and not second["has_more"]
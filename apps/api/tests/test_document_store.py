@@ -0,0 +1,267 @@
+import asyncio
+import json
+import httpx
+import numpy as np
+import pytest
+from postgrest import SyncPostgrestClient
+from document_store import (
+    AsyncpgDocumentStore, PostgrestDocumentStore, SupabaseDocumentStore, decode_vector, encode_vector,
+)
+
+
+class RecordingTransport:
+    """Answers every request with the given JSON payload and keeps the requests for inspection."""
+
+    def __init__(self, payload):
+        self.payload = payload
+        self.requests = []
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        self.requests.append(request)
+        return httpx.Response(201, json=self.payload)
+
+
+class FakePool:
+    """Records the SQL an asyncpg pool would run."""
+
+    def __init__(self, records):
+        self.records = records
+        self.calls = []
+
+    async def fetch(self, sql, *args, timeout=None):
+        self.calls.append((sql, args))
+        return self.records
+
+    async def execute(self, sql, *args, timeout=None):
+        self.calls.append((sql, args))
+
+
+class FakeConnection:
+    def __init__(self, schema):
+        self.schema = schema
+        self.codecs = []
+
+    async def fetchval(self, sql):
+        return self.schema
+
+    async def set_type_codec(self, typename, **kwargs):
+        self.codecs.append((typename, kwargs))
+
+
+def test_vector_codec_round_trips_pgvector_binary_format():
+    data = encode_vector([1.0, -2.5, 3.25])
+
+    assert data[:4] == b"\x00\x03\x00\x00"
+    np.testing.assert_array_equal(decode_vector(data), np.array([1.0, -2.5, 3.25], dtype=np.float32))
+    assert encode_vector(np.array([1.0, -2.5, 3.25])) == data
+
+
+def test_supabase_store_selects_only_requested_columns():
+    transport = RecordingTransport([{"id": 1, "slack_ts": None}])
+    client = SyncPostgrestClient("http://db.test/rest/v1")
+    client.session = httpx.Client(base_url="http://db.test/rest/v1", transport=httpx.MockTransport(transport))
+    store = SupabaseDocumentStore(client)
+
+    rows = store.insert("documents", [{"content": "a", "embedding": [0.1, 0.2]}], returning=("id", "slack_ts"))
+
+    assert rows == [{"id": 1, "slack_ts": None}]
+    request = transport.requests[0]
+    assert request.url.params["select"] == "id,slack_ts"
+    assert "return=representation" in request.headers["prefer"]
+
+
+def test_supabase_store_returns_nothing_for_empty_returning():
+    transport = RecordingTransport([])
+    client = SyncPostgrestClient("http://db.test/rest/v1")
+    client.session = httpx.Client(base_url="http://db.test/rest/v1", transport=httpx.MockTransport(transport))
+    store = SupabaseDocumentStore(client)
+
+    rows = store.insert("document_embeddings", [{"document_id": 1}], ignore_duplicates=True, returning=())
+
+    assert rows == []
+    prefer = transport.requests[0].headers["prefer"]
+    assert "return=minimal" in prefer and "resolution=ignore-duplicates" in prefer
+    assert "select" not in transport.requests[0].url.params
+
+
+def test_postgrest_store_sends_select_and_prefer_headers():
+    transport = RecordingTransport([{"id": 7}])
+    store = PostgrestDocumentStore(
+        "http://db.test", "key", pool_size=2, keepalive=5, query_timeout=5, transport=httpx.MockTransport(transport)
+    )
+    try:
+        rows = store.insert("documents", [{"content": "a", "embedding": [0.5]}], returning=("id",))
+        minimal = store.insert("document_embeddings", [{"document_id": 7}], ignore_duplicates=True, returning=())
+        matches = store.rpc("match_documents", {"query_embedding": [0.5], "match_count": 3})
+    finally:
+        asyncio.run(store.aclose())
+
+    assert rows == [{"id": 7}]
+    assert minimal == []
+    assert matches == [{"id": 7}]
+
+    insert, insert_minimal, rpc = transport.requests
+    assert insert.url.path == "/rest/v1/documents"
+    assert insert.url.params["select"] == "id"
+    assert insert.headers["prefer"] == "return=representation"
+    assert insert_minimal.headers["prefer"] == "return=minimal,resolution=ignore-duplicates"
+    assert rpc.url.path == "/rest/v1/rpc/match_documents"
+    assert json.loads(rpc.content) == {"query_embedding": [0.5], "match_count": 3}
+
+
+def test_asyncpg_store_binds_vectors_natively_and_returns_requested_columns():
+    store = AsyncpgDocumentStore("postgres://test", pool_size=1, keepalive=5, query_timeout=5, statement_cache_size=10)
+    pool = FakePool([{"id": 1, "slack_ts": None}])
+    store._pool = pool
+    embedding = [0.1, 0.2, 0.3]
+
+    rows = store.insert("documents", [{"content": "a", "embedding": embedding}], returning=("id", "slack_ts"))
+    store.insert("document_embeddings", [{"document_id": 1, "embedding": embedding}], ignore_duplicates=True, returning=())
+    store.rpc("match_documents", {"query_embedding": embedding, "match_count": 5})
+
+    assert rows == [{"id": 1, "slack_ts": None}]
+    (insert_sql, insert_args), (minimal_sql, _), (rpc_sql, rpc_args) = pool.calls
+    assert insert_sql == "INSERT INTO documents (content, embedding) VALUES ($1, $2) RETURNING id, slack_ts"
+    assert insert_args == ("a", embedding)
+    assert minimal_sql.endswith("ON CONFLICT DO NOTHING")
+    assert "RETURNING" not in minimal_sql
+    assert rpc_sql == "SELECT * FROM match_documents(query_embedding => $1, match_count => $2)"
+    assert rpc_args == (embedding, 5)
+    assert "::vector" not in insert_sql + rpc_sql
+
+
+def test_asyncpg_store_rejects_unsafe_identifiers():
+    store = AsyncpgDocumentStore("postgres://test", pool_size=1, keepalive=5, query_timeout=5, statement_cache_size=10)
+    store._pool = FakePool([])
+
+    with pytest.raises(ValueError):
+        store.insert("documents", [{"content": "a"}], returning=("id; drop table documents",))
+
+
+def test_asyncpg_connections_register_the_binary_vector_codec():
+    connection = FakeConnection(schema="extensions")
+
+    asyncio.run(AsyncpgDocumentStore._init_connection(connection))
+
+    [(typename, kwargs)] = connection.codecs
+    assert typename == "vector"
+    assert kwargs["schema"] == "extensions"
+    assert kwargs["format"] == "binary"
+    assert kwargs["encoder"] is encode_vector
+
+
+def test_asyncpg_store_upserts_on_the_given_unique_columns():
+    store = AsyncpgDocumentStore("postgres://test", pool_size=1, keepalive=5, query_timeout=5, statement_cache_size=10)
+    pool = FakePool([{"id": 1}])
+    store._pool = pool
+
+    store.insert(
+        "documents",
+        [{"content": "a", "source_key": "slack:C1:1.0"}],
+        returning=("id",),
+        on_conflict=("source_owner", "source_key"),
+    )
+
+    [(sql, _)] = pool.calls
+    assert sql == (
+        "INSERT INTO documents (content, source_key) VALUES ($1, $2)"
+        " ON CONFLICT (source_owner, source_key) DO UPDATE SET content = EXCLUDED.content RETURNING id"
+    )
+
+
+def test_postgrest_store_upserts_with_merge_duplicates():
+    transport = RecordingTransport([{"id": 1}])
+    store = PostgrestDocumentStore(
+        "http://db.test", "key", pool_size=2, keepalive=5, query_timeout=5, transport=httpx.MockTransport(transport)
+    )
+    try:
+        store.insert("documents", [{"content": "a", "source_key": "k"}], returning=("id",), on_conflict=("source_owner", "source_key"))
+    finally:
+        asyncio.run(store.aclose())
+
+    [request] = transport.requests
+    assert request.headers["prefer"] == "return=representation,resolution=merge-duplicates"
+    assert request.url.params["on_conflict"] == "source_owner,source_key"
+
+
+def test_supabase_store_upserts_with_on_conflict():
+    transport = RecordingTransport([{"id": 1}])
+    client = SyncPostgrestClient("http://db.test/rest/v1")
+    client.session = httpx.Client(base_url="http://db.test/rest/v1", transport=httpx.MockTransport(transport))
+
+    SupabaseDocumentStore(client).insert(
+        "documents", [{"content": "a", "source_key": "k"}], returning=("id",), on_conflict=("source_owner", "source_key")
+    )
+
+    [request] = transport.requests
+    assert "resolution=merge-duplicates" in request.headers["prefer"]
+    assert request.url.params["on_conflict"] == "source_owner,source_key"
+    assert request.url.params["select"] == "id"
+
+
+def test_stores_delete_by_equality_and_membership():
+    filters = {"source_owner": "", "source_key": ["drive:a:0", "drive:a,(1)"]}
+
+    transport = RecordingTransport([])
+    client = SyncPostgrestClient("http://db.test/rest/v1")
+    client.session = httpx.Client(base_url="http://db.test/rest/v1", transport=httpx.MockTransport(transport))
+    SupabaseDocumentStore(client).delete("documents", filters)
+
+    postgrest_transport = RecordingTransport([])
+    postgrest = PostgrestDocumentStore(
+        "http://db.test", "key", pool_size=2, keepalive=5, query_timeout=5, transport=httpx.MockTransport(postgrest_transport)
+    )
+    try:
+        postgrest.delete("documents", filters)
+    finally:
+        asyncio.run(postgrest.aclose())
+
+    asyncpg = AsyncpgDocumentStore("postgres://test", pool_size=1, keepalive=5, query_timeout=5, statement_cache_size=10)
+    pool = FakePool([])
+    asyncpg._pool = pool
+    asyncpg.delete("documents", filters)
+
+    for request in (transport.requests[0], postgrest_transport.requests[0]):
+        assert request.method == "DELETE"
+        assert request.url.params["source_owner"] == "eq."
+        assert request.url.params["source_key"] == 'in.("drive:a:0","drive:a,(1)")'
+        assert "return=minimal" in request.headers["prefer"]
+    assert pool.calls == [
+        ("DELETE FROM documents WHERE source_owner = $1 AND source_key = ANY($2)", ("", ["drive:a:0", "drive:a,(1)"]))
+    ]
+
+
+def test_stores_return_the_requested_columns_of_deleted_rows():
+    filters = {"source_key": ["drive:a:0"]}
+
+    transport = RecordingTransport([{"id": 7}])
+    client = SyncPostgrestClient("http://db.test/rest/v1")
+    client.session = httpx.Client(base_url="http://db.test/rest/v1", transport=httpx.MockTransport(transport))
+    assert SupabaseDocumentStore(client).delete("documents", filters, returning=("id",)) == [{"id": 7}]
+
+    postgrest_transport = RecordingTransport([{"id": 7}])
+    postgrest = PostgrestDocumentStore(
+        "http://db.test", "key", pool_size=2, keepalive=5, query_timeout=5, transport=httpx.MockTransport(postgrest_transport)
+    )
+    try:
+        assert postgrest.delete("documents", filters, returning=("id",)) == [{"id": 7}]
+    finally:
+        asyncio.run(postgrest.aclose())
+
+    asyncpg = AsyncpgDocumentStore("postgres://test", pool_size=1, keepalive=5, query_timeout=5, statement_cache_size=10)
+    pool = FakePool([{"id": 7}])
+    asyncpg._pool = pool
+    assert asyncpg.delete("documents", filters, returning=("id",)) == [{"id": 7}]
+
+    for request in (transport.requests[0], postgrest_transport.requests[0]):
+        assert request.url.params["select"] == "id"
+        assert "return=representation" in request.headers["prefer"]
+    assert pool.calls == [("DELETE FROM documents WHERE source_key = ANY($1) RETURNING id", (["drive:a:0"],))]
+
+
+def test_stores_refuse_to_delete_without_filters():
+    store = AsyncpgDocumentStore("postgres://test", pool_size=1, keepalive=5, query_timeout=5, statement_cache_size=10)
+    store._pool = FakePool([])
+
+    with pytest.raises(ValueError):
+        store.delete("documents", {})
@@ -0,0 +1,174 @@
+import os
+import threading
+import numpy as np
+from embedding_store import EMBEDDING_DTYPE, META_DTYPE, EmbeddingStore
+
+
+def rows(ids, dim=4):
+    """Embeddings whose values encode the document id, so misaligned rows are easy to spot."""
+    return np.asarray([[doc_id + i / 10 for i in range(dim)] for doc_id in ids], dtype=np.float32)
+
+
+def test_append_and_reopen(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.append([1, 2], rows([1, 2]), user_ids=["u1", None], slack_timestamps=[1700000000.5, None])
+    store.append([3], rows([3]))
+
+    reopened = EmbeddingStore(str(tmp_path))
+
+    assert len(reopened) == 3
+    assert reopened.dim == 4
+    np.testing.assert_array_equal(reopened.embeddings(), rows([1, 2, 3]))
+    meta = reopened.metadata()
+    assert meta["id"].tolist() == [1, 2, 3]
+    assert meta["user_id"].tolist() == [b"u1", b"", b""]
+    assert meta["slack_ts"][0] == 1700000000.5 and np.isnan(meta["slack_ts"][1])
+
+
+def test_reader_opened_before_the_first_write_sees_later_rows(tmp_path):
+    reader = EmbeddingStore(str(tmp_path))
+    assert reader.dim is None
+    assert reader.embeddings().shape == (0, 0)
+
+    EmbeddingStore(str(tmp_path)).append([5, 6], rows([5, 6]))
+
+    np.testing.assert_array_equal(reader.embeddings(), rows([5, 6]))
+    np.testing.assert_array_equal(reader.lookup([6]), rows([6]))
+    assert reader.dim == 4
+
+
+def test_concurrent_readers_only_see_complete_rows(tmp_path):
+    writer = EmbeddingStore(str(tmp_path))
+    writer.append([0], rows([0]))
+    done = threading.Event()
+    errors = []
+
+    def read():
+        reader = EmbeddingStore(str(tmp_path))
+        while not done.is_set():
+            embeddings = reader.embeddings()
+            ids = reader.metadata()["id"][:len(embeddings)]
+            if not np.array_equal(embeddings[:, 0], ids.astype(np.float32)):
+                errors.append(len(embeddings))
+
+    readers = [threading.Thread(target=read) for _ in range(3)]
+    for thread in readers:
+        thread.start()
+    for start in range(1, 200, 10):
+        writer.append(list(range(start, start + 10)), rows(range(start, start + 10)))
+    done.set()
+    for thread in readers:
+        thread.join()
+
+    assert errors == []
+    assert len(writer) == 201
+
+
+def test_append_rolls_back_embedding_rows_without_metadata(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.append([1], rows([1]))
+    # An append that died after writing its embeddings but before its metadata
+    with open(os.path.join(str(tmp_path), "embeddings.f32"), "ab") as f:
+        f.write(rows([99, 98]).tobytes() + b"\x01\x02")
+
+    store.append([2], rows([2]))
+
+    reopened = EmbeddingStore(str(tmp_path))
+    assert reopened.metadata()["id"].tolist() == [1, 2]
+    np.testing.assert_array_equal(reopened.embeddings(), rows([1, 2]))
+    assert os.path.getsize(os.path.join(str(tmp_path), "embeddings.f32")) == 2 * 4 * EMBEDDING_DTYPE.itemsize
+
+
+def test_append_rolls_back_a_torn_metadata_record(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.append([1], rows([1]))
+    # An append that died part way through its metadata write: a complete embedding row and half a record
+    with open(os.path.join(str(tmp_path), "embeddings.f32"), "ab") as f:
+        f.write(rows([7]).tobytes())
+    with open(os.path.join(str(tmp_path), "meta.bin"), "ab") as f:
+        f.write(b"\x07" * (META_DTYPE.itemsize // 2))
+    assert len(store) == 1
+
+    store.append([2, 3], rows([2, 3]))
+
+    reopened = EmbeddingStore(str(tmp_path))
+    assert reopened.metadata()["id"].tolist() == [1, 2, 3]
+    np.testing.assert_array_equal(reopened.embeddings(), rows([1, 2, 3]))
+    assert os.path.getsize(os.path.join(str(tmp_path), "meta.bin")) == 3 * META_DTYPE.itemsize
+
+
+def test_lookup_returns_nan_for_unknown_ids_and_the_latest_row_for_duplicates(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.append([3, 1], rows([3, 1]))
+    store.append([1], rows([10]))
+
+    found = store.lookup([1, 2, 3])
+
+    np.testing.assert_array_equal(found[0], rows([10])[0])
+    assert np.isnan(found[1]).all()
+    np.testing.assert_array_equal(found[2], rows([3])[0])
+
+
+def test_deleted_and_superseded_rows_are_not_live(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.append([1, 2, 3], rows([1, 2, 3]))
+    store.append([2], rows([20]))
+    store.delete([3, 42])
+
+    reopened = EmbeddingStore(str(tmp_path))
+
+    assert reopened.live_mask().tolist() == [True, False, False, True]
+    batches = list(reopened.iter_batches(batch_size=2))
+    assert [meta["id"].tolist() for meta, _ in batches] == [[1], [2]]
+    np.testing.assert_array_equal(np.concatenate([embeddings for _, embeddings in batches]), rows([1, 20]))
+    found = reopened.lookup([2, 3])
+    np.testing.assert_array_equal(found[0], rows([20])[0])
+    assert np.isnan(found[1]).all()
+
+
+def test_a_deleted_id_stays_deleted_after_a_torn_delete(tmp_path):
+    store = EmbeddingStore(str(tmp_path))
+    store.append([1, 2], rows([1, 2]))
+    store.delete([1])
+    with open(os.path.join(str(tmp_path), "deleted.i64"), "ab") as f:
+        f.write(b"\x02\x00\x00")
+
+    assert store.live_mask().tolist() == [False, True]
+    store.delete([2])
+
+    assert EmbeddingStore(str(tmp_path)).live_mask().tolist() == [False, False]
+    assert os.path.getsize(os.path.join(str(tmp_path), "deleted.i64")) == 16
+
+
+def test_the_lookup_index_follows_appends_from_other_writers(tmp_path):
+    reader = EmbeddingStore(str(tmp_path))
+    writer = EmbeddingStore(str(tmp_path))
+    writer.append([5, 1], rows([5, 1]))
+    np.testing.assert_array_equal(reader.lookup([1, 5]), rows([1, 5]))
+
+    writer.append([3, 5], rows([3, 50]))
+
+    np.testing.assert_array_equal(reader.lookup([5, 3, 1]), rows([50, 3, 1]))
+    assert reader.live_mask().tolist() == [False, True, True, True]
+
+
+def test_export_backfills_documents_stored_before_the_local_store(memory_store, monkeypatch, tmp_path):
+    import constants
+    import embedding_store
+    from export_local_store import export_embeddings
+    memory_store.insert("documents", [
+        {"content": f"doc {i}", "user_id": "u1", "slack_ts": None, "embedding": rows([i])[0].tolist()}
+        for i in range(1, 6)
+    ])
+    monkeypatch.setattr(constants, "LOCAL_EMBEDDING_STORE_PATH", str(tmp_path))
+    monkeypatch.setattr(embedding_store, "_stores", {})
+    local_store = embedding_store.get_embedding_store(constants.DOCUMENTS_EMBEDDING_VERSION)
+    # Ingested after the store was configured, so already mirrored
+    local_store.append([4], rows([4]))
+
+    assert export_embeddings(constants.DOCUMENTS_EMBEDDING_VERSION, memory_store, batch_size=2) == 4
+    assert export_embeddings(constants.DOCUMENTS_EMBEDDING_VERSION, memory_store, batch_size=2) == 0
+
+    assert sorted(local_store.metadata()["id"].tolist()) == [1, 2, 3, 4, 5]
+    np.testing.assert_array_equal(local_store.lookup([1, 2, 3, 4, 5]), rows([1, 2, 3, 4, 5]))
+    assert local_store.metadata()["user_id"].tolist()[-1] == b"u1"
@@ -0,0 +1,171 @@
+import os
+import subprocess
+import sys
+import time
+import pytest
+import constants
+from conftest import API_DIR
+from ingestion import ingestion
+from reembedding import reembedding_jobs, start_reembedding
+
+
+def import_constants(**env):
+    return subprocess.run(
+        [sys.executable, "-c", "import constants"],
+        cwd=API_DIR,
+        env={**os.environ, **env},
+        capture_output=True,
+        text=True,
+    )
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+@pytest.fixture
+def shadow_version(monkeypatch):
+    monkeypatch.setitem(constants.EMBEDDING_MODELS, "shadow", "example/shadow-model")
+    yield "shadow"
+    job = reembedding_jobs.pop("shadow", None)
+    if job is not None:
+        job.cancel()
+        job._thread.join(timeout=5)
+
+
+@pytest.mark.parametrize("variable", ["DUAL_WRITE_EMBEDDING_VERSIONS", "INGEST_EMBEDDING_VERSION", "DEFAULT_EMBEDDING_VERSION"])
+def test_unknown_configured_versions_fail_at_import(variable):
+    result = import_constants(**{variable: "no-such-version"})
+
+    assert result.returncode != 0
+    assert "Unknown embedding version(s) configured: no-such-version" in result.stderr
+
+
+def test_registered_versions_are_accepted_at_import():
+    result = import_constants(
+        EXTRA_EMBEDDING_MODELS="minilm-l6=sentence-transformers/all-MiniLM-L6-v2",
+        DUAL_WRITE_EMBEDDING_VERSIONS="minilm-l6",
+    )
+
+    assert result.returncode == 0, result.stderr
+
+
+def test_ingest_does_not_embed_dual_write_versions_inline(memory_store, monkeypatch, shadow_version):
+    monkeypatch.setattr(ingestion, "dual_write_versions", [shadow_version])
+    encoded_versions = []
+    encode_documents = ingestion.encode_documents
+    monkeypatch.setattr(
+        ingestion, "encode_documents",
+        lambda contents, version=None, stage_prefix="ingest": encoded_versions.append(version) or encode_documents(contents, version, stage_prefix)
+    )
+
+    ingestion.ingest_batch(["deploy the canary", "rollback staging"])
+
+    assert encoded_versions == [None]
+    assert memory_store.rows("document_embeddings") == []
+
+
+def test_following_job_embeds_newly_ingested_documents(memory_store, monkeypatch, shadow_version):
+    monkeypatch.setattr(constants, "DUAL_WRITE_POLL_SECONDS", 30.0)
+    ingestion.ingest_batch(["existing document"])
+    job = start_reembedding(shadow_version, batch_size=10, follow=True)
+
+    def embedded_ids():
+        return sorted(row["document_id"] for row in memory_store.rows("document_embeddings") if row["version"] == shadow_version)
+
+    assert wait_for(lambda: embedded_ids() == [1])
+
+    inserted = ingestion.ingest_batch(["new document", "another new document"])
+
+    # Woken by ingestion rather than the (30s) poll
+    assert wait_for(lambda: embedded_ids() == [1] + [row["id"] for row in inserted])
+    assert job.is_running and job.status()["follow"]
+
+
+def test_following_job_rescans_documents_updated_in_place(shadow_version, memory_store):
+    job = start_reembedding(shadow_version, batch_size=10, follow=True)
+    ingestion.ingest_batch(["a", "b", "c"])
+    assert wait_for(lambda: job.last_id == 3)
+
+    # A re-ingested document keeps its id but loses its version row
+    memory_store.tables["document_embeddings"] = [
+        row for row in memory_store.tables["document_embeddings"] if row["document_id"] != 2
+    ]
+    job.notify([2])
+
+    assert wait_for(lambda: any(row["document_id"] == 2 for row in memory_store.rows("document_embeddings")))
+
+
+def test_retired_primary_write_stores_the_ingest_version_only(memory_store, monkeypatch, shadow_version):
+    monkeypatch.setattr(ingestion, "ingest_version", shadow_version)
+
+    inserted = ingestion.ingest_batch(["deploy the canary"], user_id="u1")
+
+    [document] = memory_store.rows("documents")
+    assert "embedding" not in document
+    [version_row] = memory_store.rows("document_embeddings")
+    assert version_row["document_id"] == inserted[0]["id"]
+    assert version_row["version"] == shadow_version
+    assert len(version_row["embedding"]) == 768
+
+
+def test_following_job_backs_off_and_recovers_from_failed_batches(memory_store, monkeypatch, shadow_version):
+    monkeypatch.setattr(constants, "DUAL_WRITE_RETRY_MAX_SECONDS", 0.01)
+    ingestion.ingest_batch(["existing document"])
+    rpc = memory_store.rpc
+    failures = iter([TimeoutError("statement timeout"), TimeoutError("statement timeout")])
+
+    def flaky_rpc(fn, params):
+        error = next(failures, None)
+        if error is not None:
+            raise error
+        return rpc(fn, params)
+
+    monkeypatch.setattr(memory_store, "rpc", flaky_rpc)
+    job = start_reembedding(shadow_version, batch_size=10, follow=True)
+
+    assert wait_for(lambda: len(memory_store.rows("document_embeddings")) == 1)
+    assert job.is_running
+    assert job.status()["consecutive_failures"] == 0 and job.status()["error"] is None
+
+
+def test_restarting_a_dual_write_job_keeps_it_following(memory_store, monkeypatch, shadow_version):
+    from fastapi.testclient import TestClient
+    from main import app
+    monkeypatch.setattr(ingestion, "dual_write_versions", [shadow_version])
+    client = TestClient(app)
+
+    response = client.post("/embeddings/reembed", json={"version": shadow_version, "max_docs_per_second": 50})
+
+    assert response.status_code == 200
+    assert response.json()["follow"] is True
+    client.delete(f"/embeddings/reembed/{shadow_version}")
+    reembedding_jobs[shadow_version]._thread.join(timeout=5)
+
+    response = client.post("/embeddings/reembed", json={"version": shadow_version, "follow": False})
+
+    assert response.json()["follow"] is False
+
+
+def test_only_the_process_holding_the_lock_runs_dual_write_jobs(memory_store, monkeypatch, shadow_version, tmp_path):
+    import fcntl
+    import reembedding
+    lock_path = str(tmp_path / "dual-write.lock")
+    monkeypatch.setattr(constants, "DUAL_WRITE_LOCK_PATH", lock_path)
+    monkeypatch.setattr(reembedding, "_dual_write_lock_file", None)
+    monkeypatch.setattr(ingestion, "dual_write_versions", [shadow_version])
+
+    with open(lock_path, "a") as other_worker:
+        fcntl.flock(other_worker, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        assert reembedding.start_dual_write_jobs() == []
+        assert shadow_version not in reembedding_jobs
+
+    # The lock is free again once the other worker exits
+    [job] = reembedding.start_dual_write_jobs()
+    assert job.follow
+    reembedding._dual_write_lock_file.close()
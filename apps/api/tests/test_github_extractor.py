@@ -0,0 +1,235 @@
+import hashlib
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+import pytest
+from fastapi import HTTPException
+import constants
+from extractors import github_extractor
+from extractors.github_extractor import GitHubExtractor
+from models import ExtractRequest
+
+
+def item(id, created_at, updated_at=None, bot=False, **fields):
+    return {
+        "id": id,
+        "number": id,
+        "title": f"Title {id}",
+        "body": f"Body {id}",
+        "created_at": created_at,
+        "updated_at": updated_at or created_at,
+        "user": {"login": "dependabot" if bot else f"user{id}", "type": "Bot" if bot else "User"},
+        **fields,
+    }
+
+
+class FakeGitHub:
+    """Local GitHub REST stand-in: since/sort filtering, Link pagination and ETag revalidation."""
+
+    def __init__(self):
+        self.resources = {"issues": [], "issues/comments": [], "pulls/comments": []}
+        self.requests = []
+        self.status = None
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                fake.handle(self)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self._server.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def handle(self, handler):
+        self.requests.append(handler.path)
+        if self.status is not None:
+            status, headers = self.status
+            handler.send_response(status)
+            for name, value in headers.items():
+                handler.send_header(name, value)
+            handler.send_header("Content-Length", "2")
+            handler.end_headers()
+            handler.wfile.write(b"{}")
+            return
+
+        url = urlparse(handler.path)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        resource = url.path.split("/repos/o/r/", 1)[1]
+        items = sorted(self.resources[resource], key=lambda i: i["updated_at"])
+        if "since" in query:
+            items = [i for i in items if i["updated_at"] >= query["since"]]
+        page, per_page = int(query.get("page", 1)), int(query["per_page"])
+        body = json.dumps(items[(page - 1) * per_page:page * per_page]).encode()
+        etag = f'"{hashlib.sha1(body).hexdigest()}"'
+
+        if handler.headers.get("If-None-Match") == etag:
+            handler.send_response(304)
+            handler.end_headers()
+            return
+
+        handler.send_response(200)
+        handler.send_header("ETag", etag)
+        handler.send_header("x-ratelimit-remaining", "4999")
+        if page * per_page < len(items):
+            next_query = urlencode({**query, "page": page + 1})
+            handler.send_header("Link", f'<{self.base_url}{url.path}?{next_query}>; rel="next"')
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+@pytest.fixture
+def github(monkeypatch, tmp_path):
+    with FakeGitHub() as fake:
+        monkeypatch.setattr(constants, "GITHUB_API_BASE_URL", fake.base_url)
+        monkeypatch.setattr(constants, "EXTRACTOR_STATE_DIR", str(tmp_path))
+        monkeypatch.setattr(github_extractor, "PAGE_SIZE", 2)
+        yield fake
+
+
+def sync(commit=True, **fields):
+    extractor = GitHubExtractor()
+    request = ExtractRequest(service="github", repository="o/r", github_token="token", **fields)
+    keys = [record.key for record in extractor.extract(request)]
+    if commit:
+        extractor.commit()
+    return keys, extractor.summary()
+
+
+def test_first_sync_ingests_every_page_of_every_resource(github):
+    github.resources["issues"] = [item(i, f"2024-01-0{i}T00:00:00Z") for i in range(1, 6)]
+    github.resources["issues"].append(item(99, "2024-01-02T00:00:00Z", bot=True))
+    github.resources["issues/comments"] = [item(10, "2024-01-03T12:00:00Z")]
+
+    keys, summary = sync(limit=2)
+
+    assert keys == [f"github:o/r:issue:{i}" for i in range(1, 6)] + ["github:o/r:comment:10"]
+    assert summary["document_count"] == 6
+    assert summary["next_since"] == {
+        "issue": "2024-01-05T00:00:00Z", "comment": "2024-01-03T12:00:00Z", "review_comment": None
+    }
+    assert not any("?&" in path for path in github.requests)
+    assert all("per_page=2" in path and "sort=updated" in path for path in github.requests)
+
+
+def test_unchanged_sync_is_answered_entirely_by_not_modified(github):
+    github.resources["issues"] = [item(i, f"2024-01-0{i}T00:00:00Z") for i in range(1, 6)]
+    sync()
+    sync()
+
+    keys, summary = sync()
+
+    assert keys == []
+    assert summary["requests"] > 0
+    assert summary["not_modified"] == summary["requests"]
+
+
+def test_new_items_are_fetched_while_unchanged_pages_revalidate(github):
+    github.resources["issues"] = [item(i, f"2024-01-05T0{i}:00:00Z") for i in range(1, 6)]
+    sync()
+    sync()
+    github.resources["issues"].append(item(6, "2024-01-05T09:00:00Z"))
+
+    keys, summary = sync()
+
+    assert keys == ["github:o/r:issue:6"]
+    # Only the last issues page changed; the first two and both empty comment lists are 304s
+    assert (summary["requests"], summary["not_modified"]) == (5, 4)
+
+
+def test_items_on_the_watermark_are_not_ingested_twice(github):
+    github.resources["issues"] = [item(1, "2024-01-01T00:00:00Z"), item(2, "2024-01-02T00:00:00Z")]
+    sync()
+    # Created on the watermark itself, after the last sync read it
+    github.resources["issues"].append(item(3, "2024-01-02T00:00:00Z"))
+    # Edited, but created before the watermark
+    github.resources["issues"][0]["updated_at"] = "2024-01-03T00:00:00Z"
+
+    keys, _ = sync()
+
+    assert keys == ["github:o/r:issue:3", "github:o/r:issue:1"]
+    assert sync()[0] == []
+
+
+def test_items_created_while_a_later_resource_is_listed_are_not_skipped(github):
+    github.resources["issues"] = [item(1, "2024-01-01T00:00:00Z")]
+    extractor = GitHubExtractor()
+    records = extractor.extract(ExtractRequest(service="github", repository="o/r", github_token="token"))
+    first = next(records)
+    # Created after the issues were listed but before the comments were
+    github.resources["issues"].append(item(9, "2024-01-02T00:00:00Z"))
+    github.resources["issues/comments"] = [item(50, "2024-01-03T00:00:00Z")]
+    rest = [record.key for record in records]
+    extractor.commit()
+    assert [first.key] + rest == ["github:o/r:issue:1", "github:o/r:comment:50"]
+
+    keys, _ = sync()
+
+    assert keys == ["github:o/r:issue:9"]
+
+
+def test_an_edited_issue_replaces_its_stored_document(github, memory_store):
+    from ingestion import ingestion
+    github.resources["issues"] = [item(1, "2024-01-01T00:00:00Z"), item(2, "2024-01-01T00:00:00Z")]
+    request = ExtractRequest(service="github", repository="o/r", github_token="token")
+
+    def sync_and_ingest():
+        extractor = GitHubExtractor()
+        for _ in ingestion.ingest_stream(extractor.extract(request)):
+            pass
+        extractor.commit()
+
+    sync_and_ingest()
+    github.resources["issues"][0].update(body="Edited body", updated_at="2024-01-04T00:00:00Z")
+    sync_and_ingest()
+
+    assert [(row["source_key"], row["content"]) for row in memory_store.rows()] == [
+        ("github:o/r:issue:1", "Issue #1: Title 1\n\nEdited body"),
+        ("github:o/r:issue:2", "Issue #2: Title 2\n\nBody 2"),
+    ]
+
+
+def test_a_single_saved_watermark_applies_to_every_resource(github):
+    from extractors.state import save_state
+    save_state("github", "o/r", {"since": "2024-01-02T00:00:00Z", "seen": ["comment:10"], "etags": {}})
+    github.resources["issues"] = [item(1, "2024-01-01T00:00:00Z"), item(2, "2024-01-03T00:00:00Z")]
+    github.resources["issues/comments"] = [item(10, "2024-01-02T00:00:00Z"), item(11, "2024-01-02T00:00:00Z")]
+
+    keys, _ = sync()
+
+    assert keys == ["github:o/r:issue:2", "github:o/r:comment:11"]
+
+
+def test_state_only_advances_on_commit(github):
+    github.resources["issues"] = [item(1, "2024-01-01T00:00:00Z")]
+    sync(commit=False)
+
+    keys, _ = sync()
+
+    assert keys == ["github:o/r:issue:1"]
+
+
+@pytest.mark.parametrize("status, headers, expected", [
+    (404, {}, 404),
+    (401, {}, 401),
+    (403, {"x-ratelimit-remaining": "0"}, 429),
+    (502, {}, 500),
+])
+def test_api_errors_map_to_http_exceptions(github, status, headers, expected):
+    github.status = (status, headers)
+
+    with pytest.raises(HTTPException) as error:
+        sync()
+
+    assert error.value.status_code == expected
@@ -0,0 +1,251 @@
+import base64
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import pytest
+from fastapi import HTTPException
+import constants
+from extractors.google_extractor import GoogleExtractor, _GoogleSession
+from extractors.state import load_state, save_state
+from ingestion import ingestion
+from models import ExtractRequest
+
+ACCOUNT = "ann@example.com"
+
+
+class FakeGoogle:
+    """Local Drive and Gmail stand-in: file listing, the changes feed, downloads and history."""
+
+    def __init__(self):
+        self.files = {}
+        self.bodies = {}
+        self.changes = []
+        self.messages = {}
+        self.history = []
+        self.history_expired = False
+        self.requests = []
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                fake.handle(self)
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self._server.server_port}"
+
+    def __enter__(self):
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def add_file(self, file_id, body, mime_type="text/plain", name=None):
+        self.files[file_id] = {"id": file_id, "name": name or f"{file_id}.txt", "mimeType": mime_type}
+        if body is not None:
+            self.bodies[file_id] = body
+
+    def handle(self, handler):
+        url = urlparse(handler.path)
+        query = {name: values[0] for name, values in parse_qs(url.query).items()}
+        path = url.path
+        self.requests.append(path)
+
+        if path == "/drive/v3/about":
+            return self.send_json(handler, {"user": {"emailAddress": ACCOUNT}})
+        if path == "/drive/v3/changes/startPageToken":
+            return self.send_json(handler, {"startPageToken": "1"})
+        if path == "/drive/v3/files":
+            return self.send_json(handler, {"files": list(self.files.values())})
+        if path == "/drive/v3/changes":
+            changes, self.changes = self.changes, []
+            return self.send_json(handler, {"changes": changes, "newStartPageToken": str(int(query["pageToken"]) + 1)})
+        if path.startswith("/drive/v3/files/"):
+            body = self.bodies.get(path.split("/")[4])
+            if isinstance(body, int):
+                return self.send_json(handler, {}, status=body)
+            if body is None:
+                return self.send_json(handler, {}, status=404)
+            data = body.encode()
+            handler.send_response(200)
+            handler.send_header("Content-Type", "text/plain; charset=utf-8")
+            handler.send_header("Content-Length", str(len(data)))
+            handler.end_headers()
+            handler.wfile.write(data)
+            return
+        if path == "/gmail/v1/users/me/profile":
+            return self.send_json(handler, {"emailAddress": ACCOUNT, "historyId": "100"})
+        if path == "/gmail/v1/users/me/messages":
+            return self.send_json(handler, {"messages": [{"id": message_id} for message_id in self.messages]})
+        if path == "/gmail/v1/users/me/history":
+            if self.history_expired:
+                return self.send_json(handler, {}, status=404)
+            history, self.history = self.history, []
+            return self.send_json(handler, {"history": history, "historyId": "200"})
+        if path.startswith("/gmail/v1/users/me/messages/"):
+            message_id = path.rsplit("/", 1)[1]
+            labels, body = self.messages[message_id]
+            data = base64.urlsafe_b64encode(body.encode()).decode().rstrip("=")
+            return self.send_json(handler, {
+                "id": message_id,
+                "labelIds": labels,
+                "payload": {
+                    "headers": [{"name": "Subject", "value": f"Subject {message_id}"}, {"name": "From", "value": "Bob <bob@example.com>"}],
+                    "mimeType": "text/plain",
+                    "body": {"data": data},
+                },
+            })
+        self.send_json(handler, {}, status=404)
+
+    @staticmethod
+    def send_json(handler, payload, status=200):
+        data = json.dumps(payload).encode()
+        handler.send_response(status)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+
+@pytest.fixture
+def google(monkeypatch, tmp_path):
+    with FakeGoogle() as fake:
+        monkeypatch.setattr(constants, "GOOGLE_API_BASE_URL", fake.base_url)
+        monkeypatch.setattr(constants, "EXTRACTOR_STATE_DIR", str(tmp_path))
+        monkeypatch.setattr(constants, "GOOGLE_REQUESTS_PER_MINUTE", 60000.0)
+        monkeypatch.setattr(constants, "GOOGLE_REQUEST_BURST", 1000)
+        monkeypatch.setattr(constants, "GOOGLE_CHUNK_CHARS", 20)
+        yield fake
+
+
+def sync(**fields):
+    """Run one sync through the ingestion pipeline, committing the state as /extract does."""
+    extractor = GoogleExtractor()
+    request = ExtractRequest(service="google", google_access_token="token", **fields)
+    for _ in ingestion.ingest_stream(extractor.extract(request)):
+        pass
+    extractor.commit()
+    return extractor.summary()["sources"]
+
+
+def stored(memory_store, prefix=""):
+    return sorted(
+        (row["source_key"], row["content"]) for row in memory_store.rows()
+        if row["source_key"].startswith(prefix)
+    )
+
+
+def words(count, word="alpha"):
+    return " ".join(f"{word}{i}" for i in range(count))
+
+
+def test_first_sync_ingests_text_files_and_recent_mail(google, memory_store):
+    google.add_file("doc", words(6))
+    google.add_file("image", None, mime_type="image/png")
+    google.messages["m1"] = (["INBOX"], "hello there")
+
+    sources = sync()
+
+    assert [key for key, _ in stored(memory_store, "drive:")] == ["drive:doc:0", "drive:doc:1", "drive:doc:2"]
+    assert [key for key, _ in stored(memory_store, "gmail:")] == ["gmail:m1:0"]
+    assert sources["drive"]["skipped"] == 1
+    assert load_state("google", f"{ACCOUNT}/drive")["chunk_counts"] == {"doc": 3}
+
+
+def test_changed_files_replace_their_chunks_and_drop_the_ones_they_no_longer_have(google, memory_store):
+    google.add_file("doc", words(6))
+    sync(google_sources=["drive"])
+    google.add_file("doc", words(2, word="beta"))
+    google.changes = [{"fileId": "doc", "file": google.files["doc"]}]
+
+    sources = sync(google_sources=["drive"])
+
+    assert stored(memory_store) == [("drive:doc:0", "doc.txt\n\nbeta0 beta1")]
+    assert sources["drive"]["deleted_chunks"] == 2
+    assert load_state("google", f"{ACCOUNT}/drive")["chunk_counts"] == {"doc": 1}
+
+
+def test_removed_and_trashed_files_delete_their_chunks(google, memory_store):
+    google.add_file("removed", words(4))
+    google.add_file("trashed", words(2))
+    google.add_file("kept", "kept")
+    sync(google_sources=["drive"])
+    google.changes = [
+        {"fileId": "removed", "removed": True},
+        {"fileId": "trashed", "file": {**google.files["trashed"], "trashed": True}},
+    ]
+
+    sources = sync(google_sources=["drive"])
+
+    assert stored(memory_store) == [("drive:kept:0", "kept.txt\n\nkept")]
+    assert sources["drive"]["removed"] == 2
+    assert load_state("google", f"{ACCOUNT}/drive")["chunk_counts"] == {"kept": 1}
+
+
+def test_gmail_history_adds_new_messages_and_skips_drafts(google, memory_store):
+    google.messages["m1"] = (["INBOX"], "first")
+    sync(google_sources=["gmail"])
+    google.messages["m2"] = (["INBOX"], "second")
+    google.messages["draft"] = (["DRAFT"], "unsent")
+    google.history = [{"messagesAdded": [
+        {"message": {"id": "m2", "labelIds": ["INBOX"]}},
+        {"message": {"id": "draft", "labelIds": ["DRAFT"]}},
+    ]}]
+
+    sources = sync(google_sources=["gmail"])
+
+    assert [key for key, _ in stored(memory_store)] == ["gmail:m1:0", "gmail:m2:0"]
+    assert sources["gmail"]["incremental"] is True
+    assert load_state("google", f"{ACCOUNT}/gmail") == {"history_id": "200"}
+
+
+def test_expired_history_relists_without_duplicating_messages(google, memory_store):
+    google.messages["m1"] = (["INBOX"], "first")
+    sync(google_sources=["gmail"])
+    save_state("google", f"{ACCOUNT}/gmail", {"history_id": "1"})
+    google.history_expired = True
+
+    sources = sync(google_sources=["gmail"])
+
+    assert sources["gmail"]["incremental"] is False
+    assert len(memory_store.rows()) == 1
+
+
+def test_a_failed_download_cancels_the_downloads_not_yet_started(google, memory_store, monkeypatch):
+    monkeypatch.setattr(constants, "GOOGLE_DOWNLOAD_WORKERS", 1)
+    monkeypatch.setattr(constants, "GOOGLE_MAX_RETRIES", 0)
+    google.add_file("broken", 500)
+    for i in range(5):
+        google.add_file(f"file{i}", "text")
+
+    with pytest.raises(HTTPException) as error:
+        sync(google_sources=["drive"])
+
+    assert error.value.status_code == 500
+    assert not any(path.startswith("/drive/v3/files/file") for path in google.requests)
+    assert load_state("google", f"{ACCOUNT}/drive") == {}
+
+
+def test_download_values_are_streamed_before_the_download_finishes():
+    release = threading.Event()
+
+    def download(session, item):
+        yield f"{item}:first"
+        assert release.wait(timeout=5)
+        yield f"{item}:second"
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        session = _GoogleSession(None, None, executor)
+        downloads = session.map(download, ["a"])
+        item, values = next(downloads)
+
+        assert (item, next(values)) == ("a", "a:first")
+        release.set()
+        assert list(values) == ["a:second"]
+        downloads.close()
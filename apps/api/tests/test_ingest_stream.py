@@ -0,0 +1,136 @@
+import itertools
+import threading
+import numpy as np
+import pytest
+from fastapi import HTTPException
+from ingestion import ingestion
+from records import DocumentRecord
+
+
+def record(i, prefix="doc"):
+    return DocumentRecord(content=f"{prefix} {i}", key=f"test:{i}")
+
+
+def keys(memory_store):
+    return sorted(row["source_key"] for row in memory_store.rows())
+
+
+def test_fetching_overlaps_with_embedding(memory_store, monkeypatch):
+    next_batch_fetched = threading.Event()
+
+    def records():
+        for i in range(4):
+            if i == 2:
+                next_batch_fetched.set()
+            yield record(i)
+
+    ingest_batch = ingestion.ingest_batch
+    overlapped = []
+
+    def slow_ingest_batch(*args, **kwargs):
+        # The producer keeps fetching while the first batch is being embedded
+        if not overlapped:
+            overlapped.append(next_batch_fetched.wait(timeout=5))
+        return ingest_batch(*args, **kwargs)
+
+    monkeypatch.setattr(ingestion, "ingest_batch", slow_ingest_batch)
+
+    batches = list(ingestion.ingest_stream(records(), batch_size=2))
+
+    assert overlapped == [True]
+    assert [len(ids) for ids in batches] == [2, 2]
+
+
+def test_fetch_errors_surface_after_the_batches_before_them(memory_store):
+    def records():
+        yield from (record(i) for i in range(2))
+        raise HTTPException(status_code=429, detail="rate limited")
+
+    stream = ingestion.ingest_stream(records(), batch_size=2)
+
+    assert len(next(stream)) == 2
+    with pytest.raises(HTTPException) as error:
+        next(stream)
+    assert error.value.status_code == 429
+
+
+def test_stopping_early_closes_the_record_stream(memory_store):
+    produced = itertools.count()
+    closed = threading.Event()
+
+    def records():
+        try:
+            while True:
+                yield record(next(produced))
+        finally:
+            closed.set()
+
+    # Held here, so only an explicit close (not garbage collection) can run its finally block
+    generator = records()
+    stream = ingestion.ingest_stream(generator, batch_size=2, prefetch_batches=1)
+    next(stream)
+    stream.close()
+
+    assert closed.is_set()
+    # Only the bounded read-ahead was fetched, not the whole (endless) stream
+    assert next(produced) <= 2 * 4
+
+
+def test_retrying_after_a_failed_batch_does_not_duplicate_documents(memory_store, monkeypatch):
+    ingest_batch = ingestion.ingest_batch
+    calls = itertools.count(1)
+
+    def fail_second_batch(*args, **kwargs):
+        if next(calls) == 2:
+            raise RuntimeError("database went away")
+        return ingest_batch(*args, **kwargs)
+
+    monkeypatch.setattr(ingestion, "ingest_batch", fail_second_batch)
+    with pytest.raises(RuntimeError):
+        for _ in ingestion.ingest_stream((record(i) for i in range(6)), batch_size=2):
+            pass
+    monkeypatch.setattr(ingestion, "ingest_batch", ingest_batch)
+
+    for _ in ingestion.ingest_stream((record(i, prefix="retried") for i in range(6)), batch_size=2):
+        pass
+
+    assert keys(memory_store) == [f"test:{i}" for i in range(6)]
+    assert all(row["content"].startswith("retried") for row in memory_store.rows())
+
+
+def test_tombstones_delete_and_the_last_record_for_a_key_wins(memory_store):
+    for _ in ingestion.ingest_stream((record(i) for i in range(3)), batch_size=10):
+        pass
+
+    stream = [
+        DocumentRecord.tombstone("test:0"),
+        record(1, prefix="deleted"), DocumentRecord.tombstone("test:1"),
+        DocumentRecord.tombstone("test:2"), record(2, prefix="restored"),
+        DocumentRecord.tombstone("test:missing"),
+    ]
+    for _ in ingestion.ingest_stream(stream, batch_size=10):
+        pass
+
+    assert [(row["source_key"], row["content"]) for row in memory_store.rows()] == [("test:2", "restored 2")]
+
+
+def test_local_store_follows_updates_and_deletes(memory_store, monkeypatch, tmp_path):
+    import constants
+    import embedding_store
+    monkeypatch.setattr(constants, "LOCAL_EMBEDDING_STORE_PATH", str(tmp_path))
+    monkeypatch.setattr(embedding_store, "_stores", {})
+    for _ in ingestion.ingest_stream((record(i) for i in range(3)), batch_size=10):
+        pass
+
+    stream = [record(1, prefix="edited"), DocumentRecord.tombstone("test:2")]
+    for _ in ingestion.ingest_stream(stream, batch_size=10):
+        pass
+
+    local_store = embedding_store.get_embedding_store(ingestion.ingest_version)
+    ids = {row["source_key"]: row["id"] for row in memory_store.rows()}
+    live_ids = [meta["id"].tolist() for meta, _ in local_store.iter_batches()]
+    assert sorted(sum(live_ids, [])) == sorted(ids.values())
+    assert len(local_store) == 4
+    np.testing.assert_array_equal(
+        local_store.lookup([ids["test:1"]])[0], ingestion.encode_documents(["edited 1"])[0]
+    )
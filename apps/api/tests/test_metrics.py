@@ -0,0 +1,75 @@
+import pytest
+from fastapi.testclient import TestClient
+from prometheus_client import REGISTRY
+from slack_sdk.errors import SlackApiError
+import constants
+import ingestion as ingestion_module
+from benchmarks.fake_slack import FakeSlackServer, SlackWorkspace
+from helpers import create_slack_client
+from ingestion import ingestion
+from main import app, UNMATCHED_ROUTE_LABEL
+
+
+def sample(name, **labels):
+    return REGISTRY.get_sample_value(name, labels) or 0.0
+
+
+def test_unmatched_routes_share_one_path_label():
+    client = TestClient(app)
+    before = sample("cerium_request_seconds_count", method="GET", path=UNMATCHED_ROUTE_LABEL, status="404")
+
+    for path in ("/nope", "/wp-admin/setup.php", "/nope/123"):
+        assert client.get(path).status_code == 404
+
+    after = sample("cerium_request_seconds_count", method="GET", path=UNMATCHED_ROUTE_LABEL, status="404")
+    assert after - before == 3
+    assert sample("cerium_request_seconds_count", method="GET", path="/nope", status="404") == 0
+
+
+def test_matched_routes_use_the_route_template():
+    client = TestClient(app)
+    before = sample("cerium_request_seconds_count", method="GET", path="/embeddings/reembed/{version}", status="404")
+
+    client.get("/embeddings/reembed/no-such-version")
+
+    after = sample("cerium_request_seconds_count", method="GET", path="/embeddings/reembed/{version}", status="404")
+    assert after - before == 1
+
+
+def test_unsampled_embedding_calls_skip_tokenization(monkeypatch):
+    def fail(*args, **kwargs):
+        raise AssertionError("count_tokens must not run for unsampled calls")
+
+    monkeypatch.setattr(constants, "EMBEDDING_TOKEN_SAMPLE_RATE", 0.0)
+    monkeypatch.setattr(ingestion_module, "count_tokens", fail)
+    before = sample("cerium_embedded_tokens_total", kind="document")
+
+    embeddings = ingestion.encode_documents(["deploy the canary", "rollback staging"])
+
+    assert embeddings.shape[0] == 2
+    assert sample("cerium_embedded_tokens_total", kind="document") == before
+
+
+def test_sampled_token_counts_are_scaled_by_the_sample_rate(monkeypatch):
+    monkeypatch.setattr(constants, "EMBEDDING_TOKEN_SAMPLE_RATE", 0.25)
+    monkeypatch.setattr(ingestion_module, "should_count_tokens", lambda: True)
+    before = sample("cerium_embedded_tokens_total", kind="document")
+
+    # Three tokens each with the hashing embedder's \w+ tokenizer
+    ingestion.encode_documents(["deploy the canary", "rollback staging now"])
+
+    assert sample("cerium_embedded_tokens_total", kind="document") - before == pytest.approx(6 / 0.25)
+
+
+def test_every_slack_429_is_counted_once(monkeypatch):
+    with FakeSlackServer(SlackWorkspace(channels=1, messages_per_channel=1, users=1), rate_limit_every=1) as server:
+        monkeypatch.setattr(constants, "SLACK_API_BASE_URL", server.base_url)
+        client = create_slack_client("xoxb-test")
+        before = sample("cerium_slack_rate_limited_total")
+        with pytest.raises(SlackApiError):
+            client.users_list()
+        after = sample("cerium_slack_rate_limited_total")
+
+    # Two retries plus the final rate limited response that is not retried
+    assert server.rate_limited_count == 3
+    assert after - before == 3
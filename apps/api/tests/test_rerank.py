@@ -0,0 +1,136 @@
+import json
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+import main
+import rerank
+from main import app
+from models import MAX_FETCH_K
+from rerank import candidate_embeddings, diversify, mmr_select
+
+
+def unit(*values):
+    vector = np.asarray(values, dtype=np.float32)
+    return vector / np.linalg.norm(vector)
+
+
+def candidate(id, embedding, similarity, **extra):
+    return {"id": id, "content": f"doc {id}", "similarity": similarity, "embedding": embedding, **extra}
+
+
+@pytest.fixture
+def no_encoding(monkeypatch):
+    def fail(version):
+        raise AssertionError("candidates should not be re-encoded")
+    monkeypatch.setattr(rerank, "get_model", fail)
+    monkeypatch.setattr(rerank, "get_embedding_store", lambda version: None)
+
+
+def test_mmr_prefers_a_diverse_candidate_over_a_redundant_one():
+    embeddings = np.stack([unit(1, 0), unit(0.95, 0.31), unit(0, 1)])
+    relevance = np.asarray([0.9, 0.88, 0.7], dtype=np.float32)
+
+    selected, duplicate_counts = mmr_select(relevance, embeddings, k=2, mmr_lambda=0.5, dedup_threshold=0.99)
+
+    assert selected == [0, 2]
+    assert duplicate_counts == [0, 0]
+
+
+def test_mmr_collapses_near_duplicates_into_the_selected_document():
+    embeddings = np.stack([unit(1, 0), unit(1, 0.01), unit(0, 1)])
+    relevance = np.asarray([0.9, 0.89, 0.5], dtype=np.float32)
+
+    selected, duplicate_counts = mmr_select(relevance, embeddings, k=3, mmr_lambda=0.7, dedup_threshold=0.95)
+
+    assert selected == [0, 2]
+    assert duplicate_counts == [1, 0]
+
+
+def test_rpc_embeddings_are_used_without_encoding(no_encoding):
+    rows = [
+        candidate(1, json.dumps([3.0, 4.0]), 0.9),
+        candidate(2, [0.0, 2.0], 0.8),
+        candidate(3, np.asarray([1.0, 0.0]), 0.7),
+    ]
+
+    embeddings = candidate_embeddings(rows, "default")
+
+    np.testing.assert_allclose(embeddings, [[0.6, 0.8], [0.0, 1.0], [1.0, 0.0]], atol=1e-6)
+
+
+def test_missing_embeddings_fall_back_to_the_local_store_then_the_model(monkeypatch):
+    class LocalStore:
+        def __len__(self):
+            return 1
+
+        def lookup(self, ids):
+            return np.asarray([[0.0, 1.0] if id == 2 else [np.nan, np.nan] for id in ids], dtype=np.float32)
+
+    encoded = []
+
+    class Model:
+        def encode_document(self, contents):
+            encoded.extend(contents)
+            return np.asarray([[1.0, 1.0]] * len(contents))
+
+    monkeypatch.setattr(rerank, "get_embedding_store", lambda version: LocalStore())
+    monkeypatch.setattr(rerank, "get_model", lambda version: Model())
+    rows = [candidate(1, "[1, 0]", 0.9), candidate(2, None, 0.8), candidate(3, None, 0.7)]
+
+    embeddings = candidate_embeddings(rows, "default")
+
+    assert encoded == ["doc 3"]
+    np.testing.assert_allclose(embeddings[:2], [[1.0, 0.0], [0.0, 1.0]], atol=1e-6)
+    np.testing.assert_allclose(embeddings[2], unit(1, 1), atol=1e-6)
+
+
+def test_diversify_drops_embeddings_from_the_returned_rows(no_encoding):
+    rows = [candidate(1, [1.0, 0.0], 0.9), candidate(2, [1.0, 0.001], 0.85), candidate(3, [0.0, 1.0], 0.6)]
+
+    result = diversify(rows, "default", match_count=5, mmr_lambda=0.7, dedup_threshold=0.95)
+
+    assert [row["id"] for row in result] == [1, 3]
+    assert [row["duplicate_count"] for row in result] == [1, 0]
+    assert all("embedding" not in row for row in result)
+
+
+class RecordingStore:
+    def __init__(self, rows):
+        self.rows = rows
+        self.calls = []
+
+    def rpc(self, fn, params):
+        self.calls.append((fn, params))
+        return self.rows
+
+
+@pytest.mark.parametrize("body, fetched", [
+    ({"match_count": 5}, 20),
+    ({"match_count": 100}, MAX_FETCH_K),
+    ({"match_count": 5, "fetch_k": 50}, 50),
+])
+def test_diversified_retrieve_caps_the_fetch_and_requests_stored_embeddings(monkeypatch, no_encoding, body, fetched):
+    store = RecordingStore([candidate(1, "[1, 0]", 0.9, user_name=None, slack_ts=None, created_at="2024-01-01T00:00:00+00:00")])
+    monkeypatch.setattr(main, "document_store", store)
+
+    response = TestClient(app).post("/retrieve", json={"prompt": "hello", "diversify": True, **body})
+
+    assert response.status_code == 200, response.text
+    (fn, params), = store.calls
+    assert fn == "match_documents"
+    assert params["match_count"] == fetched
+    assert params["include_embedding"] is True
+    assert "embedding" not in response.json()["matches"][0]
+
+
+@pytest.mark.parametrize("body, status", [
+    ({"diversify": True, "match_count": None}, 400),
+    ({"match_count": 0}, 422),
+    ({"diversify": True, "fetch_k": MAX_FETCH_K + 1}, 422),
+])
+def test_retrieve_rejects_invalid_counts(monkeypatch, body, status):
+    monkeypatch.setattr(main, "document_store", RecordingStore([]))
+
+    response = TestClient(app).post("/retrieve", json={"prompt": "hello", **body})
+
+    assert response.status_code == status, response.text
@@ -0,0 +1,120 @@
+import itertools
+import pytest
+import constants
+import helpers
+import slack_sync
+from benchmarks.fake_slack import FakeSlackServer, SlackWorkspace
+from helpers import get_slack_workspace, messages_to_records
+from ingestion import ingestion
+from models import SlackSyncRequest
+from slack_sync import sync_workspace
+
+_tokens = itertools.count()
+
+
+@pytest.fixture
+def slack(monkeypatch):
+    workspace = SlackWorkspace(channels=3, messages_per_channel=50, users=5)
+    with FakeSlackServer(workspace) as server:
+        monkeypatch.setattr(constants, "SLACK_API_BASE_URL", server.base_url)
+        monkeypatch.setattr(constants, "SLACK_REQUESTS_PER_MINUTE", 60000.0)
+        monkeypatch.setattr(constants, "SLACK_REQUEST_BURST", 1000)
+        yield workspace
+
+
+def token():
+    # A fresh token per call, so each test gets its own cached workspace
+    return f"xoxb-test-{next(_tokens)}"
+
+
+def test_retrying_a_channel_that_failed_part_way_does_not_duplicate_messages(slack, memory_store, monkeypatch):
+    monkeypatch.setattr(constants, "INGEST_BATCH_SIZE", 10)
+    channel_id = slack.channels[0]["id"]
+    request = SlackSyncRequest(slack_bot_token=token(), channel_ids=[channel_id], page_size=15)
+
+    ingest_batch = ingestion.ingest_batch
+    calls = itertools.count(1)
+
+    def fail_third_batch(*args, **kwargs):
+        if next(calls) == 3:
+            raise RuntimeError("database went away")
+        return ingest_batch(*args, **kwargs)
+
+    monkeypatch.setattr(ingestion, "ingest_batch", fail_third_batch)
+    [failed] = sync_workspace(request).channels
+    assert failed.error == "database went away"
+    assert failed.latest_ts is None
+    assert len(memory_store.rows()) == 20
+
+    monkeypatch.setattr(ingestion, "ingest_batch", ingest_batch)
+    [retried] = sync_workspace(request).channels
+
+    assert retried.error is None
+    documents = memory_store.rows()
+    expected = [m for m in slack.history[channel_id] if not m.get("bot_id")]
+    assert len(documents) == len(expected) == 49
+    assert sorted(d["source_key"] for d in documents) == sorted(f"slack:{channel_id}:{m['ts']}" for m in expected)
+
+
+def test_whitespace_only_messages_are_skipped():
+    messages = [
+        {"type": "message", "user": "U1", "text": "  \n\t ", "ts": "1.000001"},
+        {"type": "message", "user": "U1", "text": "deploy done", "ts": "2.000001"},
+        {"type": "message", "user": "U1", "ts": "3.000001"},
+        {"type": "message", "bot_id": "B1", "text": "build passed", "ts": "4.000001"},
+    ]
+
+    records = list(messages_to_records(messages, channel_id="C1"))
+
+    assert [(record.content, record.key) for record in records] == [("deploy done", "slack:C1:2.000001")]
+
+
+def test_a_channel_of_whitespace_messages_syncs_without_error(slack, memory_store):
+    channel_id = slack.channels[1]["id"]
+    for message in slack.history[channel_id]:
+        message["text"] = "   "
+
+    [result] = sync_workspace(SlackSyncRequest(slack_bot_token=token(), channel_ids=[channel_id])).channels
+
+    assert result.error is None
+    assert result.ingested_count == 0
+    assert result.latest_ts is not None
+
+
+def test_channels_are_synced_stalest_first(slack, monkeypatch):
+    synced = []
+    monkeypatch.setattr(
+        slack_sync, "sync_channel",
+        lambda workspace, channel, since, page_size, user_id: synced.append(channel["id"]) or slack_sync.SlackChannelSyncResult(
+            channel_id=channel["id"], name="", pages=0, message_count=0, ingested_count=0, seconds=0, messages_per_second=0
+        )
+    )
+    first, second, third = (channel["id"] for channel in slack.channels)
+
+    sync_workspace(SlackSyncRequest(
+        slack_bot_token=token(), since={first: 1700000500.0, second: 1700000100.0}, max_workers=1
+    ))
+
+    assert synced == [third, second, first]
+
+
+def test_workspace_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(constants, "SLACK_WORKSPACE_CACHE_SIZE", 2)
+    tokens = [token() for _ in range(3)]
+
+    first = get_slack_workspace(tokens[0])
+    assert get_slack_workspace(tokens[0]) is first
+    get_slack_workspace(tokens[1])
+    get_slack_workspace(tokens[2])
+
+    assert len(helpers._workspaces) == 2
+    assert get_slack_workspace(tokens[0]) is not first
+
+
+def test_idle_workspaces_expire(monkeypatch):
+    monkeypatch.setattr(constants, "SLACK_WORKSPACE_CACHE_TTL_SECONDS", 0.0)
+    shared = token()
+
+    first = get_slack_workspace(shared)
+
+    assert get_slack_workspace(shared) is not first